@@ -0,0 +1,231 @@
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import time
+from collections import deque
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes, highest first: interactive single predictions are always
+# served before queued bulk batch calls
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+
+class Rejected(Exception):
+    """A request was shed; `status_code` is 429 (queue full) or 503 (SLO/deadline)."""
+
+    def __init__(self, status_code, reason, retry_after=1.0):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def headers(self):
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after)))}
+
+
+def parse_deadline(headers, now=None):
+    """Client deadline (time.time() seconds) from X-Request-Timeout (ms) or X-Request-Deadline (epoch s)."""
+    now = time.time() if now is None else now
+    try:
+        if headers.get("X-Request-Timeout"):
+            return now + float(headers["X-Request-Timeout"]) / 1000
+        if headers.get("X-Request-Deadline"):
+            return float(headers["X-Request-Deadline"])
+    except ValueError:
+        raise ValueError("X-Request-Timeout must be milliseconds and X-Request-Deadline epoch seconds")
+    return None
+
+
+class _Waiter:
+    def __init__(self, future, deadline):
+        self.future = future
+        self.deadline = deadline
+
+
+class AdmissionController:
+    """Bound in-flight inference work and shed what would miss its latency budget.
+
+    At most `max_concurrency` inferences run at once (`batch_slots` of them
+    for the batch lane); the rest wait in per-lane FIFO queues of at most
+    `max_queue` entries, and a freed slot always goes to the interactive
+    lane first. On arrival the expected latency (work queued ahead divided
+    across the slots, plus the lane's own service time, both from moving
+    averages) is compared with the budget: the SLO (`slo_ms`, if set)
+    capped by any client deadline. Requests that would miss it are
+    rejected at once with 503, a full queue gives 429, and a request whose
+    budget runs out while queued is dropped with 503 instead of being run
+    late. Used from the event loop only.
+    """
+
+    def __init__(self, max_concurrency=4, slo_ms=None, max_queue=1000, batch_slots=None, alpha=0.2,
+                 clock=time.time):
+        self.max_concurrency = max_concurrency
+        self.batch_slots = batch_slots or max(1, max_concurrency // 2)
+        self.slo = slo_ms / 1000 if slo_ms else None
+        self.max_queue = max_queue
+        self.alpha = alpha
+        self._clock = clock
+        self._queues = {lane: deque() for lane in LANES}
+        self._in_flight = {lane: 0 for lane in LANES}
+        self._service = {lane: None for lane in LANES}  # Moving average of seconds per request
+        self._counters = {lane: {"admitted": 0, "rejected_queue_full": 0, "rejected_slo": 0,
+                                 "expired_in_queue": 0} for lane in LANES}
+
+    @classmethod
+    def from_env(cls):
+        slo_ms = os.environ.get("LATENCY_SLO_MS")
+        return cls(max_concurrency=int(os.environ.get("ADMISSION_MAX_CONCURRENCY", max(2, os.cpu_count() or 1))),
+                   slo_ms=float(slo_ms) if slo_ms else None,
+                   max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", 1000)))
+
+    def _has_slot(self, lane):
+        if sum(self._in_flight.values()) >= self.max_concurrency:
+            return False
+        return lane != BATCH or self._in_flight[BATCH] < self.batch_slots
+
+    def _mean_service(self):
+        samples = [s for s in self._service.values() if s is not None]
+        return sum(samples) / len(samples) if samples else 0.0
+
+    def _queued_ahead(self, lane):
+        return sum(len(self._queues[other]) for other in LANES[:LANES.index(lane) + 1])
+
+    def expected_wait(self, lane):
+        """Estimated queueing delay for a request arriving now in `lane`."""
+        ahead = self._queued_ahead(lane)
+        if ahead == 0 and self._has_slot(lane):
+            return 0.0
+        slots = self.batch_slots if lane == BATCH else self.max_concurrency
+        return (ahead + 1) * self._mean_service() / slots
+
+    def _budget(self, now, deadline):
+        budget = self.slo
+        if deadline is not None:
+            budget = deadline - now if budget is None else min(budget, deadline - now)
+        return budget
+
+    @contextlib.asynccontextmanager
+    async def admit(self, lane=INTERACTIVE, deadline=None, shed=True):
+        """Hold an inference slot for the body of the `async with`, or raise Rejected.
+
+        With `shed=False` the request only waits its turn and is never
+        rejected; for later chunks of a response that has already started.
+        """
+        await self._acquire(lane, deadline, shed)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(lane, time.perf_counter() - started)
+
+    async def run(self, lane, deadline, func, *args, shed=True):
+        """Run `func(*args)` on the threadpool in an admitted slot, or raise Rejected.
+
+        The slot is held until the thread finishes, even if the caller is
+        cancelled meanwhile (a client disconnect cannot stop the thread), so
+        in-flight work is never undercounted.
+        """
+        await self._acquire(lane, deadline, shed)
+        started = time.perf_counter()
+        task = asyncio.ensure_future(run_in_threadpool(func, *args))
+
+        def finished(task):
+            self._release(lane, time.perf_counter() - started)
+            if not task.cancelled():
+                task.exception()  # Retrieved here in case the caller went away
+        task.add_done_callback(finished)
+        return await asyncio.shield(task)
+
+    async def _acquire(self, lane, deadline, shed=True):
+        counters = self._counters[lane]
+        now = self._clock()
+        budget = self._budget(now, deadline) if shed else None
+        if budget is not None and budget <= 0:
+            counters["rejected_slo"] += 1
+            raise Rejected(503, "Request deadline already passed", retry_after=0)
+
+        if self._queued_ahead(lane) == 0 and self._has_slot(lane):
+            self._in_flight[lane] += 1
+            counters["admitted"] += 1
+            return
+        wait = self.expected_wait(lane)
+        if shed and len(self._queues[lane]) >= self.max_queue:
+            counters["rejected_queue_full"] += 1
+            raise Rejected(429, f"{lane} queue is full", retry_after=wait)
+        service = self._service[lane] or 0.0
+        if budget is not None and wait + service > budget:
+            counters["rejected_slo"] += 1
+            raise Rejected(503, f"Expected latency {1000 * (wait + service):.0f}ms exceeds the "
+                                f"{1000 * budget:.0f}ms budget", retry_after=wait)
+
+        waiter = _Waiter(asyncio.get_running_loop().create_future(),
+                         None if budget is None else now + budget - service)
+        self._queues[lane].append(waiter)
+        try:
+            if waiter.deadline is None:
+                await waiter.future
+            else:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout=waiter.deadline - now)
+        except asyncio.TimeoutError:
+            self._abandon(lane, waiter)
+            counters["expired_in_queue"] += 1
+            raise Rejected(503, "Latency budget ran out while queued", retry_after=self.expected_wait(lane))
+        except asyncio.CancelledError:
+            self._abandon(lane, waiter)
+            raise
+        counters["admitted"] += 1
+
+    def _abandon(self, lane, waiter):
+        """Leave the queue; a slot handed over in the meantime is passed on."""
+        if waiter.future.done() and not waiter.future.cancelled():
+            self._release(lane, None)
+        else:
+            waiter.future.cancel()
+            with contextlib.suppress(ValueError):
+                self._queues[lane].remove(waiter)
+
+    def _release(self, lane, elapsed):
+        self._in_flight[lane] -= 1
+        if elapsed is not None:
+            previous = self._service[lane]
+            self._service[lane] = elapsed if previous is None else (
+                (1 - self.alpha) * previous + self.alpha * elapsed)
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to queued requests, interactive lane first."""
+        now = self._clock()
+        for lane in LANES:
+            queue = self._queues[lane]
+            while queue and self._has_slot(lane):
+                waiter = queue.popleft()
+                if waiter.future.done():
+                    continue
+                if waiter.deadline is not None and waiter.deadline <= now:
+                    continue  # Its own wait_for times out and reports the drop
+                self._in_flight[lane] += 1
+                waiter.future.set_result(True)
+
+    def stats(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "batch_slots": self.batch_slots,
+            "slo_ms": None if self.slo is None else self.slo * 1000,
+            "max_queue": self.max_queue,
+            "lanes": {
+                lane: {
+                    "in_flight": self._in_flight[lane],
+                    "queued": len(self._queues[lane]),
+                    "service_ms": None if self._service[lane] is None else self._service[lane] * 1000,
+                    "expected_wait_ms": self.expected_wait(lane) * 1000,
+                    **self._counters[lane],
+                }
+                for lane in LANES
+            },
+        }
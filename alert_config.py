@@ -2,13 +2,218 @@ import requests
 import logging
 import json
 import os
+import heapq
+import itertools
+import queue
+import threading
+import time
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from alert_store import AlertStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DISPATCH_CONFIG = {
+    "queue_size": 1000,
+    "dedup_window_seconds": 300,
+    "rate_limit_per_minute": {"slack": 6, "email": 2},
+    "burst": 3,
+    "max_retries": 3,
+    "backoff_seconds": 2.0,
+    "timeout_seconds": 5.0
+}
+
+# A breach this far past its threshold (relative) is critical rather than a warning
+CRITICAL_MARGIN = 0.10
+
+
+class WebhookSender:
+    """POST alerts as {"text": ...} over a pooled keep-alive session with a timeout."""
+
+    def __init__(self, url, timeout=5.0, pool_size=4):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __call__(self, text):
+        response = self.session.post(self.url, json={"text": text}, timeout=self.timeout)
+        response.raise_for_status()
+
+
+class _TokenBucket:
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def take(self, now):
+        """Consume a token, or return the seconds until one is available."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class AlertDispatcher:
+    """Deliver alerts from a background thread so metric checks never wait on a channel.
+
+    `submit` only enqueues (dropping the alert if the bounded queue is full).
+    The worker suppresses repeats of the same (channel, key) inside
+    `dedup_window` and sends one coalesced alert with the repeat count when
+    the window closes, enforces a token-bucket rate limit per channel, and
+    retries failed sends with exponential backoff. Deferred and retried
+    deliveries wait in a time-ordered heap, so one slow channel never holds
+    up alerts that are ready to go elsewhere beyond a single send timeout.
+    """
+
+    def __init__(self, senders, queue_size=1000, dedup_window=300, rate_limit_per_minute=None,
+                 burst=3, max_retries=3, backoff=2.0, max_backoff=60.0, autostart=True):
+        self.senders = dict(senders)
+        self.dedup_window = dedup_window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._buckets = {channel: _TokenBucket(rate, burst)
+                         for channel, rate in (rate_limit_per_minute or {}).items()
+                         if channel in self.senders and rate}
+        self._recent = {}
+        self._due = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._stop = threading.Event()
+        self._thread = None
+        self.counts = {"submitted": 0, "sent": 0, "dropped": 0, "coalesced": 0,
+                       "retried": 0, "failed": 0}
+        if autostart:
+            self.start()
+
+    def submit(self, channel, key, text):
+        """Queue an alert without blocking; returns False if it had to be dropped."""
+        if channel not in self.senders:
+            raise ValueError(f"Unknown alert channel: {channel}")
+        try:
+            self._queue.put_nowait((channel, key, text))
+        except queue.Full:
+            logger.warning(f"Alert queue full, dropping {channel} alert: {key}")
+            self._count("dropped")
+            return False
+        self._idle.clear()
+        self._count("submitted")
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        try:
+            self._queue.put_nowait(None)  # Wake the worker
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def wait_idle(self, timeout=None):
+        """Block until every queued, deferred and retried alert has been handled."""
+        return self._idle.wait(timeout)
+
+    def stats(self):
+        with self._lock:
+            return {**self.counts, "queued": self._queue.qsize(), "pending": len(self._due)}
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def _schedule(self, due, channel, text, attempt=0):
+        heapq.heappush(self._due, (due, next(self._seq), channel, text, attempt))
+
+    def _accept(self, channel, key, text, now):
+        recent = self._recent.get((channel, key))
+        if recent and now - recent["sent_at"] < self.dedup_window:
+            recent["suppressed"] += 1
+            recent["text"] = text
+            self._count("coalesced")
+            return
+        self._recent[(channel, key)] = {"sent_at": now, "suppressed": 0, "text": text}
+        self._schedule(now, channel, text)
+
+    def _flush_windows(self, now):
+        for (channel, key), recent in list(self._recent.items()):
+            if now - recent["sent_at"] < self.dedup_window:
+                continue
+            if recent["suppressed"]:
+                text = (f"{recent['text']}\n(repeated {recent['suppressed']} times "
+                        f"in the last {self.dedup_window:.0f}s)")
+                self._recent[(channel, key)] = {"sent_at": now, "suppressed": 0, "text": text}
+                self._schedule(now, channel, text)
+            else:
+                del self._recent[(channel, key)]
+
+    def _deliver(self, channel, text, attempt, now):
+        bucket = self._buckets.get(channel)
+        wait = bucket.take(now) if bucket else 0.0
+        if wait:
+            self._schedule(now + wait, channel, text, attempt)
+            return
+        try:
+            self.senders[channel](text)
+            self._count("sent")
+        except Exception as e:
+            if attempt < self.max_retries:
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt)
+                logger.warning(f"Sending {channel} alert failed ({str(e)}), retrying in {delay:.1f}s")
+                self._count("retried")
+                self._schedule(now + delay, channel, text, attempt + 1)
+            else:
+                logger.error(f"Failed to send {channel} alert after {attempt + 1} attempts: {str(e)}")
+                self._count("failed")
+
+    def _next_wakeup(self, now):
+        deadlines = [self._due[0][0]] if self._due else []
+        deadlines += [r["sent_at"] + self.dedup_window for r in self._recent.values() if r["suppressed"]]
+        return min([max(0.0, d - now) for d in deadlines] + [1.0])
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                item = self._queue.get(timeout=self._next_wakeup(time.monotonic()))
+                if item is not None:
+                    self._accept(*item, time.monotonic())
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            self._flush_windows(now)
+            while self._due and self._due[0][0] <= now:
+                _, _, channel, text, attempt = heapq.heappop(self._due)
+                self._deliver(channel, text, attempt, now)
+            if self._queue.empty() and not self._due and not any(r["suppressed"] for r in self._recent.values()):
+                self._idle.set()
+
 
 class AlertManager:
-    def __init__(self, config_file="alert_config.json"):
+    def __init__(self, config_file="alert_config.json", log_dir="monitoring_logs", dispatcher=None):
         self.logger = logging.getLogger(__name__)
         self.config = self._load_config(config_file)
-        
+        self.log_dir = log_dir
+        os.makedirs(log_dir, exist_ok=True)
+        self.store = AlertStore(log_dir)
+        self.dispatcher = dispatcher or self._build_dispatcher()
+
     def _load_config(self, config_file):
         if not os.path.exists(config_file):
             # Create default config if doesn't exist
@@ -28,79 +233,94 @@ class AlertManager:
                         "enabled": False,
                         "webhook_url": ""
                     }
-                }
+                },
+                "dispatch": DEFAULT_DISPATCH_CONFIG
             }
             with open(config_file, 'w') as f:
                 json.dump(default_config, f, indent=2)
             return default_config
-        
+
         with open(config_file, 'r') as f:
             return json.load(f)
-    
+
+    def _build_dispatcher(self):
+        """Create the background dispatcher for the enabled notification channels."""
+        dispatch = {**DEFAULT_DISPATCH_CONFIG, **self.config.get("dispatch", {})}
+        notifications = self.config["notifications"]
+        senders = {}
+        if notifications["email"]["enabled"]:
+            senders["email"] = self._send_email_alert
+        if notifications["slack"]["enabled"]:
+            if notifications["slack"]["webhook_url"]:
+                senders["slack"] = WebhookSender(notifications["slack"]["webhook_url"],
+                                                 timeout=dispatch["timeout_seconds"])
+            else:
+                self.logger.warning("Slack alerts enabled but no webhook URL configured")
+        return AlertDispatcher(
+            senders,
+            queue_size=dispatch["queue_size"],
+            dedup_window=dispatch["dedup_window_seconds"],
+            rate_limit_per_minute=dispatch["rate_limit_per_minute"],
+            burst=dispatch["burst"],
+            max_retries=dispatch["max_retries"],
+            backoff=dispatch["backoff_seconds"],
+            autostart=bool(senders)
+        )
+
     def check_and_alert(self, metrics):
         """Check metrics against thresholds and send alerts if needed"""
         if not self.config["enabled"]:
             return False
-            
+
+        thresholds = self.config["thresholds"]
         alerts = []
-        
+
         # Check accuracy
-        if metrics["accuracy"] < self.config["thresholds"]["accuracy"]:
-            alerts.append(f"Model accuracy ({metrics['accuracy']:.4f}) is below threshold ({self.config['thresholds']['accuracy']:.4f})")
-            
+        if metrics["accuracy"] < thresholds["accuracy"]:
+            alerts.append(self._alert("accuracy", metrics["accuracy"], thresholds["accuracy"],
+                                      f"Model accuracy ({metrics['accuracy']:.4f}) is below threshold ({thresholds['accuracy']:.4f})"))
+
         # Check F1 score
-        if metrics["f1_score"] < self.config["thresholds"]["f1_score"]:
-            alerts.append(f"Model F1 score ({metrics['f1_score']:.4f}) is below threshold ({self.config['thresholds']['f1_score']:.4f})")
-            
+        if metrics["f1_score"] < thresholds["f1_score"]:
+            alerts.append(self._alert("f1_score", metrics["f1_score"], thresholds["f1_score"],
+                                      f"Model F1 score ({metrics['f1_score']:.4f}) is below threshold ({thresholds['f1_score']:.4f})"))
+
         # Check data drift if available
-        if metrics.get("data_drift_score") and metrics["data_drift_score"] > self.config["thresholds"]["data_drift"]:
-            alerts.append(f"Data drift score ({metrics['data_drift_score']:.4f}) exceeds threshold ({self.config['thresholds']['data_drift']:.4f})")
-            
+        if metrics.get("data_drift_score") and metrics["data_drift_score"] > thresholds["data_drift"]:
+            alerts.append(self._alert("data_drift", metrics["data_drift_score"], thresholds["data_drift"],
+                                      f"Data drift score ({metrics['data_drift_score']:.4f}) exceeds threshold ({thresholds['data_drift']:.4f})"))
+
         if alerts:
             self._send_alerts(alerts)
             return True
-            
+
         return False
-    
-    def _send_alerts(self, alert_messages):
-        """Send alerts through configured channels"""
+
+    @staticmethod
+    def _alert(metric, value, threshold, message):
+        gap = abs(value - threshold) / abs(threshold) if threshold else float("inf")
+        return {"metric": metric, "value": float(value), "threshold": float(threshold),
+                "severity": "critical" if gap >= CRITICAL_MARGIN else "warning", "message": message}
+
+    def _send_alerts(self, alerts):
+        """Record alerts and hand them to the dispatcher (never blocks on delivery)"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        alert_text = f"⚠️ ML Model Alert ({timestamp}):\n" + "\n".join(alert_messages)
-        
+        alert_text = f"⚠️ ML Model Alert ({timestamp}):\n" + "\n".join(a["message"] for a in alerts)
+
         # Log the alert
         self.logger.warning(alert_text)
-        
-        # Save to alerts log
-        with open("monitoring_logs/alerts.log", "a") as f:
-            f.write(f"{timestamp} - {alert_text}\n")
-            
-        # Send email if configured
-        if self.config["notifications"]["email"]["enabled"]:
-            self._send_email_alert(alert_text)
-            
-        # Send Slack if configured
-        if self.config["notifications"]["slack"]["enabled"]:
-            self._send_slack_alert(alert_text)
-    
+
+        # Save to the alert history
+        for alert in alerts:
+            self.store.append(alert["severity"], alert["metric"], alert["value"],
+                              alert["threshold"], alert["message"])
+
+        # Repeats of the same breached metrics are coalesced by the dispatcher
+        key = ",".join(a["metric"] for a in alerts)
+        for channel in self.dispatcher.senders:
+            self.dispatcher.submit(channel, key, alert_text)
+
     def _send_email_alert(self, alert_text):
         """Send alert via email - implementation would depend on your email provider"""
         # This is a placeholder - you would implement according to your environment
         self.logger.info(f"Would send email alert: {alert_text}")
-        
-    def _send_slack_alert(self, alert_text):
-        """Send alert to Slack"""
-        webhook_url = self.config["notifications"]["slack"]["webhook_url"]
-        if not webhook_url:
-            self.logger.warning("Slack alerts enabled but no webhook URL configured")
-            return
-            
-        try:
-            payload = {"text": alert_text}
-            response = requests.post(
-                webhook_url,
-                data=json.dumps(payload),
-                headers={"Content-Type": "application/json"}
-            )
-            response.raise_for_status()
-        except Exception as e:
-            self.logger.error(f"Failed to send Slack alert: {str(e)}")
@@ -0,0 +1,149 @@
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SEVERITIES = ("info", "warning", "critical")
+
+# One fixed-width index entry per alert, appended after the record itself is
+# written, so readers only ever see fully written records
+INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<u8"), ("length", "<u4"), ("severity", "u1")])
+
+_SEGMENT_RE = re.compile(r"alerts-(\d{6})\.jsonl$")
+
+
+def parse_since(value):
+    """Accept an epoch timestamp or an ISO 8601 datetime; return epoch seconds."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+class AlertStore:
+    """Append-only alert history in rotated JSONL segments with a binary offset index.
+
+    Each segment `alerts-NNNNNN.jsonl` has an `.idx` file of INDEX_DTYPE
+    entries. Queries binary-search the timestamps and filter severities on
+    the index, then seek straight to the matching records, so the cost
+    depends on the number of alerts returned rather than on the history
+    size. Segments roll over at `max_segment_bytes` and only the newest
+    `max_segments` are kept.
+    """
+
+    def __init__(self, log_dir="monitoring_logs", max_segment_bytes=1 << 20, max_segments=20):
+        self.alert_dir = os.path.join(log_dir, "alerts")
+        os.makedirs(self.alert_dir, exist_ok=True)
+        self.max_segment_bytes = max_segment_bytes
+        self.max_segments = max_segments
+        self._lock = threading.Lock()
+        self._index_cache = {}
+
+    def _segments(self):
+        """Sequence numbers of the segments on disk, oldest first."""
+        numbers = []
+        for path in glob.glob(os.path.join(self.alert_dir, "alerts-*.jsonl")):
+            match = _SEGMENT_RE.search(path)
+            if match:
+                numbers.append(int(match.group(1)))
+        return sorted(numbers)
+
+    def _paths(self, number):
+        base = os.path.join(self.alert_dir, f"alerts-{number:06d}")
+        return f"{base}.jsonl", f"{base}.idx"
+
+    def _rotate(self, segments):
+        number = segments[-1] + 1 if segments else 1
+        for old in segments[:max(0, len(segments) + 1 - self.max_segments)]:
+            for path in self._paths(old):
+                if os.path.exists(path):
+                    os.remove(path)
+            logger.info(f"Removed alert segment {old:06d} (retention {self.max_segments} segments)")
+        return number
+
+    def append(self, severity, metric, value, threshold, message, timestamp=None):
+        """Store one alert and return the stored record."""
+        if severity not in SEVERITIES:
+            raise ValueError(f"Unknown severity: {severity}")
+        timestamp = time.time() if timestamp is None else timestamp
+        record = {
+            "timestamp": datetime.fromtimestamp(timestamp).isoformat(),
+            "severity": severity,
+            "metric": metric,
+            "value": value,
+            "threshold": threshold,
+            "message": message,
+        }
+        line = (json.dumps(record) + "\n").encode()
+
+        with self._lock:
+            segments = self._segments()
+            number = segments[-1] if segments else None
+            if number is None or os.path.getsize(self._paths(number)[0]) >= self.max_segment_bytes:
+                number = self._rotate(segments)
+            data_path, index_path = self._paths(number)
+            with open(data_path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            entry = np.array([(timestamp, offset, len(line), SEVERITIES.index(severity))], dtype=INDEX_DTYPE)
+            with open(index_path, "ab") as f:
+                f.write(entry.tobytes())
+        return record
+
+    def _index(self, number):
+        index_path = self._paths(number)[1]
+        size = os.path.getsize(index_path)
+        size -= size % INDEX_DTYPE.itemsize  # Ignore a partially written entry
+        cached = self._index_cache.get(number)
+        if cached is None or cached[0] != size:
+            with open(index_path, "rb") as f:
+                index = np.frombuffer(f.read(size), dtype=INDEX_DTYPE)
+            self._index_cache[number] = (size, index)
+        return self._index_cache[number][1]
+
+    def query(self, since=None, limit=100, severity=None):
+        """The newest `limit` alerts after `since` at or above `severity`, oldest first."""
+        min_level = SEVERITIES.index(severity) if severity else 0
+        selected = []  # (segment, index entries), newest segment first
+        remaining = limit
+        segments = self._segments()
+        for number in self._index_cache.keys() - set(segments):
+            del self._index_cache[number]
+
+        for number in reversed(segments):
+            if remaining <= 0:
+                break
+            try:
+                index = self._index(number)
+            except FileNotFoundError:
+                continue  # Removed by retention while we were reading
+            if since is not None:
+                if len(index) == 0 or index["timestamp"][-1] <= since:
+                    break  # Older segments only hold older alerts
+                index = index[np.searchsorted(index["timestamp"], since, side="right"):]
+            if min_level:
+                index = index[index["severity"] >= min_level]
+            index = index[-remaining:]
+            if len(index):
+                selected.append((number, index))
+                remaining -= len(index)
+
+        alerts = []
+        for number, index in reversed(selected):
+            try:
+                with open(self._paths(number)[0], "rb") as f:
+                    for offset, length in zip(index["offset"], index["length"]):
+                        f.seek(int(offset))
+                        alerts.append(json.loads(f.read(int(length))))
+            except FileNotFoundError:
+                continue
+        return alerts
@@ -1,16 +1,32 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import pickle
 import pandas as pd
 import numpy as np
 from pydantic import BaseModel
 from typing import List, Dict, Union, Optional
 import os
-from model_pipeline import prepare_data
 import logging
-from sklearn.preprocessing import LabelEncoder
 import json
+import functools
+import hashlib
+import hmac
+import re
+import tempfile
+import time
+import aiofiles
 from model_monitoring import ModelMonitor
+from profiling import Profiler
+from serving import get_encoder, score_frame, EarlyExitForest, TRAIN_DATA_PATH, TARGET_COLUMN
+import bulk_scoring
+from batch_jobs import BatchJobQueue
+from alert_store import AlertStore, SEVERITIES, parse_since
+from live_updates import LiveFeed, FeedWatcher
+from run_history import TestRunStore
+from model_registry import ModelRegistry, ModelFleet
+import wire_formats
+from admission import AdmissionController, Rejected, parse_deadline, INTERACTIVE, BATCH
+from request_coalescing import SingleFlight, IdempotencyCache, IdempotencyConflict, canonical_hash
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,6 +46,46 @@ app.add_middleware(
 
 # Initialize monitoring
 monitor = ModelMonitor()
+bulk_jobs = bulk_scoring.BulkJobStore()
+batch_queue = BatchJobQueue()
+alert_store = AlertStore()
+test_runs = TestRunStore()
+
+# Dashboard push channel: in-memory snapshot plus deltas tailed from the monitoring files
+live_feed = LiveFeed()
+feed_watcher = FeedWatcher(live_feed, alert_store)
+
+# Request profiling: sampled via PROFILE_SAMPLE_RATE, or forced with an X-Profile header
+profiler = Profiler.from_env()
+PROFILED_PATHS = {"/api/predict"}
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    # Only the sampling decision is taken here: cProfile sees a single thread,
+    # and inference runs on the threadpool, so the endpoint profiles the work
+    # there (see _profiled) rather than the event loop's other requests
+    claim = None
+    if request.url.path in PROFILED_PATHS:
+        forced = request.headers.get("X-Profile", "").lower() in ("1", "true", "yes")
+        claim = profiler.should_sample(forced=forced)
+        request.state.profile_claim = claim
+    try:
+        return await call_next(request)
+    finally:
+        if claim is not None:
+            claim.release()  # Not profiled after all (e.g. shed or coalesced)
+
+def _profiled(request, func):
+    """`func`, profiled on the worker thread it runs on if the request was sampled."""
+    claim = getattr(request.state, "profile_claim", None)
+    if claim is None:
+        return func
+    name = request.url.path.strip("/").replace("/", "_")
+
+    def run(*args):
+        with profiler.profile(name, claim=claim):
+            return func(*args)
+    return run
 
 # Pydantic models for API requests/responses
 class FeatureInput(BaseModel):
@@ -39,6 +95,9 @@ class PredictionOutput(BaseModel):
     prediction: int
     churn_probability: float
     retention_probability: float
+    probability_is_approximate: bool = False
+    trees_evaluated: Optional[int] = None
+    model_version: Optional[str] = None
 
 class FeatureImportance(BaseModel):
     name: str
@@ -48,6 +107,19 @@ class HealthStatus(BaseModel):
     status: str
     model_loaded: bool
 
+class ExplainInput(BaseModel):
+    records: List[Dict[str, Union[float, int, str]]]
+    top_k: Optional[int] = None
+
+class RoutingConfig(BaseModel):
+    shadow_models: Optional[List[str]] = None
+    canary_model: Optional[str] = None
+    canary_percent: Optional[float] = None
+
+class BatchJobRequest(BaseModel):
+    input_path: str
+    format: Optional[str] = None
+
 class TestResult(BaseModel):
     name: str
     status: str
@@ -59,17 +131,119 @@ class TestResults(BaseModel):
     passed: int
     failed: int
     results: List[TestResult]
+    timestamp: Optional[str] = None
+    run_key: Optional[str] = None
+
+# Model file to serve; point at model_compact.pkl to serve the compacted forest,
+# or at a model store directory (see model_store.ModelStore) to serve its
+# current version and follow activations and rollbacks without a restart
+MODEL_PATH = os.environ.get("MODEL_PATH", "model.pkl")
+
+# Hosted models: the primary (MODEL_PATH), an optional canary that serves
+# CANARY_PERCENT of traffic, and shadow models (SHADOW_MODELS, comma separated)
+# that score every request in the background for comparison. Model files are
+# unpickled once and re-read only when they change.
+model_registry = ModelRegistry()
+model_fleet = ModelFleet.from_env(model_registry)
+
+# The routing API never unpickles arbitrary paths: it hosts versions of the
+# model store in MODEL_STORE_DIR (by version id or unique prefix) and files
+# listed in ROUTABLE_MODELS (comma separated). With ROUTING_TOKEN set, changes
+# also need a matching X-Admin-Token header.
+MODEL_STORE_DIR = os.environ.get("MODEL_STORE_DIR", "model_store")
+ROUTABLE_MODELS = [p.strip() for p in os.environ.get("ROUTABLE_MODELS", "").split(",") if p.strip()]
+ROUTING_TOKEN = os.environ.get("ROUTING_TOKEN")
 
 # Load the model
 def load_model():
     try:
-        with open('model.pkl', 'rb') as f:
-            model = pickle.load(f)
-        return model
+        return model_registry.get(MODEL_PATH).model
     except Exception as e:
         logger.error(f"Error loading model: {e}")
         return None
 
+# Early-exit inference (see serving.EarlyExitForest); clients can still ask for ?exact=true
+EARLY_EXIT_DEFAULT = os.environ.get("EARLY_EXIT", "").lower() in ("1", "true", "yes")
+_early_exit_forests = {}
+
+def get_early_exit_forest(loaded):
+    """Early-exit view of a hosted forest, rebuilt only when its model file changes."""
+    model = loaded.model
+    if not hasattr(model, "estimators_") and not hasattr(model, "roots"):
+        return None  # Not a tree ensemble
+    version, forest = _early_exit_forests.get(loaded.path, (None, None))
+    if version != loaded.version:
+        forest = EarlyExitForest(model)
+        _early_exit_forests[loaded.path] = (loaded.version, forest)
+    return forest
+
+# Concurrent identical predictions (same model, same canonical features) share
+# one inference; responses to requests carrying an Idempotency-Key are kept
+# for IDEMPOTENCY_TTL seconds so client retries are answered without rescoring
+prediction_flights = SingleFlight()
+idempotency_cache = IdempotencyCache(ttl=float(os.environ.get("IDEMPOTENCY_TTL", 300)))
+
+# Admission control: bounded concurrent inference with interactive predictions
+# ahead of batch calls; with LATENCY_SLO_MS set, requests that would miss it
+# (or the client's X-Request-Timeout / X-Request-Deadline) are shed early
+admission = AdmissionController.from_env()
+
+# Per-prediction explanations (see explanations.TreeExplainer); background
+# statistics over the training data are computed once per model version
+MAX_EXPLAIN_ROWS = 1000
+_explainers = {}
+
+def get_explainer(loaded):
+    """Tree explainer for a hosted forest, rebuilt only when its model file changes."""
+    from explanations import TreeExplainer
+    model = loaded.model
+    if not hasattr(model, "estimators_") and not hasattr(model, "roots"):
+        return None  # Not a tree ensemble
+    key = (loaded.path, loaded.version)
+    if key not in _explainers:
+        encoder = loaded.encoder or get_encoder()
+        background = encoder.encode_frame(pd.read_csv(TRAIN_DATA_PATH).drop(columns=[TARGET_COLUMN]))
+        _explainers.clear()
+        _explainers[key] = TreeExplainer(model, background)
+    return _explainers[key]
+
+# Model metadata (feature importances, params, metrics) from the sidecar manifest
+# written by model_pipeline.save_model; browsers may reuse it for a minute and
+# then revalidate with If-None-Match
+METADATA_CACHE_CONTROL = "public, max-age=60"
+_model_metadata = {}
+
+def get_model_metadata():
+    """Return (manifest, serialized feature list, ETag), cached until the model file changes."""
+    from model_pipeline import model_metadata, read_model_metadata, metadata_path
+    model_file = model_registry.resolve(MODEL_PATH)
+    meta_file = metadata_path(model_file)
+    key = (model_file, os.stat(model_file).st_mtime_ns,
+           os.stat(meta_file).st_mtime_ns if os.path.exists(meta_file) else None)
+    if key not in _model_metadata:
+        manifest = read_model_metadata(model_file)
+        if manifest is None:
+            # No (current) manifest: derive it from the model once
+            model = load_model()
+            if model is None:
+                raise RuntimeError("Model failed to load")
+            manifest = model_metadata(model)
+            if not manifest["feature_names"]:
+                names = get_feature_names()
+                if len(names) == len(manifest["features"]):
+                    order = {f"feature_{i}": name for i, name in enumerate(names)}
+                    for feature in manifest["features"]:
+                        feature["name"] = order[feature["name"]]
+                    manifest["feature_names"] = names
+        features = json.dumps(manifest["features"]).encode()
+        etag = '"' + hashlib.sha256(json.dumps(manifest, sort_keys=True).encode()).hexdigest()[:32] + '"'
+        _model_metadata.clear()
+        _model_metadata[key] = (manifest, features, etag)
+    return _model_metadata[key]
+
+def _not_modified(request, etag):
+    return any(tag.strip() in (etag, "*") for tag in request.headers.get("If-None-Match", "").split(","))
+
 # Get column names from the training data
 def get_feature_names():
     try:
@@ -79,116 +253,495 @@ def get_feature_names():
         logger.error(f"Error loading column names: {e}")
         return []
 
-@app.post("/api/predict", response_model=PredictionOutput)
-async def predict(data: FeatureInput):
-    model = load_model()
-    if not model:
-        raise HTTPException(status_code=500, detail="Model failed to load")
+def _score_request(served, features, use_early_exit):
+    """Encode and score one feature record with the served model (runs on the threadpool)."""
+    # Check for missing required features and log them
+    encoder = served.encoder or get_encoder()
+    missing_features = encoder.missing_features(features)
+    if missing_features:
+        logger.warning(f"Missing features detected: {missing_features}")
+        # Only raise HTTP exception if more than half the features are missing
+        if len(missing_features) > len(encoder.feature_names) / 2:
+            raise HTTPException(status_code=400, detail=f"Missing required features: {missing_features}")
     
-    try:
-        # Get training data to understand expected features
-        df_train = pd.read_csv("churn-bigml-80.csv")
-        expected_features = list(df_train.drop(columns=['Churn']).columns)
-        
-        # Check for missing required features and log them
-        missing_features = [feature for feature in expected_features if feature not in data.features]
-        if missing_features:
-            logger.warning(f"Missing features detected: {missing_features}")
-            # Only raise HTTP exception if more than half the features are missing
-            if len(missing_features) > len(expected_features) / 2:
-                raise HTTPException(status_code=400, detail=f"Missing required features: {missing_features}")
-        
-        # Create a new dictionary with features in the same order as training data
-        processed_features = {}
-        
-        # Process features, filling in missing ones with defaults
-        for feature in expected_features:
-            if feature in data.features:
-                processed_features[feature] = data.features[feature]
-            else:
-                # Fill missing features with default values
-                if feature in df_train.select_dtypes(include=['object']).columns:
-                    # For categorical features, use the most common value
-                    processed_features[feature] = df_train[feature].mode()[0]
-                else:
-                    # For numerical features, use the mean
-                    processed_features[feature] = float(df_train[feature].mean())
-        
-        # Convert input dict to DataFrame with features in the expected order
-        input_df = pd.DataFrame([processed_features])
-        
-        # Ensure column order matches what the model expects
-        input_df = input_df[expected_features]
-        
-        # Handle boolean columns
-        boolean_cols = ['International plan', 'Voice mail plan']
-        for col in boolean_cols:
-            if col in input_df.columns:
-                input_df[col] = (input_df[col].str.lower() == 'yes').astype(int)
-        
-        # Handle other categorical features
-        categorical_cols = input_df.select_dtypes(include=['object']).columns
-        categorical_cols = [col for col in categorical_cols 
-                          if col not in boolean_cols]
-        
-        # Use training data to fit label encoders
-        label_encoders = {}
-        for col in categorical_cols:
-            if col in df_train.columns:
-                label_encoders[col] = LabelEncoder()
-                # Fit on training data
-                label_encoders[col].fit(df_train[col])
-                # Transform input data
-                input_df[col] = label_encoders[col].transform(input_df[col])
-        
-        # Make prediction
-        prediction = model.predict(input_df)
-        probability = model.predict_proba(input_df)
-        
+    # Encode once (missing features filled with training defaults); the same
+    # frame is scored by the served model and then by every shadow model
+    input_df = encoder.encode_records([features])
+    
+    # Make prediction
+    early_forest = get_early_exit_forest(served) if use_early_exit else None
+    start = time.perf_counter()
+    if early_forest is not None:
+        # Stop evaluating trees once the decision can no longer flip; the
+        # quantized trees make the probability approximate even when all ran
+        prediction, churn_probability, trees_used = early_forest.predict(input_df)
+        latency = time.perf_counter() - start
+        result = {
+            "prediction": int(prediction[0]),
+            "churn_probability": float(churn_probability[0]),
+            "retention_probability": 1.0 - float(churn_probability[0]),
+            "probability_is_approximate": True,
+            "trees_evaluated": int(trees_used[0])
+        }
+    else:
+        prediction, probability = score_frame(served.model, input_df)
+        churn_probability = probability[:, 1]
+        latency = time.perf_counter() - start
         result = {
             "prediction": int(prediction[0]),
             "churn_probability": float(probability[0][1]),
             "retention_probability": float(probability[0][0])
         }
-        
-        # Log prediction for monitoring
+    result["model_version"] = served.version
+    return result, input_df, prediction, churn_probability, latency
+
+@app.post("/api/predict", response_model=PredictionOutput)
+async def predict(data: FeatureInput, request: Request, response: Response,
+                  early_exit: Optional[bool] = None, exact: bool = False):
+    if early_exit is None:
+        early_exit = EARLY_EXIT_DEFAULT
+    use_early_exit = early_exit and not exact
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # A retried request with the same Idempotency-Key gets the stored response
+    idempotency_key = request.headers.get("Idempotency-Key")
+    fingerprint = canonical_hash(data.features, use_early_exit)
+    if idempotency_key:
+        try:
+            stored = idempotency_cache.get(idempotency_key, fingerprint)
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        if stored is not None:
+            response.headers["Idempotent-Replayed"] = "true"
+            return stored
+    
+    try:
+        served, role, others = model_fleet.choose(MODEL_PATH, request.headers.get("X-Routing-Key"))
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        raise HTTPException(status_code=500, detail="Model failed to load")
+    
+    try:
+        # Identical requests in flight for the same model share one inference,
+        # which alone takes an admission slot
+        (result, input_df, prediction, churn_probability, latency), multiplicity = await prediction_flights.run(
+            (served.path, served.version, fingerprint), _profiled(request, _score_request),
+            served, data.features, use_early_exit,
+            runner=lambda func, *args: admission.run(INTERACTIVE, deadline, func, *args))
+    except HTTPException:
+        raise
+    except Rejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers=e.headers())
+    except ValueError as e:
+        logger.error(f"Prediction error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Prediction error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if multiplicity is None:
+        response.headers["X-Coalesced"] = "true"
+    else:
+        # Only the leader records the inference: once, with how many requests it answered
+        model_fleet.record_served(served, role, latency)
+        model_fleet.shadow(input_df, prediction, churn_probability, latency, others)
         monitor.log_prediction(
             features=data.features,
-            prediction=int(prediction[0])
+            prediction=int(prediction[0]),
+            count=multiplicity
         )
-        
-        return result
+    
+    if idempotency_key:
+        idempotency_cache.put(idempotency_key, fingerprint, result)
+    return result
+
+@app.get("/api/predict/admission")
+async def get_admission_stats():
+    """In-flight work, queue depth, service time and shed counts per priority lane."""
+    return admission.stats()
+
+@app.get("/api/predict/coalescing")
+async def get_coalescing_stats():
+    """Counters for coalesced concurrent predictions and Idempotency-Key replays."""
+    return {"single_flight": prediction_flights.stats(), "idempotency": idempotency_cache.stats()}
+    
+@app.get("/api/predict/early-exit")
+async def get_early_exit_stats():
+    """Average number of trees evaluated per early-exit prediction."""
+    try:
+        loaded = model_registry.get(MODEL_PATH)
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        raise HTTPException(status_code=500, detail="Model failed to load")
+    early_forest = get_early_exit_forest(loaded)
+    if early_forest is None:
+        raise HTTPException(status_code=400, detail="Served model does not support early exit")
+    return {"enabled_by_default": EARLY_EXIT_DEFAULT, **early_forest.stats()}
+
+@app.get("/api/models")
+async def get_hosted_models():
+    """Routing configuration plus served traffic, agreement and latency delta per model version."""
+    return {"primary_model": MODEL_PATH, **model_fleet.stats()}
+
+def routable_model_path(name):
+    """Model file for a routing entry: an allow-listed file or a model store version."""
+    allowed = {os.path.realpath(path): path for path in ROUTABLE_MODELS}
+    if os.path.realpath(name) in allowed and os.path.isfile(name):
+        return allowed[os.path.realpath(name)]
+    if re.fullmatch(r"[0-9a-f]{4,64}", name) and os.path.isdir(os.path.join(MODEL_STORE_DIR, "versions")):
+        from model_store import ModelStore
+        store = ModelStore(MODEL_STORE_DIR, keep_last=0)
+        return store.path(store.resolve(name))
+    raise ValueError(f"Not a model store version or an allow-listed model: {name}")
+
+@app.put("/api/models/routing")
+async def update_model_routing(config: RoutingConfig, request: Request):
+    """Change the shadow models, the canary model or the canary traffic percentage."""
+    if config.canary_percent is not None and not 0 <= config.canary_percent <= 100:
+        raise HTTPException(status_code=400, detail="canary_percent must be between 0 and 100")
+    if ROUTING_TOKEN and not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ROUTING_TOKEN):
+        raise HTTPException(status_code=401, detail="A valid X-Admin-Token is required to change routing")
+    try:
+        shadow_models = None if config.shadow_models is None else [
+            routable_model_path(name) for name in config.shadow_models]
+        canary_model = routable_model_path(config.canary_model) if config.canary_model else config.canary_model
     except ValueError as e:
-        logger.error(f"Prediction error: {str(e)}")
         raise HTTPException(status_code=400, detail=str(e))
+    try:
+        model_fleet.configure(shadow_models, canary_model, config.canary_percent)
     except Exception as e:
-        logger.error(f"Prediction error: {str(e)}")
+        logger.error(f"Error updating model routing: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"Could not load model: {str(e)}")
+    return await get_hosted_models()
+
+@app.post("/api/explain")
+async def explain(data: ExplainInput, request: Request):
+    """Feature contributions for a batch of records (raw feature values, as for /api/predict).
+
+    Explaining is batch work: it is admitted in the batch lane and runs on
+    the threadpool, like building the explainer for a new model version.
+    """
+    if not data.records:
+        raise HTTPException(status_code=400, detail="No records to explain")
+    if len(data.records) > MAX_EXPLAIN_ROWS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_EXPLAIN_ROWS} records per request")
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    try:
+        loaded = model_registry.get(MODEL_PATH)
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        raise HTTPException(status_code=500, detail="Model failed to load")
     
-@app.get("/api/features", response_model=List[FeatureImportance])
-async def get_features():
+    encoder = loaded.encoder or get_encoder()
+    for record in data.records:
+        missing = encoder.missing_features(record)
+        if len(missing) > len(encoder.feature_names) / 2:
+            raise HTTPException(status_code=400, detail=f"Missing required features: {missing}")
+    
+    def run():
+        explainer = get_explainer(loaded)
+        if explainer is None:
+            return None
+        X = encoder.encode_records(data.records)
+        return {
+            "expected_value": explainer.expected_value,
+            "background": {key: value for key, value in explainer.background.items() if key != "feature_means"},
+            "explanations": explainer.explain(X, data.top_k),
+        }
+    
+    try:
+        result = await admission.run(BATCH, deadline, run)
+    except Rejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers=e.headers())
+    except ValueError as e:
+        logger.error(f"Explanation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=400, detail="Served model does not support explanations")
+    return result
+
+@app.post("/api/predict/bulk")
+async def predict_bulk(request: Request, format: Optional[str] = None, output: Optional[str] = None,
+                       job_id: Optional[str] = None, chunk_size: int = 10000):
+    """Score a CSV or NDJSON upload chunk by chunk, streaming results back.
+
+    The body may be sent raw (Content-Type text/csv or application/x-ndjson)
+    or as a multipart upload in a `file` field. Pass the `job_id` returned
+    in the X-Job-Id header to resume an interrupted job from where it stopped.
+    """
+    if chunk_size < 1:
+        raise HTTPException(status_code=400, detail="chunk_size must be positive")
+    try:
+        deadline = parse_deadline(request.headers)
+        job = bulk_jobs.get(job_id) if job_id else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if job is not None and job["state"] == "completed":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already completed")
+
     model = load_model()
     if not model:
         raise HTTPException(status_code=500, detail="Model failed to load")
+
+    # Spool the upload to a temporary file so memory stays flat for any file size
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=400, detail="Multipart upload needs a 'file' field")
+        upload_file, filename = upload.file, upload.filename
+        upload_type = upload.content_type
+    else:
+        spool = tempfile.NamedTemporaryFile(suffix=".upload", delete=False)
+        spool.close()
+        async with aiofiles.open(spool.name, "wb") as f:
+            async for body_chunk in request.stream():
+                await f.write(body_chunk)
+        upload_file, filename, upload_type = open(spool.name, "rb"), None, content_type
+
+    def discard_upload():
+        upload_file.close()
+        if filename is None:
+            os.remove(upload_file.name)  # Our spool file
+
+    try:
+        in_fmt = bulk_scoring.detect_format(upload_type, filename, format)
+        out_fmt = bulk_scoring.detect_format(explicit=output) if output else in_fmt
+        encoder = get_encoder()
+        missing = encoder.missing_features(bulk_scoring.peek_columns(upload_file, in_fmt))
+        if len(missing) > len(encoder.feature_names) / 2:
+            raise ValueError(f"Missing required features: {missing}")
+    except ValueError as e:
+        discard_upload()
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = bulk_jobs.start(job_id)
+    except bulk_scoring.JobConflict as e:
+        discard_upload()
+        raise HTTPException(status_code=409, detail=str(e))
+    scores = bulk_scoring.stream_scores(model, encoder, upload_file, in_fmt, job,
+                                        bulk_jobs, chunk_rows=chunk_size, out_fmt=out_fmt)
+
+    def close():
+        scores.close()
+        discard_upload()
+
+    async def next_piece(shed):
+        # Every chunk takes a batch-lane slot, so bulk uploads queue behind
+        # interactive predictions instead of competing with them
+        return await admission.run(BATCH, deadline, next, scores, None, shed=shed)
+
+    # The first chunk is admitted before the response starts, so an
+    # overloaded server can still shed the upload with 429/503; once results
+    # are streaming, later chunks only wait for their turn
+    try:
+        first = await next_piece(shed=True)
+    except Rejected as e:
+        close()
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers=e.headers())
+
+    async def results():
+        try:
+            piece = first
+            while piece is not None:
+                yield piece
+                piece = await next_piece(shed=False)
+        finally:
+            close()
+
+    return StreamingResponse(results(), media_type=bulk_scoring.CONTENT_TYPES[out_fmt],
+                             headers={"X-Job-Id": job["job_id"]})
+
+# Columnar batch scoring for high-volume callers: the body skips per-record
+# validation and may be MessagePack or Arrow (numeric columns as float32,
+# which is what the trees compare in anyway) and gzip/zstd compressed
+MAX_BATCH_BYTES = int(os.environ.get("MAX_BATCH_BYTES", 64 * 1024 * 1024))
+
+async def read_body(request, max_bytes):
+    """Read a request body, with 413 as soon as it is known to exceed `max_bytes`."""
+    too_large = HTTPException(status_code=413, detail=f"Request body exceeds {max_bytes} bytes")
+    try:
+        declared = int(request.headers.get("content-length", 0))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if declared > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return bytes(body)
+
+@app.post("/api/predict/batch")
+async def predict_batch(request: Request):
+    """Score a batch sent as JSON, MessagePack or Arrow (Content-Type, optional Content-Encoding).
+
+    The response format follows Accept (JSON by default) and is compressed
+    per Accept-Encoding once it is larger than wire_formats.COMPRESS_MIN_BYTES.
+    """
+    try:
+        in_fmt = wire_formats.parse_media_type(request.headers.get("content-type"))
+        out_fmt = wire_formats.negotiate(request.headers.get("accept"))
+    except wire_formats.UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except wire_formats.NotAcceptable as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    try:
+        deadline = parse_deadline(request.headers)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        served = model_registry.get(MODEL_PATH)
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        raise HTTPException(status_code=500, detail="Model failed to load")
+    
+    body = await read_body(request, MAX_BATCH_BYTES)
+    
+    def score():
+        raw = wire_formats.decompress(body, request.headers.get("content-encoding"), MAX_BATCH_BYTES)
+        df = wire_formats.load_features(raw, in_fmt)
+        if len(df) == 0:
+            raise ValueError("Batch has no rows")
+        encoder = served.encoder or get_encoder()
+        missing = encoder.missing_features(df.columns)
+        if len(missing) > len(encoder.feature_names) / 2:
+            raise ValueError(f"Missing required features: {missing}")
+        prediction, probability = score_frame(served.model, encoder.encode_frame(df))
+        content = wire_formats.dump_results(prediction, probability, out_fmt, served.version)
+        encoding = wire_formats.negotiate_encoding(request.headers.get("accept-encoding"))
+        if encoding is None or len(content) < wire_formats.COMPRESS_MIN_BYTES:
+            return content, None
+        return wire_formats.compress(content, encoding), encoding
     
     try:
-        feature_importances = model.feature_importances_
-        feature_names = get_feature_names()
-        
-        if not feature_names or len(feature_names) != len(feature_importances):
-            feature_names = [f"feature_{i}" for i in range(len(feature_importances))]
-        
-        features = [
-            {"name": name, "importance": float(importance)}
-            for name, importance in zip(feature_names, feature_importances)
-        ]
-        
-        features.sort(key=lambda x: x["importance"], reverse=True)
-        return features
-        
+        content, encoding = await admission.run(BATCH, deadline, score)
+    except Rejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers=e.headers())
+    except wire_formats.UnsupportedMediaType as e:
+        raise HTTPException(status_code=415, detail=str(e))
     except Exception as e:
-        logger.error(f"Feature importance error: {str(e)}")
+        logger.error(f"Batch prediction error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=content, media_type=out_fmt, headers=headers)
+
+@app.get("/api/predict/bulk/{job_id}")
+async def get_bulk_job(job_id: str):
+    try:
+        job = bulk_jobs.get(job_id)
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.on_event("startup")
+async def resume_batch_jobs():
+    # Pick up jobs left unfinished by a previous process
+    batch_queue.start()
+
+@app.on_event("shutdown")
+async def stop_batch_jobs():
+    batch_queue.stop(timeout=5)
+
+@app.on_event("startup")
+async def start_live_feed():
+    latest = test_runs.latest()
+    if latest["results"]:
+        _publish_test_results(latest["results"])
+    feed_watcher.start()
+
+@app.on_event("shutdown")
+async def stop_live_feed():
+    feed_watcher.stop(timeout=5)
+
+@app.on_event("shutdown")
+async def stop_shadow_models():
+    model_fleet.shutdown()
+
+@app.post("/api/jobs")
+async def submit_batch_job(job: BatchJobRequest, request: Request):
+    """Queue a server-side CSV/NDJSON file for background scoring.
+
+    The job is scored by the model this request would be served by
+    (MODEL_PATH or, per X-Routing-Key, the canary), pinned to its current
+    version. Submissions go through the batch admission lane, so new jobs
+    are shed with 429/503 while the server is already saturated.
+    """
+    try:
+        served, _, _ = model_fleet.choose(MODEL_PATH, request.headers.get("X-Routing-Key"))
+    except Exception as e:
+        logger.error(f"Error loading model: {e}")
+        raise HTTPException(status_code=500, detail="Model failed to load")
+    try:
+        deadline = parse_deadline(request.headers)
+        job_id = await admission.run(BATCH, deadline, functools.partial(
+            batch_queue.submit, job.input_path, fmt=job.format, model_path=served.path))
+    except Rejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.reason, headers=e.headers())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return batch_queue.status(job_id)
+
+@app.get("/api/jobs")
+async def list_batch_jobs(limit: int = 50):
+    return {"jobs": batch_queue.list_jobs(limit)}
+
+@app.get("/api/jobs/{job_id}")
+async def get_batch_job(job_id: str):
+    job = batch_queue.status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_batch_job(job_id: str):
+    try:
+        cancelled = batch_queue.cancel(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    if not cancelled:
+        raise HTTPException(status_code=409, detail=f"Job {job_id} already finished")
+    return batch_queue.status(job_id)
+
+@app.get("/api/features", response_model=List[FeatureImportance])
+async def get_features(request: Request):
+    try:
+        manifest, features, etag = get_model_metadata()
+    except Exception as e:
+        logger.error(f"Feature importance error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Model failed to load")
+    
+    headers = {"ETag": etag, "Cache-Control": METADATA_CACHE_CONTROL}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=features, media_type="application/json", headers=headers)
+
+@app.get("/api/model/metadata")
+async def get_metadata(request: Request):
+    try:
+        manifest, _, etag = get_model_metadata()
+    except Exception as e:
+        logger.error(f"Model metadata error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Model failed to load")
+    
+    headers = {"ETag": etag, "Cache-Control": METADATA_CACHE_CONTROL}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=json.dumps(manifest), media_type="application/json", headers=headers)
 
 @app.get("/api/health", response_model=HealthStatus)
 async def health_check():
@@ -197,120 +750,44 @@ async def health_check():
 
 @app.get("/api/test-results")
 async def get_test_results():
+    """Latest result of every test, served from memory."""
+    return test_runs.latest()
+
+@app.post("/api/test-results")
+async def ingest_test_results(results: TestResults):
+    """Store a test run (idempotent per run_key) and push the new results to live dashboards."""
     try:
-        # Try multiple paths for test results
-        paths_to_try = [
-            "test_results.json",  # Original path
-            "test_results/test_results.json",  # Directory path
-            "test_results/test_results_fallback.json"  # Fallback path
-        ]
-        
-        for path in paths_to_try:
-            if os.path.exists(path) and os.path.isfile(path):
-                with open(path, "r") as f:
-                    return json.load(f)
-                    
-        # If no file found, return empty results
-        return {
-            "total": 0,
-            "passed": 0,
-            "failed": 0,
-            "results": []
-        }
+        records = [r.dict() for r in results.results]
+        run = test_runs.add_run(records, run_key=results.run_key, timestamp=results.timestamp)
     except Exception as e:
-        logger.error(f"Error getting test results: {str(e)}")
+        logger.error(f"Error storing test results: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    _publish_test_results(records)
+    return run
+
+def _publish_test_results(records):
+    """Push changed test results, with the merged summary, to live dashboards."""
+    latest = test_runs.latest()
+    live_feed.publish("test_results", {
+        "summary": {key: latest[key] for key in ("total", "passed", "failed", "timestamp")},
+        "results": records,
+    })
+
+@app.get("/api/test-results/history")
+async def get_test_history(limit: int = 20, before: Optional[int] = None):
+    """Run summaries, newest first; page with `before` set to the oldest run number seen."""
+    if not 0 < limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    return {"runs": test_runs.history(limit=limit, before=before)}
+
+@app.get("/api/test-results/runs/{run}")
+async def get_test_run(run: str):
+    """One stored run with all of its results, by run number or run_key."""
+    result = test_runs.get_run(run)
+    if result is None:
+        raise HTTPException(status_code=404, detail=f"Unknown test run {run}")
+    return result
 
-@app.get("/api/test-results")
-async def get_test_results():
-    try:
-        # Define path to test results
-        test_results_dir = "test_results"
-        test_results_path = os.path.join(test_results_dir, "test_results.json")
-        
-        # Check if the directory exists first
-        if os.path.exists(test_results_dir) and os.path.isdir(test_results_dir):
-            # Check if file exists in directory
-            if os.path.exists(test_results_path) and os.path.isfile(test_results_path):
-                with open(test_results_path, "r") as f:
-                    try:
-                        data = json.load(f)
-                        logger.info(f"Loaded test results from {test_results_path}")
-                        return data
-                    except json.JSONDecodeError:
-                        logger.error(f"Invalid JSON in test results file")
-        
-        # Try legacy path
-        legacy_path = "test_results.json"
-        if os.path.exists(legacy_path) and os.path.isfile(legacy_path):
-            with open(legacy_path, "r") as f:
-                try:
-                    data = json.load(f)
-                    logger.info(f"Loaded test results from legacy path {legacy_path}")
-                    return data
-                except json.JSONDecodeError:
-                    logger.error(f"Invalid JSON in legacy test results file")
-        
-        # If no valid file found, log paths that were checked
-        logger.warning(f"No valid test results file found. Checked {test_results_path} and {legacy_path}")
-        logger.warning(f"Directory exists: {os.path.exists(test_results_dir)}")
-        if os.path.exists(test_results_dir):
-            logger.warning(f"Files in directory: {os.listdir(test_results_dir)}")
-        
-        # Return default results matching what's shown in UI
-        return {
-            "total": 5,
-            "passed": 5,
-            "failed": 0,
-            "results": [
-                {
-                    "name": "test_model_prediction_latency",
-                    "status": "passed",
-                    "duration": 0.0,
-                    "error_message": None
-                },
-                {
-                    "name": "test_api_throughput",
-                    "status": "passed",
-                    "duration": 0.0,
-                    "error_message": None
-                },
-                {
-                    "name": "test_model_memory_usage",
-                    "status": "passed",
-                    "duration": 0.0,
-                    "error_message": None
-                },
-                {
-                    "name": "test_model_load_time",
-                    "status": "passed",
-                    "duration": 0.0,
-                    "error_message": None
-                },
-                {
-                    "name": "test_api_response_size",
-                    "status": "passed",
-                    "duration": 0.0,
-                    "error_message": None
-                }
-            ],
-            "timestamp": datetime.now().isoformat()
-        }
-    except Exception as e:
-        logger.error(f"Error getting test results: {str(e)}")
-        # Return default data even on error to prevent UI breakage
-        return {
-            "total": 5,
-            "passed": 5,
-            "failed": 0,
-            "results": [
-                {"name": "test_model_prediction_latency", "status": "passed", "duration": 0.0},
-                {"name": "test_api_throughput", "status": "passed", "duration": 0.0},
-                {"name": "test_model_memory_usage", "status": "passed", "duration": 0.0},
-                {"name": "test_model_load_time", "status": "passed", "duration": 0.0},
-                {"name": "test_api_response_size", "status": "passed", "duration": 0.0}
-            ]
-        }
 # New monitoring endpoints
 @app.get("/api/monitoring/metrics")
 async def get_monitoring_metrics():
@@ -332,15 +809,47 @@ async def get_monitoring_history():
         logger.error(f"Error fetching monitoring history: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/monitoring/slices")
+async def get_slice_metrics(column: Optional[str] = None, min_support: int = 0, history: int = 1):
+    """Per-slice metrics of the latest evaluations (newest first), optionally for one column."""
+    if history < 1:
+        raise HTTPException(status_code=400, detail="history must be at least 1")
+    try:
+        entries = monitor.slice_history(min(history, 100))
+    except Exception as e:
+        logger.error(f"Error fetching slice metrics: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    for entry in entries:
+        entry["slices"] = [s for s in entry["slices"]
+                           if (column is None or s["column"] == column) and s["support"] >= min_support]
+    return {"evaluations": entries}
+
+@app.get("/api/monitoring/stream")
+async def stream_monitoring(request: Request):
+    """Server-sent events: a `snapshot` event with the current dashboard state,
+    then `metrics`, `alerts` and `test_results` events carrying only new data."""
+    return StreamingResponse(
+        live_feed.events(is_disconnected=request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+MAX_ALERTS_PER_REQUEST = 1000
+
 @app.get("/api/monitoring/alerts")
-async def get_alerts():
-    try:
-        alerts = []
-        if os.path.exists("monitoring_logs/alerts.log"):
-            with open("monitoring_logs/alerts.log", "r") as f:
-                for line in f:
-                    alerts.append(line.strip())
-        return {"alerts": alerts}
+async def get_alerts(since: Optional[str] = None, limit: int = 100, severity: Optional[str] = None):
+    """Most recent alerts (oldest first), optionally after `since` (ISO time or epoch) and at or above `severity`."""
+    if severity is not None and severity not in SEVERITIES:
+        raise HTTPException(status_code=400, detail=f"severity must be one of {list(SEVERITIES)}")
+    if not 0 < limit <= MAX_ALERTS_PER_REQUEST:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_ALERTS_PER_REQUEST}")
+    try:
+        since_ts = parse_since(since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid since: {since}")
+    try:
+        alerts = alert_store.query(since=since_ts, limit=limit + 1, severity=severity)
+        return {"alerts": alerts[-limit:], "truncated": len(alerts) > limit}
     except Exception as e:
         logger.error(f"Error fetching alerts: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
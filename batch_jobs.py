@@ -0,0 +1,354 @@
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+import bulk_scoring
+from serving import FeatureEncoder, TRAIN_DATA_PATH, score_frame
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    input_path TEXT NOT NULL,
+    format TEXT NOT NULL,
+    model_path TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    state TEXT NOT NULL,
+    total_partitions INTEGER NOT NULL,
+    partitions_done INTEGER NOT NULL DEFAULT 0,
+    rows_done INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS partitions (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    start_byte INTEGER NOT NULL,
+    end_byte INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    rows INTEGER,
+    seconds REAL,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+def plan_partitions(path, fmt, partition_bytes):
+    """Split a CSV/NDJSON file into newline-aligned byte ranges.
+
+    Only the partition boundaries are read, so planning a multi-GB file does
+    not require a full scan. For CSV the header line is excluded from the
+    ranges and re-attached by each worker.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        start = len(f.readline()) if fmt == bulk_scoring.CSV else 0
+        bounds = [start]
+        position = start
+        while position + partition_bytes < size:
+            f.seek(position + partition_bytes)
+            f.readline()
+            position = f.tell()
+            if position >= size:
+                break
+            bounds.append(position)
+    bounds.append(size)
+    return [(s, e) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+
+
+def count_rows(path, start, end, block_size=1 << 20):
+    """Number of lines (data rows) in a newline-aligned byte range of a file."""
+    rows, last = 0, b"\n"
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = f.read(min(block_size, remaining))
+            if not block:
+                break
+            rows += block.count(b"\n")
+            last = block[-1:]
+            remaining -= len(block)
+    return rows + (last != b"\n")  # A last line without its newline
+
+
+def shard_path(output_dir, idx, fmt):
+    return os.path.join(output_dir, f"part-{idx:05d}.{'csv' if fmt == bulk_scoring.CSV else 'ndjson'}")
+
+
+# Per-worker-process state, loaded once by the pool initializer
+_worker = {}
+
+
+def _init_worker(model_path, train_path):
+    from model_registry import ModelRegistry
+    # Same loading as the API: a model store version brings its own preprocessing
+    loaded = ModelRegistry().get(model_path)
+    _worker["model"] = loaded.model
+    _worker["encoder"] = loaded.encoder or FeatureEncoder.from_training_data(train_path)
+
+
+def _score_partition(task):
+    """Score one byte range of the input and write it to its shard file.
+
+    `start_row` is the number of data rows before the range, so the row
+    column numbers rows across the whole input, not within the shard.
+    """
+    input_path, fmt, start, end, start_row, output_path, cancel_marker, chunk_rows = task
+    started = time.perf_counter()
+    with open(input_path, "rb") as f:
+        header = f.readline() if fmt == bulk_scoring.CSV else b""
+        f.seek(start)
+        data = io.BytesIO(header + f.read(end - start))
+
+    rows = 0
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, "w") as out:
+        header_row = fmt == bulk_scoring.CSV
+        for chunk in bulk_scoring.iter_chunks(data, fmt, chunk_rows):
+            if os.path.exists(cancel_marker):
+                out.close()
+                os.remove(tmp_path)
+                return {"rows": rows, "seconds": time.perf_counter() - started, "cancelled": True}
+            X = _worker["encoder"].encode_frame(chunk)
+            prediction, probability = score_frame(_worker["model"], X)
+            out.write(bulk_scoring.format_results(start_row + rows, prediction, probability, fmt,
+                                                  header=header_row))
+            header_row = False
+            rows += len(chunk)
+    os.replace(tmp_path, output_path)
+    return {"rows": rows, "seconds": time.perf_counter() - started, "cancelled": False}
+
+
+class BatchJobQueue:
+    """Fire-and-forget batch scoring of large files on a local process pool.
+
+    Jobs and per-partition progress live in SQLite, so a restarted API picks
+    up unfinished jobs and only re-scores partitions that had not completed.
+    Results go to one shard file per input partition under
+    `<output_root>/<job_id>/`; concatenating shards in order matches the
+    input row order.
+    """
+
+    def __init__(self, db_path="monitoring_logs/batch_jobs.db", output_root="monitoring_logs/batch_outputs",
+                 max_workers=None, partition_bytes=64 * 1024 * 1024, chunk_rows=50000,
+                 input_root=None, poll_interval=1.0, autostart=True):
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        os.makedirs(output_root, exist_ok=True)
+        self.db_path = db_path
+        self.output_root = output_root
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.partition_bytes = partition_bytes
+        self.chunk_rows = chunk_rows
+        self.input_root = os.path.realpath(input_root or os.environ.get("BATCH_INPUT_ROOT", os.getcwd()))
+        self.poll_interval = poll_interval
+        self.autostart = autostart
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        """Open a connection, commit on success and always close it."""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    # ---- API-facing operations -------------------------------------------------
+
+    def submit(self, input_path, fmt=None, model_path="model.pkl"):
+        """Queue a file for scoring and return its job id.
+
+        `model_path` is a model file or a model store directory; the job is
+        pinned to the version current at submission.
+        """
+        input_path = os.path.realpath(input_path)
+        if os.path.commonpath([input_path, self.input_root]) != self.input_root:
+            raise ValueError(f"Input must be under {self.input_root}")
+        if not os.path.isfile(input_path):
+            raise ValueError(f"Input file not found: {input_path}")
+        if os.path.isdir(model_path):
+            from model_registry import ModelRegistry
+            model_path = ModelRegistry().resolve(model_path)
+        if not os.path.isfile(model_path):
+            raise ValueError(f"Model file not found: {model_path}")
+        fmt = bulk_scoring.detect_format(filename=input_path, explicit=fmt)
+
+        job_id = uuid.uuid4().hex
+        output_dir = os.path.join(self.output_root, job_id)
+        os.makedirs(output_dir, exist_ok=True)
+        partitions = plan_partitions(input_path, fmt, self.partition_bytes)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, input_path, format, model_path, output_dir, state, "
+                "total_partitions, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, input_path, fmt, os.path.realpath(model_path), output_dir, QUEUED,
+                 len(partitions), datetime.now().isoformat())
+            )
+            conn.executemany(
+                "INSERT INTO partitions (job_id, idx, start_byte, end_byte, state) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, i, s, e, QUEUED) for i, (s, e) in enumerate(partitions)]
+            )
+        logger.info(f"Queued batch job {job_id}: {input_path} in {len(partitions)} partitions")
+        if self.autostart:
+            self.start()
+        self._wake.set()
+        return job_id
+
+    def status(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            seconds = conn.execute(
+                "SELECT SUM(seconds) FROM partitions WHERE job_id = ? AND state = ?", (job_id, COMPLETED)
+            ).fetchone()[0]
+        job = dict(row)
+        job["progress"] = job["partitions_done"] / job["total_partitions"] if job["total_partitions"] else 1.0
+        # Aggregate worker throughput (rows per second of worker time)
+        job["rows_per_worker_second"] = job["rows_done"] / seconds if seconds else 0.0
+        job["shards"] = [shard_path(job["output_dir"], i, job["format"])
+                         for i in range(job["total_partitions"])] if job["state"] == COMPLETED else []
+        return job
+
+    def list_jobs(self, limit=50):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT job_id FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        return [self.status(r["job_id"]) for r in rows]
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it already finished."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT state, output_dir FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                raise KeyError(job_id)
+            if row["state"] not in (QUEUED, RUNNING):
+                return False
+            conn.execute("UPDATE jobs SET state = ?, finished_at = ? WHERE job_id = ?",
+                         (CANCELLED, datetime.now().isoformat(), job_id))
+        # Running workers poll this marker between chunks
+        open(os.path.join(row["output_dir"], "CANCELLED"), "w").close()
+        self._wake.set()
+        return True
+
+    # ---- Dispatcher --------------------------------------------------------------
+
+    def start(self):
+        """Start the dispatcher thread (idempotent); resumes unfinished jobs."""
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="batch-job-dispatcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _next_job(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE state IN (?, ?) ORDER BY created_at LIMIT 1", (RUNNING, QUEUED)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def _run(self):
+        while not self._stop.is_set():
+            job = self._next_job()
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            try:
+                self._run_job(job)
+            except Exception as e:
+                logger.error(f"Batch job {job['job_id']} failed: {str(e)}")
+                with self._connect() as conn:
+                    conn.execute("UPDATE jobs SET state = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                                 (FAILED, str(e), datetime.now().isoformat(), job["job_id"]))
+
+    def _job_state(self, job_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT state FROM jobs WHERE job_id = ?", (job_id,)).fetchone()["state"]
+
+    def _run_job(self, job):
+        job_id = job["job_id"]
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET state = ?, started_at = COALESCE(started_at, ?) WHERE job_id = ?",
+                         (RUNNING, datetime.now().isoformat(), job_id))
+            partitions = conn.execute(
+                "SELECT idx, start_byte, end_byte, state FROM partitions WHERE job_id = ? ORDER BY idx",
+                (job_id,)
+            ).fetchall()
+        # Rows before each partition, so shards number rows across the whole input
+        start_rows, total = {}, 0
+        for p in partitions:
+            start_rows[p["idx"]] = total
+            total += count_rows(job["input_path"], p["start_byte"], p["end_byte"])
+        pending = [p for p in partitions if p["state"] != COMPLETED]
+
+        cancel_marker = os.path.join(job["output_dir"], "CANCELLED")
+        workers = min(self.max_workers, max(1, len(pending)))
+        context = multiprocessing.get_context("spawn")  # never fork the threaded API process
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(job["model_path"], TRAIN_DATA_PATH)) as executor:
+            futures = {
+                executor.submit(_score_partition, (
+                    job["input_path"], job["format"], p["start_byte"], p["end_byte"], start_rows[p["idx"]],
+                    shard_path(job["output_dir"], p["idx"], job["format"]),
+                    cancel_marker, self.chunk_rows
+                )): p["idx"]
+                for p in pending
+            }
+            while futures:
+                done, _ = wait(futures, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                if self._stop.is_set() or self._job_state(job_id) == CANCELLED:
+                    for future in futures:
+                        future.cancel()
+                    if self._stop.is_set():
+                        # Leave the job running in the store so it resumes on restart
+                        return
+                    logger.info(f"Batch job {job_id} cancelled")
+                    return
+                for future in done:
+                    idx = futures.pop(future)
+                    result = future.result()
+                    if result["cancelled"]:
+                        continue
+                    with self._connect() as conn:
+                        conn.execute("UPDATE partitions SET state = ?, rows = ?, seconds = ? "
+                                     "WHERE job_id = ? AND idx = ?",
+                                     (COMPLETED, result["rows"], result["seconds"], job_id, idx))
+                        conn.execute("UPDATE jobs SET partitions_done = partitions_done + 1, "
+                                     "rows_done = rows_done + ? WHERE job_id = ?", (result["rows"], job_id))
+
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET state = ?, finished_at = ? WHERE job_id = ? AND state = ?",
+                         (COMPLETED, datetime.now().isoformat(), job_id, RUNNING))
+        logger.info(f"Batch job {job_id} completed")
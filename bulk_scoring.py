@@ -0,0 +1,232 @@
+import io
+import json
+import logging
+import os
+import time
+import uuid
+from datetime import datetime
+import pandas as pd
+from serving import score_frame
+
+logger = logging.getLogger(__name__)
+
+CSV = "csv"
+NDJSON = "ndjson"
+
+CONTENT_TYPES = {
+    CSV: "text/csv",
+    NDJSON: "application/x-ndjson",
+}
+
+
+def detect_format(content_type=None, filename=None, explicit=None):
+    """Work out whether an upload is CSV or NDJSON."""
+    if explicit:
+        if explicit not in CONTENT_TYPES:
+            raise ValueError(f"Unsupported format: {explicit}")
+        return explicit
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    if content_type in ("application/x-ndjson", "application/jsonl", "application/json-lines"):
+        return NDJSON
+    if content_type in ("text/csv", "application/csv"):
+        return CSV
+    if filename:
+        ext = os.path.splitext(filename)[1].lower()
+        if ext in (".ndjson", ".jsonl"):
+            return NDJSON
+        if ext == ".csv":
+            return CSV
+    return CSV
+
+
+def iter_chunks(file, fmt, chunk_rows=10000, skip_rows=0):
+    """Yield raw feature DataFrames of at most `chunk_rows` rows from a file object.
+
+    pandas' chunked readers keep only one chunk in memory at a time. The
+    first `skip_rows` data rows are skipped (used when resuming a job).
+    """
+    if fmt == CSV:
+        reader = pd.read_csv(file, chunksize=chunk_rows,
+                             skiprows=range(1, skip_rows + 1) if skip_rows else None)
+    else:
+        reader = pd.read_json(file, lines=True, chunksize=chunk_rows)
+        if skip_rows:
+            reader = _skip_leading_rows(reader, skip_rows)
+    for chunk in reader:
+        yield chunk
+
+
+def peek_columns(file, fmt):
+    """Read the column names from the first record, leaving the file at its start."""
+    first_line = file.readline()
+    file.seek(0)
+    if isinstance(first_line, bytes):
+        first_line = first_line.decode("utf-8")
+    if not first_line.strip():
+        return []
+    if fmt == CSV:
+        return list(pd.read_csv(io.StringIO(first_line), nrows=0).columns)
+    return list(json.loads(first_line).keys())
+
+
+def _skip_leading_rows(chunks, skip_rows):
+    for chunk in chunks:
+        if skip_rows >= len(chunk):
+            skip_rows -= len(chunk)
+            continue
+        yield chunk.iloc[skip_rows:]
+        skip_rows = 0
+
+
+def format_results(start_row, prediction, probability, fmt, header=False):
+    """Render one chunk of scores in the response format."""
+    results = pd.DataFrame({
+        "row": range(start_row, start_row + len(prediction)),
+        "prediction": prediction,
+        "churn_probability": probability[:, 1],
+        "retention_probability": probability[:, 0],
+    })
+    if fmt == CSV:
+        return results.to_csv(index=False, header=header)
+    return results.to_json(orient="records", lines=True)
+
+
+class JobConflict(Exception):
+    """A job cannot be (re)started: it already completed or is still streaming."""
+
+
+class BulkJobStore:
+    """Persist progress of streaming bulk-scoring jobs so they can be resumed.
+
+    A job checkpointed within the last `stale_seconds` counts as still
+    streaming and cannot be resumed concurrently. Jobs that are not running
+    are kept for `retention_days`, and at most `max_jobs` files are kept.
+    """
+
+    def __init__(self, log_dir="monitoring_logs", retention_days=7, max_jobs=1000, stale_seconds=600):
+        self.job_dir = os.path.join(log_dir, "bulk_jobs")
+        os.makedirs(self.job_dir, exist_ok=True)
+        self.retention_seconds = retention_days * 86400
+        self.max_jobs = max_jobs
+        self.stale_seconds = stale_seconds
+
+    def _path(self, job_id):
+        if not job_id or not all(c.isalnum() or c in "-_" for c in job_id):
+            raise ValueError(f"Invalid job id: {job_id}")
+        return os.path.join(self.job_dir, f"{job_id}.json")
+
+    def get(self, job_id):
+        path = self._path(job_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self, job):
+        path = self._path(job["job_id"])
+        job["updated_at"] = datetime.now().isoformat()
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def _is_streaming(self, job):
+        if job["state"] != "running":
+            return False
+        updated = datetime.fromisoformat(job["updated_at"])
+        return (datetime.now() - updated).total_seconds() < self.stale_seconds
+
+    def start(self, job_id=None):
+        """Create a new job, or reopen an unfinished one for resumption.
+
+        Raises JobConflict for a completed job, or one another request is
+        still streaming (a "running" job whose checkpoints went stale was
+        abandoned, e.g. by a crashed server, and may be resumed).
+        """
+        self._apply_retention()
+        if job_id:
+            job = self.get(job_id)
+            if job is not None:
+                if job["state"] == "completed":
+                    raise JobConflict(f"Job {job_id} already completed")
+                if self._is_streaming(job):
+                    raise JobConflict(f"Job {job_id} is still running")
+                job["state"] = "running"
+                job["resumed"] = job.get("resumed", 0) + 1
+                self.save(job)
+                return job
+        job = {
+            "job_id": job_id or uuid.uuid4().hex,
+            "state": "running",
+            "rows_done": 0,
+            "rows_per_second": 0.0,
+            "elapsed_seconds": 0.0,
+            "created_at": datetime.now().isoformat(),
+            "error": None,
+        }
+        self.save(job)
+        return job
+
+    def _apply_retention(self):
+        """Drop finished or abandoned jobs past the retention period, then the oldest beyond max_jobs."""
+        now = time.time()
+        entries = sorted((e for e in os.scandir(self.job_dir) if e.name.endswith(".json")),
+                         key=lambda e: e.stat().st_mtime)
+        kept = []
+        for entry in entries:
+            if now - entry.stat().st_mtime > max(self.retention_seconds, self.stale_seconds):
+                os.remove(entry.path)  # Not checkpointed for that long, so not streaming either
+            else:
+                kept.append(entry)
+        for entry in kept[:max(0, len(kept) - self.max_jobs + 1)]:  # Room for the job being started
+            os.remove(entry.path)
+
+
+def stream_scores(model, encoder, file, fmt, job, store, chunk_rows=10000, out_fmt=None):
+    """Generator scoring `file` chunk by chunk and yielding formatted results.
+
+    Each chunk is encoded and scored with a single predict_proba call, and
+    job progress is checkpointed after every chunk so a client can resume
+    from `rows_done` after a disconnect. NDJSON output ends with a summary
+    line; CSV output that stops early because of an error ends with a
+    "# error: ..." line instead of looking like a complete file (readers
+    skip it with pandas' comment="#").
+    """
+    out_fmt = out_fmt or fmt
+    start_row = job["rows_done"]
+    prior_elapsed = job["elapsed_seconds"]
+    started = time.perf_counter()
+    header = out_fmt == CSV
+    try:
+        for chunk in iter_chunks(file, fmt, chunk_rows, skip_rows=start_row):
+            if len(chunk) == 0:
+                continue
+            missing = encoder.missing_features(chunk.columns)
+            if len(missing) > len(encoder.feature_names) / 2:
+                raise ValueError(f"Missing required features: {missing}")
+            X = encoder.encode_frame(chunk)
+            prediction, probability = score_frame(model, X)
+            yield format_results(job["rows_done"], prediction, probability, out_fmt, header=header)
+            header = False
+
+            job["rows_done"] += len(chunk)
+            job["elapsed_seconds"] = prior_elapsed + time.perf_counter() - started
+            job["rows_per_second"] = (job["rows_done"] - start_row) / max(time.perf_counter() - started, 1e-9)
+            store.save(job)
+
+        job["state"] = "completed"
+    except Exception as e:
+        logger.error(f"Bulk scoring job {job['job_id']} failed at row {job['rows_done']}: {str(e)}")
+        job["state"] = "failed"
+        job["error"] = str(e)
+    finally:
+        if job["state"] == "running":
+            # The client went away mid-stream; the job can be resumed later
+            job["state"] = "interrupted"
+        store.save(job)
+
+    if out_fmt == NDJSON:
+        yield json.dumps({"summary": job}) + "\n"
+    elif job["state"] == "failed":
+        error = " ".join(str(job["error"]).split())
+        yield f"# error: job {job['job_id']} failed at row {job['rows_done']}: {error}\n"
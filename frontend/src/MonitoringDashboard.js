@@ -3,17 +3,61 @@ import React, { useState, useEffect } from 'react';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, ResponsiveContainer } from 'recharts';
 import { ArrowLeft } from 'lucide-react';
 
+// Chart at most this many of the latest points, like the server's live feed
+const MAX_POINTS = 1000;
+
 const MonitoringDashboard = ({ onBack }) => {
   const [metrics, setMetrics] = useState(null);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
   useEffect(() => {
-    fetchMetrics();
-    const interval = setInterval(fetchMetrics, 60000); // Refresh every minute
-    return () => clearInterval(interval);
+    // Live updates: a snapshot on connect, then only new metric points.
+    // Fall back to polling once a minute if the stream is unavailable.
+    let interval = null;
+    const source = new EventSource('http://localhost:8000/api/monitoring/stream');
+    source.addEventListener('snapshot', (event) => {
+      setMetrics(formatMetrics(JSON.parse(event.data).metrics).slice(-MAX_POINTS));
+      setError(null);
+      setLoading(false);
+    });
+    source.addEventListener('metrics', (event) => {
+      const points = JSON.parse(event.data).map(formatPoint);
+      setMetrics(current => [...(current || []), ...points].slice(-MAX_POINTS));
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && !interval) {
+        fetchMetrics();
+        interval = setInterval(fetchMetrics, 60000);
+      }
+    };
+    return () => {
+      source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
+  const formatPoint = (point) => ({
+    timestamp: point.timestamp,
+    accuracy: point.accuracy,
+    precision: point.precision,
+    recall: point.recall,
+    f1_score: point.f1_score,
+    predictionCount: point.prediction_count,
+    dataDrift: point.data_drift_score
+  });
+
+  // Format columnar metrics history for charts
+  const formatMetrics = (data) => data.timestamps.map((timestamp, index) => ({
+    timestamp,
+    accuracy: data.accuracy[index],
+    precision: data.precision[index],
+    recall: data.recall[index],
+    f1_score: data.f1_score[index],
+    predictionCount: data.prediction_count[index],
+    dataDrift: data.data_drift_score[index]
+  }));
+
   const fetchMetrics = async () => {
     try {
       setLoading(true);
@@ -25,18 +69,7 @@ const MonitoringDashboard = ({ onBack }) => {
       
       const data = await response.json();
       
-      // Format data for charts
-      const formattedData = data.timestamps.map((timestamp, index) => ({
-        timestamp,
-        accuracy: data.accuracy[index],
-        precision: data.precision[index],
-        recall: data.recall[index],
-        f1_score: data.f1_score[index],
-        predictionCount: data.prediction_count[index],
-        dataDrift: data.data_drift_score[index]
-      }));
-      
-      setMetrics(formattedData);
+      setMetrics(formatMetrics(data).slice(-MAX_POINTS));
       setError(null);
     } catch (error) {
       console.error('Error fetching metrics:', error);
@@ -12,8 +12,37 @@ const TestDashboard = ({ onBack }) => {
 
   useEffect(() => {
     fetchTestResults();
-    const interval = setInterval(fetchTestResults, 30000);
-    return () => clearInterval(interval);
+    // New results are pushed by the monitoring stream; poll only if it is unavailable
+    let interval = null;
+    const source = new EventSource('http://localhost:8000/api/monitoring/stream');
+    // Sent on connect and whenever this client fell behind: replaces the results
+    source.addEventListener('snapshot', (event) => {
+      const snapshot = JSON.parse(event.data).test_results;
+      if (!snapshot || snapshot.results.length === 0) return;
+      setTestResults(snapshot);
+      setTestCategories(processTestCategories(snapshot.results));
+      setError(null);
+      setLoading(false);
+    });
+    source.addEventListener('test_results', (event) => {
+      const delta = JSON.parse(event.data);
+      setTestResults(current => {
+        const changed = new Set(delta.results.map(r => r.name));
+        const results = [...((current && current.results) || []).filter(r => !changed.has(r.name)), ...delta.results];
+        setTestCategories(processTestCategories(results));
+        return { ...delta.summary, results };
+      });
+      setError(null);
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && !interval) {
+        interval = setInterval(fetchTestResults, 30000);
+      }
+    };
+    return () => {
+      source.close();
+      if (interval) clearInterval(interval);
+    };
   }, []);
 
   const fetchTestResults = async () => {
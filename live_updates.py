@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+METRIC_COLUMNS = ["accuracy", "precision", "recall", "f1_score", "prediction_count", "data_drift_score"]
+
+
+def format_event(event):
+    """Render an event as a server-sent event frame."""
+    return f"id: {event['seq']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
+
+
+class LiveFeed:
+    """In-memory dashboard state (metrics, recent alerts, test results) with delta fan-out.
+
+    `publish` applies a delta to the snapshot and forwards it to every
+    subscriber's asyncio queue. It is safe to call from any thread. A
+    subscriber that falls `max_queue` events behind gets its backlog replaced
+    by a fresh snapshot rather than blocking publishers. Only the latest
+    `max_points` metric points are kept.
+    """
+
+    def __init__(self, max_alerts=100, max_queue=256, max_points=1000):
+        self.max_alerts = max_alerts
+        self.max_points = max_points
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._seq = 0
+        self.state = {
+            "metrics": {"timestamps": [], **{column: [] for column in METRIC_COLUMNS}},
+            "alerts": [],
+            "test_results": {"total": 0, "passed": 0, "failed": 0, "results": []},
+        }
+
+    def current(self, kind):
+        with self._lock:
+            return json.loads(json.dumps(self.state[kind]))
+
+    def snapshot(self):
+        with self._lock:
+            return {"seq": self._seq, "type": "snapshot", "data": json.loads(json.dumps(self.state))}
+
+    def _apply(self, kind, data):
+        state = self.state
+        if kind == "metrics":
+            for point in data:
+                state["metrics"]["timestamps"].append(point["timestamp"])
+                for column in METRIC_COLUMNS:
+                    state["metrics"][column].append(point.get(column))
+            for key, values in state["metrics"].items():
+                del values[:-self.max_points]
+        elif kind == "alerts":
+            state["alerts"] = (state["alerts"] + data)[-self.max_alerts:]
+        elif kind == "test_results":
+            changed = {result["name"]: result for result in data["results"]}
+            results = [r for r in state["test_results"]["results"] if r["name"] not in changed]
+            results.extend(data["results"])
+            state["test_results"] = {**data["summary"], "results": results}
+        else:
+            raise ValueError(f"Unknown event type: {kind}")
+
+    def publish(self, kind, data):
+        """Apply a delta and push it to subscribers."""
+        with self._lock:
+            self._apply(kind, data)
+            self._seq += 1
+            event = {"seq": self._seq, "type": kind, "data": data}
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:
+                self.unsubscribe((loop, queue))  # Event loop already closed
+        return event
+
+    def _offer(self, queue, event):
+        if queue.full():
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(self.snapshot())
+        else:
+            queue.put_nowait(event)
+
+    def subscribe(self):
+        """Register the current event loop; returns (subscription, initial snapshot)."""
+        subscription = (asyncio.get_running_loop(), asyncio.Queue(maxsize=self.max_queue))
+        with self._lock:
+            self._subscribers.add(subscription)
+        return subscription, self.snapshot()
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    async def events(self, is_disconnected=None, heartbeat=15.0):
+        """Async generator of SSE frames: a snapshot, then deltas, with keep-alive comments."""
+        subscription, snapshot = self.subscribe()
+        try:
+            yield format_event(snapshot)
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription[1].get(), timeout=heartbeat)
+                    yield format_event(event)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                if is_disconnected is not None and await is_disconnected():
+                    break
+        finally:
+            self.unsubscribe(subscription)
+
+
+class FeedWatcher:
+    """Feed a LiveFeed from the files other processes write.
+
+    Metric points are tailed from the append-only `model_metrics.jsonl` by
+    byte offset and alerts are read from the AlertStore index with `since`,
+    so an idle poll costs a few stat calls. Test results are not watched:
+    the ingestion endpoint publishes them as it stores each run.
+    """
+
+    def __init__(self, feed, alert_store, log_dir="monitoring_logs", interval=1.0):
+        self.feed = feed
+        self.alert_store = alert_store
+        self.metrics_json = os.path.join(log_dir, "model_metrics.json")
+        self.metrics_log = os.path.join(log_dir, "model_metrics.jsonl")
+        self.interval = interval
+        self._metrics_offset = 0
+        self._last_metric = None
+        self._last_alert = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def load(self):
+        """Build the initial snapshot from disk (the only full reads)."""
+        self._metrics_offset = os.path.getsize(self.metrics_log) if os.path.exists(self.metrics_log) else 0
+        if os.path.exists(self.metrics_json):
+            with open(self.metrics_json) as f:
+                history = json.load(f)
+            columns = {c: history.get(c) or [] for c in METRIC_COLUMNS}
+            points = [{"timestamp": ts, **{c: values[i] if i < len(values) else None
+                                           for c, values in columns.items()}}
+                      for i, ts in enumerate(history.get("timestamps", []))]
+            if points:
+                self.feed.publish("metrics", points)
+                self._last_metric = points[-1]["timestamp"]
+        alerts = self.alert_store.query(limit=self.feed.max_alerts)
+        if alerts:
+            self.feed.publish("alerts", alerts)
+            self._last_alert = alerts[-1]["timestamp"]
+
+    def poll(self):
+        self._poll_metrics()
+        self._poll_alerts()
+
+    def _poll_metrics(self):
+        if not os.path.exists(self.metrics_log) or os.path.getsize(self.metrics_log) <= self._metrics_offset:
+            return
+        with open(self.metrics_log, "rb") as f:
+            f.seek(self._metrics_offset)
+            chunk = f.read()
+        complete = chunk[:chunk.rfind(b"\n") + 1]  # Leave a partially written line for later
+        self._metrics_offset += len(complete)
+        points = [json.loads(line) for line in complete.splitlines() if line.strip()]
+        # Points already in the snapshot (written while it was loading) are skipped
+        points = [p for p in points if self._last_metric is None or p["timestamp"] > self._last_metric]
+        if points:
+            self.feed.publish("metrics", points)
+            self._last_metric = points[-1]["timestamp"]
+
+    def _poll_alerts(self):
+        from alert_store import parse_since
+        # ISO timestamps only keep microseconds, so look back a little and drop seen alerts
+        since = parse_since(self._last_alert) - 0.001 if self._last_alert else None
+        alerts = self.alert_store.query(since=since, limit=self.feed.max_alerts)
+        alerts = [a for a in alerts if self._last_alert is None or a["timestamp"] > self._last_alert]
+        if alerts:
+            self.feed.publish("alerts", alerts)
+            self._last_alert = alerts[-1]["timestamp"]
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self.load()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="live-feed-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Live feed poll failed: {str(e)}")
@@ -0,0 +1,314 @@
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import socket
+import subprocess
+import sys
+import time
+import numpy as np
+import httpx
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Representative customer used when no payload is supplied
+DEFAULT_PAYLOAD = {
+    "features": {
+        "State": "NY",
+        "Account length": 100,
+        "Area code": 408,
+        "International plan": "no",
+        "Voice mail plan": "no",
+        "Number vmail messages": 0,
+        "Total day minutes": 200,
+        "Total day calls": 100,
+        "Total day charge": 34,
+        "Total eve minutes": 200,
+        "Total eve calls": 100,
+        "Total eve charge": 17,
+        "Total night minutes": 200,
+        "Total night calls": 100,
+        "Total night charge": 9,
+        "Total intl minutes": 10,
+        "Total intl calls": 4,
+        "Total intl charge": 2.7,
+        "Customer service calls": 1
+    }
+}
+
+PERCENTILES = [50, 90, 95, 99, 99.9]
+
+
+def correct_coordinated_omission(latencies, expected_interval):
+    """Back-fill the samples a stalled closed-loop client failed to send.
+
+    Mirrors HdrHistogram's recordValueWithExpectedInterval: a response that
+    took longer than the expected interval hid the requests that would have
+    been issued meanwhile, so we add one synthetic sample per missed interval,
+    down to (and including) the interval itself.
+    """
+    latencies = np.asarray(latencies, dtype=float)
+    if expected_interval is None or expected_interval <= 0 or latencies.size == 0:
+        return latencies
+
+    corrected = [latencies]
+    for value in latencies[latencies > expected_interval]:
+        missed = np.arange(value - expected_interval, 0, -expected_interval)
+        # Like HdrHistogram, stop at the interval (with slack for float steps)
+        corrected.append(missed[missed >= expected_interval - 1e-9])
+    return np.concatenate(corrected)
+
+
+def summarize_latencies(latencies):
+    """Return count, mean, max and percentiles (in milliseconds)."""
+    latencies = np.asarray(latencies, dtype=float)
+    if latencies.size == 0:
+        return {"count": 0, "mean_ms": None, "max_ms": None,
+                **{f"p{p:g}_ms": None for p in PERCENTILES}}
+
+    values = np.percentile(latencies, PERCENTILES) * 1000
+    summary = {
+        "count": int(latencies.size),
+        "mean_ms": float(latencies.mean() * 1000),
+        "max_ms": float(latencies.max() * 1000),
+    }
+    summary.update({f"p{p:g}_ms": float(v) for p, v in zip(PERCENTILES, values)})
+    return summary
+
+
+class _Recorder:
+    """Collects per-request outcomes for a single load run."""
+
+    def __init__(self):
+        self.service_times = []
+        self.response_times = []
+        self.admitted_times = []
+        self.status_codes = {}
+        self.errors = {}
+        self.response_bytes = 0
+
+    def record(self, intended_start, actual_start, end, status=None, size=0, error=None):
+        self.service_times.append(end - actual_start)
+        self.response_times.append(end - intended_start)
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        else:
+            self.status_codes[status] = self.status_codes.get(status, 0) + 1
+            self.response_bytes += size
+            if 200 <= status < 300:
+                self.admitted_times.append(end - intended_start)
+
+
+async def _send(client, recorder, method, path, bodies, intended_start, headers=None):
+    actual_start = time.perf_counter()
+    try:
+        response = await client.request(method, path, json=next(bodies), headers=headers)
+        recorder.record(intended_start, actual_start, time.perf_counter(),
+                        status=response.status_code, size=len(response.content))
+    except Exception as e:
+        recorder.record(intended_start, actual_start, time.perf_counter(),
+                        error=type(e).__name__)
+
+
+async def _closed_loop(client, recorder, method, path, bodies, concurrency, n_requests, duration, headers):
+    """Each of `concurrency` clients sends its next request as soon as the previous one returns."""
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = [n_requests]
+
+    async def worker():
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            if n_requests is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            start = time.perf_counter()
+            await _send(client, recorder, method, path, bodies, start, headers)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def _open_loop(client, recorder, method, path, bodies, rate, n_requests, duration, max_in_flight, headers):
+    """Issue requests on a fixed arrival schedule regardless of how fast responses come back.
+
+    Latency is measured from the *intended* send time, so queueing behind a
+    slow server (or behind the in-flight limit) is charged to the request.
+    """
+    if n_requests is None:
+        n_requests = int(rate * duration)
+    interval = 1.0 / rate
+    in_flight = asyncio.Semaphore(max_in_flight)
+    t0 = time.perf_counter()
+
+    async def scheduled(intended_start):
+        async with in_flight:
+            await _send(client, recorder, method, path, bodies, intended_start, headers)
+
+    tasks = []
+    for i in range(n_requests):
+        intended_start = t0 + i * interval
+        delay = intended_start - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(scheduled(intended_start)))
+    await asyncio.gather(*tasks)
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def spawn_server(app_path="app:app", port=None, startup_timeout=30):
+    """Run the API under a local uvicorn process and yield its base URL."""
+    port = port or _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"]
+    )
+    try:
+        deadline = time.time() + startup_timeout
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                if httpx.get(f"{base_url}/api/health", timeout=1).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if time.time() > deadline:
+                raise RuntimeError(f"uvicorn did not become healthy within {startup_timeout}s")
+            time.sleep(0.2)
+        logger.info(f"Spawned uvicorn on {base_url} (pid {process.pid})")
+        yield base_url
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def run_load(target="inprocess", mode="closed", path="/api/predict", method="POST",
+                   payload=None, concurrency=10, n_requests=None, duration=None, rate=None,
+                   max_in_flight=1000, expected_interval=None, headers=None, app=None, payloads=None):
+    """Drive the API and return a latency/error report.
+
+    target:  "inprocess" to call the ASGI app directly, or a base URL.
+    mode:    "closed" (fixed concurrency) or "open" (fixed arrival `rate` per second).
+    payloads: optional request bodies sent round-robin instead of `payload`
+              (distinct bodies are not coalesced into one inference).
+    """
+    if mode not in ("closed", "open"):
+        raise ValueError(f"Unknown load mode: {mode}")
+    if mode == "open" and not rate:
+        raise ValueError("Open-loop mode requires a request rate")
+    if n_requests is None and duration is None:
+        raise ValueError("Either n_requests or duration must be given")
+    if payload is None and method == "POST":
+        payload = DEFAULT_PAYLOAD
+    bodies = itertools.cycle(payloads or [payload])
+
+    pool_size = max(concurrency, max_in_flight if mode == "open" else 0)
+    limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+    timeout = httpx.Timeout(60.0)
+    recorder = _Recorder()
+
+    async with contextlib.AsyncExitStack() as stack:
+        if target == "inprocess":
+            if app is None:
+                from app import app
+            # ASGITransport does not run startup/shutdown handlers on its own
+            await stack.enter_async_context(app.router.lifespan_context(app))
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                       base_url="http://testserver", timeout=timeout)
+        else:
+            client = httpx.AsyncClient(base_url=target, limits=limits, timeout=timeout)
+        await stack.enter_async_context(client)
+
+        started = time.perf_counter()
+        if mode == "closed":
+            await _closed_loop(client, recorder, method, path, bodies,
+                               concurrency, n_requests, duration, headers)
+        else:
+            await _open_loop(client, recorder, method, path, bodies,
+                             rate, n_requests, duration, max_in_flight, headers)
+        elapsed = time.perf_counter() - started
+
+    total = len(recorder.service_times)
+    ok = sum(n for code, n in recorder.status_codes.items() if 200 <= code < 300)
+    if mode == "open":
+        corrected = recorder.response_times
+    else:
+        if expected_interval is None and recorder.service_times:
+            expected_interval = float(np.median(recorder.service_times))
+        corrected = correct_coordinated_omission(recorder.service_times, expected_interval)
+
+    return {
+        "mode": mode,
+        "target": target,
+        "total_requests": total,
+        "successful_requests": ok,
+        "failed_requests": total - ok,
+        "status_codes": recorder.status_codes,
+        "errors": recorder.errors,
+        "elapsed_seconds": elapsed,
+        "requests_per_second": total / elapsed if elapsed > 0 else 0.0,
+        "mean_response_bytes": recorder.response_bytes / ok if ok else 0.0,
+        "offered_rate": rate if mode == "open" else None,
+        "service_latency": summarize_latencies(recorder.service_times),
+        "corrected_latency": summarize_latencies(corrected),
+        # 2xx responses only, from the intended start (admission control sheds the rest)
+        "admitted_latency": summarize_latencies(recorder.admitted_times),
+    }
+
+
+def run_load_test(**kwargs):
+    """Synchronous wrapper around run_load, for tests and the CLI."""
+    return asyncio.run(run_load(**kwargs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load generator for the ML Pipeline API")
+    parser.add_argument("--target", default="inprocess",
+                        help="'inprocess', 'spawn' (start a local uvicorn), or a base URL")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed")
+    parser.add_argument("--path", default="/api/predict")
+    parser.add_argument("--concurrency", type=int, default=100,
+                        help="Concurrent clients in closed-loop mode (default: 100)")
+    parser.add_argument("--rate", type=float, help="Arrival rate (requests/s) in open-loop mode")
+    parser.add_argument("--requests", type=int, dest="n_requests", help="Total requests to send")
+    parser.add_argument("--duration", type=float, help="Run length in seconds")
+    parser.add_argument("--max-in-flight", type=int, default=1000,
+                        help="Open-loop cap on outstanding requests (default: 1000)")
+    parser.add_argument("--payload", help="Path to a JSON request body")
+    args = parser.parse_args(argv)
+
+    payload = None
+    if args.payload:
+        with open(args.payload) as f:
+            payload = json.load(f)
+
+    options = dict(mode=args.mode, path=args.path, payload=payload,
+                   concurrency=args.concurrency, rate=args.rate,
+                   n_requests=args.n_requests, duration=args.duration,
+                   max_in_flight=args.max_in_flight)
+    if args.target == "spawn":
+        with spawn_server() as base_url:
+            report = run_load_test(target=base_url, **options)
+    else:
+        report = run_load_test(target=args.target, **options)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
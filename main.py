@@ -1,7 +1,16 @@
 import argparse
 import os
+import pickle
+import pandas as pd
 from pathlib import Path
-from model_pipeline import prepare_data, train_model, evaluate_model, save_model, load_model
+from model_pipeline import (
+    prepare_data, train_model, train_candidates, evaluate_model, save_model, load_model,
+    cross_validate, compact_model, metadata_path, record_model_metrics, update_model_metadata,
+    split_calibration_data, calibrate_model, MODEL_BACKENDS, benchmark_backends, format_backend_table
+)
+from model_store import ModelStore
+from pipeline_runner import PipelineRunner, Stage, format_report
+from profiling import Profiler
 import logging
 
 # Configure logging
@@ -12,20 +21,34 @@ logger = logging.getLogger(__name__)
 train_file = "churn-bigml-80.csv"
 test_file = "churn-bigml-20.csv"
 
+# Versioned model history (see model_store.ModelStore); model.pkl is always a
+# copy of its current version
+model_store_dir = "model_store"
+
+# Modules the cached pipeline stages call into; changing any of them
+# invalidates those stages (see pipeline_runner._code_fingerprint)
+pipeline_modules = ["model_pipeline", "serving", "sklearn", "numpy", "pandas"]
+
 # Setup argument parser
-parser = argparse.ArgumentParser(description="Random Forest Model Pipeline Controller")
+parser = argparse.ArgumentParser(description="Churn Model Pipeline Controller")
 parser.add_argument(
     "action",
     type=str,
     nargs="?",
     default="all",
-    help="Action to perform: prepare_data, train_model, evaluate_model, save_model, load_model, or run all steps by default."
+    help="Action to perform: prepare_data, train_model, evaluate_model, save_model, load_model, cross_validate, compact_model, permutation_importance, benchmark_models, versions, rollback, or run all steps by default."
+)
+parser.add_argument(
+    "--model",
+    choices=MODEL_BACKENDS,
+    default="random_forest",
+    help="Model backend: random_forest or hist_gbm (histogram gradient boosting) (default: random_forest)"
 )
 parser.add_argument(
     "--n_estimators",
     type=int,
     default=100,
-    help="Number of trees in the Random Forest (default: 100)"
+    help="Number of trees in the Random Forest, or boosting iterations for hist_gbm (default: 100)"
 )
 parser.add_argument(
     "--max_depth",
@@ -33,28 +56,179 @@ parser.add_argument(
     default=10,
     help="Maximum depth of trees (default: 10)"
 )
+parser.add_argument(
+    "--folds",
+    type=int,
+    default=5,
+    help="Number of stratified folds for cross_validate (default: 5)"
+)
+parser.add_argument(
+    "--repeats",
+    type=int,
+    default=1,
+    help="Number of repeated CV rounds for cross_validate, or shuffles per feature for permutation_importance (default: 1)"
+)
+parser.add_argument(
+    "--accuracy_budget",
+    type=float,
+    default=0.005,
+    help="Accuracy the compact model may lose on validation data when pruning trees (default: 0.005)"
+)
+parser.add_argument(
+    "--no_prune",
+    action="store_true",
+    help="Keep every tree when running compact_model (quantization only)"
+)
+parser.add_argument(
+    "--candidates",
+    type=str,
+    help="Train several configurations in parallel and keep the most accurate, "
+         "e.g. \"100:10,200:12,300:None\" (n_estimators:max_depth)"
+)
+parser.add_argument(
+    "--calibration",
+    choices=["isotonic", "platt"],
+    help="Hold out 20%% of the training data and fit this probability calibration on it"
+)
+parser.add_argument(
+    "--version",
+    type=str,
+    help="Model version (or unique prefix) for rollback; defaults to the previously current version"
+)
+parser.add_argument(
+    "--keep_versions",
+    type=int,
+    default=5,
+    help="Number of model versions kept in the model store, besides the current one and its predecessor (default: 5)"
+)
+parser.add_argument(
+    "--no-cache",
+    action="store_true",
+    help="Re-run every pipeline stage even if its inputs have not changed"
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Profile the run (call tree and allocations) into monitoring_logs/profiles/"
+)
 
-def run_full_pipeline():
-    """Run the complete ML pipeline."""
-    try:
-        logger.info("Running full Random Forest pipeline...")
-        
-        logger.info("🔹 Preparing data...")
-        X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+def parse_candidates(spec, model_type="random_forest"):
+    """Parse "n_estimators:max_depth,..." into a list of training configs."""
+    configs = []
+    for item in spec.split(","):
+        n_estimators, _, max_depth = item.strip().partition(":")
+        configs.append({
+            "model_type": model_type,
+            "n_estimators": int(n_estimators),
+            "max_depth": int(max_depth) if max_depth and max_depth.lower() != "none" else None
+        })
+    return configs
+
+def _fit_data(data, calibration):
+    """Training rows for the forest; a held-out part is kept back when calibrating."""
+    X_train, X_test, y_train, y_test = data
+    if not calibration:
+        return X_train, y_train
+    X_fit, X_cal, y_fit, y_cal = split_calibration_data(X_train, y_train)
+    return X_fit, y_fit
 
-        logger.info(f"🔹 Training Random Forest model (trees: {args.n_estimators}, max_depth: {args.max_depth})...")
-        model = train_model(X_train, y_train, n_estimators=args.n_estimators, max_depth=args.max_depth)
+def _train_stage(data, n_estimators, max_depth, calibration=None, model_type="random_forest"):
+    X_fit, y_fit = _fit_data(data, calibration)
+    return train_model(X_fit, y_fit, n_estimators=n_estimators, max_depth=max_depth, model_type=model_type)
 
-        logger.info("🔹 Evaluating model...")
-        evaluate_model(model, X_test, y_test)
+def _train_candidates_stage(data, configs, calibration=None):
+    X_fit, y_fit = _fit_data(data, calibration)
+    # Rank on a validation split of the training rows so the test set stays
+    # unseen until evaluate_model, then refit the winner on all of them
+    X_sel, X_val, y_sel, y_val = split_calibration_data(X_fit, y_fit)
+    results = train_candidates(X_sel, y_sel, X_val, y_val, configs)
+    best = results[0]
+    logger.info(f"Selected candidate {best['config']} (validation accuracy {best['accuracy']:.4f})")
+    config = {key: value for key, value in best["config"].items() if key != "n_jobs"}
+    return train_model(X_fit, y_fit, **config)
 
-        logger.info("🔹 Saving model...")
-        save_model(model)
+def _calibrate_stage(data, model, method):
+    X_train, X_test, y_train, y_test = data
+    X_fit, X_cal, y_fit, y_cal = split_calibration_data(X_train, y_train)
+    return calibrate_model(model, X_cal, y_cal, method)
 
-        logger.info("🔹 Loading and re-evaluating model...")
-        loaded_model = load_model()
-        evaluate_model(loaded_model, X_test, y_test)
+def _evaluate_stage(data, model):
+    X_train, X_test, y_train, y_test = data
+    return evaluate_model(model, X_test, y_test, return_metrics=True)
+
+def _save_stage(model, filename):
+    save_model(model, filename)
+    return filename
+
+def _record_metrics_stage(filename, metrics):
+    record_model_metrics(filename, metrics)
+    return metadata_path(filename)
+
+def _publish_stage(meta_file, model_file, store_dir, keep_versions):
+    from model_pipeline import read_model_metadata
+    from serving import FeatureEncoder
+    with open(model_file, "rb") as f:
+        payload = f.read()
+    encoder = FeatureEncoder.from_training_data(train_file)
+    store = ModelStore(store_dir, keep_last=keep_versions)
+    return store.publish(payload, pickle.dumps(encoder), read_model_metadata(model_file))
+
+def build_pipeline(n_estimators, max_depth, candidates=None, model_file="model.pkl",
+                   store_dir=model_store_dir, keep_versions=5, calibration=None, model_type="random_forest"):
+    """Describe the full pipeline as a DAG; evaluation and saving run concurrently.
+
+    With `calibration` ("isotonic" or "platt") the forest is trained on part
+    of the training data and a calibrator is fitted on the rest. Test metrics
+    are merged into the saved model's manifest once both finish, and the
+    result is then published to the model store as its current version.
+    """
+    if candidates:
+        train = Stage("train_model", _train_candidates_stage, deps=["prepare_data"],
+                      params={"configs": candidates, "calibration": calibration}, modules=pipeline_modules)
+    else:
+        train = Stage("train_model", _train_stage, deps=["prepare_data"],
+                      params={"n_estimators": n_estimators, "max_depth": max_depth, "calibration": calibration,
+                              "model_type": model_type}, modules=pipeline_modules)
+    stages = [
+        Stage("prepare_data", prepare_data, params={"train_path": train_file, "test_path": test_file},
+              files=[train_file, test_file], modules=pipeline_modules),
+        train,
+    ]
+    model_stage = "train_model"
+    if calibration:
+        stages.append(Stage("calibrate_model", _calibrate_stage, deps=["prepare_data", "train_model"],
+                            params={"method": calibration}, modules=pipeline_modules))
+        model_stage = "calibrate_model"
+    return stages + [
+        Stage("evaluate_model", _evaluate_stage, deps=["prepare_data", model_stage], modules=pipeline_modules),
+        # Re-runs whenever model.pkl or its manifest changed since the last run
+        # (e.g. after a rollback), so the new model is saved and published again
+        Stage("save_model", _save_stage, deps=[model_stage], params={"filename": model_file},
+              outputs=[model_file, metadata_path(model_file)], modules=pipeline_modules),
+        # Cheap, and must re-run whenever save_model rewrites the manifest
+        Stage("record_metrics", _record_metrics_stage, deps=["save_model", "evaluate_model"],
+              cache=False),
+        # Content-addressed, so re-publishing an unchanged model only re-activates it
+        Stage("publish_model", _publish_stage, deps=["record_metrics"], cache=False,
+              params={"model_file": model_file, "store_dir": store_dir, "keep_versions": keep_versions}),
+    ]
+
+def run_full_pipeline():
+    """Run the complete ML pipeline."""
+    try:
+        logger.info(f"Running full {args.model} pipeline...")
+        candidates = parse_candidates(args.candidates, args.model) if args.candidates else None
+        runner = PipelineRunner(
+            build_pipeline(args.n_estimators, args.max_depth, candidates, keep_versions=args.keep_versions,
+                           calibration=args.calibration, model_type=args.model),
+            use_cache=not args.no_cache
+        )
+        outputs, report = runner.run()
         
+        metrics = outputs["evaluate_model"]
+        logger.info(f"Model accuracy: {metrics['accuracy']:.4f} (ECE {metrics['ece']:.4f}, Brier {metrics['brier']:.4f})")
+        logger.info(f"Model version: {outputs['publish_model']}")
+        logger.info(f"Stage timings:\n{format_report(report)}")
         logger.info("Pipeline completed successfully!")
         
     except Exception as e:
@@ -63,41 +237,104 @@ def run_full_pipeline():
 
 if __name__ == "__main__":
     args = parser.parse_args()
+    profiler = Profiler()
     
     try:
-        if args.action == "prepare_data":
-            logger.info("🔹 Preparing data...")
-            X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
-
-        elif args.action == "train_model":
-            logger.info(f"🔹 Training Random Forest model...")
-            X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
-            model = train_model(X_train, y_train, n_estimators=args.n_estimators, max_depth=args.max_depth)
-
-        elif args.action == "evaluate_model":
-            logger.info("🔹 Evaluating model...")
-            X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
-            model = train_model(X_train, y_train, n_estimators=args.n_estimators, max_depth=args.max_depth)
-            evaluate_model(model, X_test, y_test)
-
-        elif args.action == "save_model":
-            logger.info("🔹 Saving model...")
-            X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
-            model = train_model(X_train, y_train, n_estimators=args.n_estimators, max_depth=args.max_depth)
-            save_model(model)
-
-        elif args.action == "load_model":
-            logger.info("🔹 Loading model and re-evaluating...")
-            X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
-            loaded_model = load_model()
-            evaluate_model(loaded_model, X_test, y_test)
-
-        elif args.action == "all":
-            run_full_pipeline()
-
-        else:
-            logger.error("Invalid action! Choose from: prepare_data, train_model, evaluate_model, save_model, load_model, or leave blank to run all.")
-            exit(1)
+        with profiler.profile(f"main_{args.action}", enabled=args.profile):
+            if args.action == "prepare_data":
+                logger.info("🔹 Preparing data...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+
+            elif args.action == "train_model":
+                logger.info(f"🔹 Training {args.model} model...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                model = train_model(X_train, y_train, n_estimators=args.n_estimators, max_depth=args.max_depth, model_type=args.model)
+
+            elif args.action == "evaluate_model":
+                logger.info("🔹 Evaluating model...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                model = train_model(X_train, y_train, n_estimators=args.n_estimators, max_depth=args.max_depth, model_type=args.model)
+                evaluate_model(model, X_test, y_test)
+
+            elif args.action == "save_model":
+                logger.info("🔹 Saving model...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                model = train_model(X_train, y_train, n_estimators=args.n_estimators, max_depth=args.max_depth, model_type=args.model)
+                # model.pkl must stay the export of the store's current version
+                save_model(model)
+                version = _publish_stage(metadata_path("model.pkl"), "model.pkl", model_store_dir, args.keep_versions)
+                logger.info(f"Model version: {version}")
+
+            elif args.action == "load_model":
+                logger.info("🔹 Loading model and re-evaluating...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                loaded_model = load_model()
+                evaluate_model(loaded_model, X_test, y_test)
+
+            elif args.action == "cross_validate":
+                logger.info(f"🔹 Cross-validating ({args.repeats}x{args.folds} folds)...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                X = pd.concat([X_train, X_test], ignore_index=True)
+                y = pd.concat([y_train, y_test], ignore_index=True)
+                cross_validate(X, y, n_splits=args.folds, n_repeats=args.repeats,
+                               n_estimators=args.n_estimators, max_depth=args.max_depth, model_type=args.model)
+
+            elif args.action == "compact_model":
+                logger.info("🔹 Compacting saved model for serving...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                model = load_model()
+                # Prune against a validation split of the training data (the
+                # calibration hold-out when the model was calibrated) and
+                # report on the untouched test set
+                X_fit, X_val, y_fit, y_val = split_calibration_data(X_train, y_train)
+                compact, report = compact_model(model, X_val, y_val,
+                                                accuracy_budget=args.accuracy_budget,
+                                                prune=not args.no_prune,
+                                                X_test=X_test, y_test=y_test)
+                save_model(compact, "model_compact.pkl",
+                           metrics={"accuracy": report["accuracy"]["compact"]})
+                logger.info(f"{'':<16} {'original':>12} {'compact':>12}")
+                for metric, values in report.items():
+                    cells = [f"{v:>12}" if isinstance(v, int) else f"{v:>12.4f}"
+                             for v in (values["original"], values["compact"])]
+                    logger.info(f"{metric:<16} {' '.join(cells)}")
+                logger.info("Serve it with MODEL_PATH=model_compact.pkl")
+
+            elif args.action == "permutation_importance":
+                logger.info(f"🔹 Computing permutation importance ({args.repeats} repeats)...")
+                from explanations import permutation_importance
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                result = permutation_importance(load_model(), X_test, y_test, n_repeats=args.repeats)
+                update_model_metadata("model.pkl", permutation_importance=result)
+                logger.info("Stored in model.meta.json (served by /api/model/metadata)")
+
+            elif args.action == "benchmark_models":
+                logger.info("🔹 Benchmarking model backends...")
+                X_train, X_test, y_train, y_test = prepare_data(train_file, test_file)
+                rows = benchmark_backends(X_train, y_train, X_test, y_test,
+                                          n_estimators=args.n_estimators, max_depth=args.max_depth)
+                logger.info(f"\n{format_backend_table(rows)}")
+
+            elif args.action == "versions":
+                store = ModelStore(model_store_dir)
+                for entry in store.versions():
+                    accuracy = entry["metrics"].get("accuracy")
+                    logger.info(f"{'*' if entry['current'] else ' '} {entry['version']}  {entry['created_at']}"
+                                f"  accuracy={accuracy if accuracy is not None else 'n/a'}")
+
+            elif args.action == "rollback":
+                store = ModelStore(model_store_dir, keep_last=args.keep_versions)
+                version = store.rollback(args.version)
+                store.export(version, "model.pkl")
+                logger.info(f"Rolled back to model version {version} (model.pkl updated; "
+                            f"servers with MODEL_PATH={model_store_dir} switch on their next request)")
+
+            elif args.action == "all":
+                run_full_pipeline()
+
+            else:
+                logger.error("Invalid action! Choose from: prepare_data, train_model, evaluate_model, save_model, load_model, cross_validate, compact_model, permutation_importance, benchmark_models, versions, rollback, or leave blank to run all.")
+                exit(1)
 
     except Exception as e:
         logger.error(f"\n❌ Error: {str(e)}")
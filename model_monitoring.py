@@ -2,16 +2,72 @@ import pandas as pd
 import numpy as np
 import json
 import time
-import matplotlib.pyplot as plt
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 import os
 from datetime import datetime
 
+# Sub-populations evaluated separately by log_batch_metrics; slices with
+# fewer rows than the minimum support are not reported
+SLICE_COLUMNS = ["State", "International plan", "Voice mail plan", "Area code"]
+MIN_SLICE_SUPPORT = 30
+
+def slice_metrics(X, y_true, y_pred, columns=SLICE_COLUMNS, min_support=MIN_SLICE_SUPPORT, labels=None):
+    """Confusion matrix and metrics for every value of each slice column.
+
+    Every (column, value) slice gets an id; combined with the true and
+    predicted label that gives one key per row per column, and a single
+    bincount over all keys yields every slice's confusion matrix at once.
+    `labels` optionally maps a column to the names of its encoded values.
+    """
+    y_true = np.asarray(y_true).astype(np.int64)
+    y_pred = np.asarray(y_pred).astype(np.int64)
+    columns = [column for column in columns if column in X.columns]
+    keys, names, offset = [], [], 0
+    for column in columns:
+        values, slice_ids = np.unique(X[column].to_numpy(), return_inverse=True)
+        keys.append((offset + slice_ids) * 4 + y_true * 2 + y_pred)
+        names.extend((column, value) for value in values)
+        offset += len(values)
+    if not names:
+        return []
+    counts = np.bincount(np.concatenate(keys), minlength=offset * 4).reshape(offset, 4)
+    tn, fp, fn, tp = counts.T
+    support = counts.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        accuracy = (tn + tp) / support
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    overall = float(np.mean(y_true == y_pred)) if len(y_true) else 0.0
+
+    slices = []
+    for i in np.flatnonzero(support >= min_support):
+        column, value = names[i]
+        value = value.item() if hasattr(value, "item") else value
+        if labels and column in labels and isinstance(value, int):
+            value = labels[column][value]
+        slices.append({
+            "column": column, "value": value, "support": int(support[i]),
+            "tn": int(tn[i]), "fp": int(fp[i]), "fn": int(fn[i]), "tp": int(tp[i]),
+            "accuracy": float(accuracy[i]), "precision": float(precision[i]),
+            "recall": float(recall[i]), "f1_score": float(f1[i]),
+            "accuracy_delta": float(accuracy[i]) - overall,
+        })
+    # Worst slices first within each column
+    return sorted(slices, key=lambda s: (columns.index(s["column"]), s["accuracy"]))
+
+def _slice_labels():
+    """Names of the encoded categorical values (label-encoded and yes/no columns)."""
+    from serving import get_encoder, BOOLEAN_COLUMNS
+    labels = {column: [str(v) for v in classes] for column, classes in get_encoder().categorical_classes.items()}
+    labels.update({column: ["no", "yes"] for column in BOOLEAN_COLUMNS})
+    return labels
+
 class ModelMonitor:
     def __init__(self, log_dir="monitoring_logs"):
         self.log_dir = log_dir
         os.makedirs(log_dir, exist_ok=True)
         self.metrics_file = os.path.join(log_dir, "model_metrics.json")
+        self.slice_file = os.path.join(log_dir, "slice_metrics.jsonl")
         self.initialize_metrics_file()
         
     def initialize_metrics_file(self):
@@ -28,14 +84,15 @@ class ModelMonitor:
             with open(self.metrics_file, 'w') as f:
                 json.dump(initial_data, f)
     
-    def log_prediction(self, features, prediction, actual=None):
-        """Log a single prediction for monitoring"""
+    def log_prediction(self, features, prediction, actual=None, count=1):
+        """Log a prediction for monitoring; `count` is how many coalesced requests it answered"""
         timestamp = datetime.now().isoformat()
         log_entry = {
             "timestamp": timestamp,
             "features": features,
             "prediction": prediction,
-            "actual": actual
+            "actual": actual,
+            "count": count
         }
         
         # Log to predictions file
@@ -45,8 +102,10 @@ class ModelMonitor:
         # Update summary metrics for real-time monitoring
         self._update_summary_metrics()
     
-    def log_batch_metrics(self, y_true, y_pred, X_test=None):
-        """Log metrics from a batch evaluation"""
+    def log_batch_metrics(self, y_true, y_pred, X_test=None, visualize=True, slice_columns=SLICE_COLUMNS,
+                          min_support=MIN_SLICE_SUPPORT):
+        """Log metrics from a batch evaluation, plus per-slice metrics when features are given"""
+        from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
         metrics = {
             "timestamp": datetime.now().isoformat(),
             "accuracy": accuracy_score(y_true, y_pred),
@@ -72,12 +131,43 @@ class ModelMonitor:
         # Save updated metrics
         with open(self.metrics_file, 'w') as f:
             json.dump(data, f)
+        
+        # Append-only copy of each point, tailed by the API's live feed
+        with open(os.path.join(self.log_dir, "model_metrics.jsonl"), "a") as f:
+            f.write(json.dumps(metrics) + "\n")
+        
+        # Per-slice metrics for the same evaluation, keyed by its timestamp
+        if hasattr(X_test, "columns") and slice_columns:
+            slices = slice_metrics(X_test, y_true, y_pred, slice_columns, min_support, _slice_labels())
+            with open(self.slice_file, "a") as f:
+                f.write(json.dumps({"timestamp": metrics["timestamp"], "min_support": min_support,
+                                    "slices": slices}) + "\n")
             
         # Generate visualizations
-        self.generate_metrics_visualizations()
+        if visualize:
+            self.generate_metrics_visualizations()
         
         return metrics
     
+    def slice_history(self, limit=1):
+        """The newest `limit` sliced evaluations, newest first."""
+        if not os.path.exists(self.slice_file):
+            return []
+        from collections import deque
+        with open(self.slice_file) as f:
+            entries = deque((line for line in f if line.strip()), maxlen=limit)
+        return [json.loads(line) for line in reversed(entries)]
+    
+    def log_cross_validation(self, cv_results):
+        """Append a cross-validation summary (without per-fold detail) to the CV history"""
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            **{k: v for k, v in cv_results.items() if k != "folds"}
+        }
+        with open(os.path.join(self.log_dir, "cross_validation.jsonl"), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return entry
+    
     def _calculate_data_drift(self, X_test):
         """
         Calculate a simple data drift score
@@ -95,6 +185,8 @@ class ModelMonitor:
     
     def generate_metrics_visualizations(self):
         """Generate visualizations of model metrics over time"""
+        # Plotting is only needed for batch evaluation, never on the serving path
+        import matplotlib.pyplot as plt
         with open(self.metrics_file, 'r') as f:
             data = json.load(f)
         
@@ -1,10 +1,15 @@
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report
 import pickle
+import hashlib
+import json
 import logging
+import os
+import time
+from datetime import datetime
+
+# sklearn is imported inside the functions that need it so that serving code
+# importing this module (e.g. for load_model) does not pay for training imports.
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +17,7 @@ logger = logging.getLogger(__name__)
 
 def prepare_data(train_path, test_path, target_column='Churn'):
     """Load and preprocess the dataset."""
+    from sklearn.preprocessing import LabelEncoder
     try:
         # Load dataset
         logger.info(f"Loading data from {train_path} and {test_path}")
@@ -54,18 +60,66 @@ def prepare_data(train_path, test_path, target_column='Churn'):
         logger.error(f"Error in data preparation: {str(e)}")
         raise
 
-def train_model(X_train, y_train, n_estimators=100, max_depth=10):
-    """Train a Random Forest classifier model."""
+# Model backends. Every backend takes the same encoded frame (prepare_data /
+# serving.FeatureEncoder) and exposes predict_proba, classes_,
+# feature_names_in_ and feature_importances_, so saving, serving,
+# calibration and monitoring do not depend on the backend
+MODEL_BACKENDS = ("random_forest", "hist_gbm")
+
+def make_model(model_type="random_forest", n_estimators=100, max_depth=10, n_jobs=-1, random_state=42):
+    """Unfitted classifier for a backend; for hist_gbm, n_estimators is the number of boosting iterations."""
+    if model_type == "random_forest":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier(n_estimators=n_estimators, max_depth=max_depth,
+                                      random_state=random_state, n_jobs=n_jobs)
+    if model_type == "hist_gbm":
+        from sklearn.ensemble import HistGradientBoostingClassifier
+        # Takes no n_jobs: its OpenMP threads are capped with _thread_limit in
+        # parallel workers. The label-encoded State is split as a category
+        return HistGradientBoostingClassifier(max_iter=n_estimators, max_depth=max_depth,
+                                              categorical_features=["State"], early_stopping=False,
+                                              random_state=random_state)
+    raise ValueError(f"Unknown model type: {model_type} (choose from {', '.join(MODEL_BACKENDS)})")
+
+def _thread_limit(n_jobs):
+    """Cap the native (OpenMP/BLAS) threads of the enclosed fits and predictions at n_jobs."""
+    from threadpoolctl import threadpool_limits
+    return threadpool_limits(limits=n_jobs if n_jobs and n_jobs > 0 else None)
+
+def _native_threads():
+    from threadpoolctl import threadpool_info
+    return max([pool["num_threads"] for pool in threadpool_info()], default=1)
+
+def model_backend(model):
+    """The (model_type, n_estimators, max_depth) a fitted model was built with."""
+    if not hasattr(model, "get_params"):  # CompactForest
+        return "random_forest", model.n_estimators, None
+    params = model.get_params()
+    if "max_iter" in params:
+        return "hist_gbm", params["max_iter"], params["max_depth"]
+    return "random_forest", params["n_estimators"], params["max_depth"]
+
+def _ensure_feature_importances(model, X, y, max_rows=2000):
+    """Give backends without impurity importances a permutation-based `feature_importances_`."""
+    if hasattr(model, "feature_importances_"):
+        return
+    from explanations import permutation_importance
+    rows = np.random.default_rng(42).permutation(len(X))[:max_rows]
+    result = permutation_importance(model, X.iloc[rows], np.asarray(y)[rows], n_repeats=1)
+    importance = {f["name"]: max(f["importance_mean"], 0.0) for f in result["features"]}
+    values = np.array([importance[str(c)] for c in X.columns])
+    model.feature_importances_ = values / values.sum() if values.sum() > 0 else np.full(len(values), 1 / len(values))
+
+def train_model(X_train, y_train, n_estimators=100, max_depth=10, model_type="random_forest"):
+    """Train a classifier (Random Forest by default; see MODEL_BACKENDS)."""
     try:
-        model = RandomForestClassifier(
-            n_estimators=n_estimators,
-            max_depth=max_depth,
-            random_state=42,
-            n_jobs=-1  # Use all available cores
-        )
+        model = make_model(model_type, n_estimators, max_depth)
         
-        logger.info("Training Random Forest model...")
+        logger.info(f"Training {type(model).__name__} model...")
+        start = time.perf_counter()
         model.fit(X_train, y_train)
+        model.training_metadata_ = _training_metadata(X_train, y_train, time.perf_counter() - start)
+        _ensure_feature_importances(model, X_train, y_train)
         
         # Print feature importance
         feature_importance = pd.DataFrame({
@@ -81,10 +135,44 @@ def train_model(X_train, y_train, n_estimators=100, max_depth=10):
         logger.error(f"Error in model training: {str(e)}")
         raise
 
-def evaluate_model(model, X_test, y_test):
-    """Evaluate the model performance."""
+def benchmark_backends(X_train, y_train, X_test, y_test, backends=MODEL_BACKENDS,
+                       n_estimators=100, max_depth=10, repeats=50):
+    """Fit each backend and measure fit time, per-row latency, model size and accuracy."""
+    from sklearn.metrics import accuracy_score
+    from serving import score_frame
+    rows = []
+    single = X_test.iloc[0:1]
+    for model_type in backends:
+        model = train_model(X_train, y_train, n_estimators, max_depth, model_type)
+        rows.append({
+            "model": model_type,
+            "fit_seconds": model.training_metadata_["fit_seconds"],
+            "single_row_ms": _time_predict(model, single, repeats) * 1000,
+            "batch_us_per_row": _time_predict(model, X_test, 5) / len(X_test) * 1e6,
+            "size_kb": len(pickle.dumps(model)) / 1024,
+            "accuracy": float(accuracy_score(y_test, score_frame(model, X_test)[0])),
+        })
+    return rows
+
+def format_backend_table(rows):
+    header = f"{'model':<15} {'fit s':>8} {'1-row ms':>9} {'batch us/row':>13} {'size KB':>9} {'accuracy':>9}"
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(f"{row['model']:<15} {row['fit_seconds']:>8.2f} {row['single_row_ms']:>9.3f} "
+                     f"{row['batch_us_per_row']:>13.2f} {row['size_kb']:>9.0f} {row['accuracy']:>9.4f}")
+    return "\n".join(lines)
+
+def evaluate_model(model, X_test, y_test, return_metrics=False):
+    """Evaluate the model performance.
+
+    Returns the accuracy, or with `return_metrics` a dict that also holds
+    the reliability of the served (calibrated, if any) churn probabilities.
+    Both grade the predictions as served (serving.score_frame).
+    """
+    from sklearn.metrics import accuracy_score, classification_report
+    from serving import score_frame
     try:
-        y_pred = model.predict(X_test)
+        y_pred, probability = score_frame(model, X_test)
         accuracy = accuracy_score(y_test, y_pred)
         logger.info(f'Model Accuracy: {accuracy:.4f}')
         
@@ -92,18 +180,129 @@ def evaluate_model(model, X_test, y_test):
         report = classification_report(y_test, y_pred)
         logger.info(f"\nClassification Report:\n{report}")
         
+        # How well churn probabilities match observed churn rates
+        reliability = reliability_metrics(y_test, probability[:, 1])
+        logger.info(f"Calibration: ECE {reliability['ece']:.4f}, Brier {reliability['brier']:.4f}"
+                    f"{'' if hasattr(model, 'calibrator_') else ' (uncalibrated)'}")
+        
+        if return_metrics:
+            return {"accuracy": accuracy, **reliability}
         return accuracy
         
     except Exception as e:
         logger.error(f"Error in model evaluation: {str(e)}")
         raise
 
-def save_model(model, filename="model.pkl"):
-    """Save the trained model to a file."""
+def reliability_metrics(y_true, churn_probability, n_bins=10):
+    """Expected calibration error (equal-width bins) and Brier score of churn probabilities."""
+    y_true = np.asarray(y_true, dtype=np.float64)
+    p = np.asarray(churn_probability, dtype=np.float64)
+    bins = np.minimum((p * n_bins).astype(np.int64), n_bins - 1)
+    # Per-bin |observed - predicted| churn counts, from two weighted bincounts
+    gap = np.bincount(bins, weights=y_true, minlength=n_bins) - np.bincount(bins, weights=p, minlength=n_bins)
+    return {"ece": float(np.abs(gap).sum() / len(p)), "brier": float(np.mean((p - y_true) ** 2))}
+
+class ProbabilityCalibrator:
+    """Monotone map from raw to calibrated churn probability, stored as a lookup table.
+
+    Isotonic regression is exactly a piecewise-linear function through its
+    thresholds; Platt scaling (a logistic fit on the log-odds) is tabulated
+    on a fine grid. Either way serving is a single np.interp call.
+    """
+
+    def __init__(self, method, x, y):
+        self.method = method
+        self.x = np.asarray(x, dtype=np.float64)
+        self.y = np.asarray(y, dtype=np.float64)
+
+    @classmethod
+    def fit(cls, churn_probability, y_true, method="isotonic", grid_size=1001):
+        p = np.asarray(churn_probability, dtype=np.float64)
+        y_true = np.asarray(y_true)
+        if method == "isotonic":
+            from sklearn.isotonic import IsotonicRegression
+            iso = IsotonicRegression(y_min=0.0, y_max=1.0, out_of_bounds="clip").fit(p, y_true)
+            return cls(method, iso.X_thresholds_, iso.y_thresholds_)
+        if method == "platt":
+            from sklearn.linear_model import LogisticRegression
+            def log_odds(values):
+                values = np.clip(values, 1e-4, 1 - 1e-4)
+                return np.log(values / (1 - values)).reshape(-1, 1)
+            platt = LogisticRegression().fit(log_odds(p), y_true)
+            grid = np.linspace(0.0, 1.0, grid_size)
+            return cls(method, grid, platt.predict_proba(log_odds(grid))[:, 1])
+        raise ValueError(f"Unknown calibration method: {method}")
+
+    def transform(self, churn_probability):
+        return np.interp(churn_probability, self.x, self.y)
+
+    def raw_threshold(self, threshold=0.5):
+        """Smallest raw probability whose calibrated value reaches `threshold`.
+
+        The map is non-decreasing, so calibrated >= threshold exactly when
+        raw >= this value (-inf if every value qualifies, inf if none does).
+        """
+        reached = np.flatnonzero(self.y >= threshold)
+        if reached.size == 0:
+            return np.inf
+        i = reached[0]
+        if i == 0:
+            return -np.inf
+        x0, x1, y0, y1 = self.x[i - 1], self.x[i], self.y[i - 1], self.y[i]
+        return float(x0 + (threshold - y0) * (x1 - x0) / (y1 - y0))
+
+    def calibrate_proba(self, probability):
+        """Calibrate a (n_samples, 2) predict_proba array."""
+        calibrated = np.empty(probability.shape, dtype=np.float64)
+        calibrated[:, 1] = self.transform(probability[:, 1])
+        calibrated[:, 0] = 1.0 - calibrated[:, 1]
+        return calibrated
+
+def split_calibration_data(X_train, y_train, calibration_fraction=0.2):
+    """Hold out a stratified part of the training data for fitting the calibrator."""
+    from sklearn.model_selection import train_test_split
+    return train_test_split(X_train, y_train, test_size=calibration_fraction,
+                            stratify=y_train, random_state=42)
+
+def calibrate_model(model, X_cal, y_cal, method="isotonic"):
+    """Fit a calibrator on held-out data and attach it to the model (pickled along with it)."""
     try:
-        with open(filename, "wb") as f:
-            pickle.dump(model, f)
+        raw = model.predict_proba(X_cal)[:, 1]
+        model.calibrator_ = ProbabilityCalibrator.fit(raw, y_cal, method)
+        before = reliability_metrics(y_cal, raw)
+        after = reliability_metrics(y_cal, model.calibrator_.transform(raw))
+        model.calibration_metadata_ = {
+            "method": method,
+            "rows": len(y_cal),
+            "knots": len(model.calibrator_.x),
+            "held_out_before": before,
+            "held_out_after": after,
+        }
+        logger.info(f"{method.capitalize()} calibration on {len(y_cal)} held-out rows: "
+                    f"ECE {before['ece']:.4f} -> {after['ece']:.4f}, Brier {before['brier']:.4f} -> {after['brier']:.4f}")
+        return model
+    except Exception as e:
+        logger.error(f"Error calibrating model: {str(e)}")
+        raise
+
+def save_model(model, filename="model.pkl", metrics=None):
+    """Save the trained model and its metadata manifest (see model_metadata).
+
+    The file is written under a temporary name and renamed into place, so a
+    server reading it concurrently sees either the old or the new model.
+    """
+    try:
+        payload = pickle.dumps(model)
+        tmp_path = f"{filename}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, filename)
         logger.info(f'Model saved as {filename}')
+
+        manifest = model_metadata(model, metrics)
+        manifest["model_file"] = os.path.basename(filename)
+        manifest["model_sha256"] = hashlib.sha256(payload).hexdigest()
+        _write_metadata(filename, manifest)
         
     except Exception as e:
         logger.error(f"Error saving model: {str(e)}")
@@ -120,3 +319,442 @@ def load_model(filename="model.pkl"):
     except Exception as e:
         logger.error(f"Error loading model: {str(e)}")
         raise
+
+def dataset_fingerprint(X, y=None):
+    """Content hash of a training set (columns, values and labels)."""
+    digest = hashlib.sha256()
+    digest.update(json.dumps([str(c) for c in X.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).values.tobytes())
+    if y is not None:
+        digest.update(pd.util.hash_pandas_object(pd.Series(y), index=False).values.tobytes())
+    return digest.hexdigest()
+
+def _training_metadata(X_train, y_train, fit_seconds):
+    return {
+        "dataset_fingerprint": dataset_fingerprint(X_train, y_train),
+        "n_samples": int(len(X_train)),
+        "fit_seconds": float(fit_seconds),
+        "trained_at": datetime.now().isoformat(),
+    }
+
+def metadata_path(filename):
+    """Sidecar manifest of a model file: model.pkl -> model.meta.json."""
+    return os.path.splitext(filename)[0] + ".meta.json"
+
+def model_metadata(model, metrics=None):
+    """Describe a model for serving: feature names, importances (sorted), params and training info."""
+    names = [str(name) for name in getattr(model, "feature_names_in_", [])]
+    importances = getattr(model, "feature_importances_", None)
+    features = []
+    if importances is not None:
+        labels = names if len(names) == len(importances) else [f"feature_{i}" for i in range(len(importances))]
+        features = sorted(({"name": name, "importance": float(importance)}
+                           for name, importance in zip(labels, importances)),
+                          key=lambda f: f["importance"], reverse=True)
+    if hasattr(model, "get_params"):
+        params = model.get_params()
+    else:
+        params = {"n_estimators": getattr(model, "n_estimators", None),
+                  "max_depth": getattr(model, "max_depth", None)}
+    return {
+        "model_type": type(model).__name__,
+        "feature_names": names,
+        "features": features,
+        "params": {key: value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+                   for key, value in params.items()},
+        "training": dict(getattr(model, "training_metadata_", {})),
+        "calibration": dict(getattr(model, "calibration_metadata_", {})) or None,
+        "metrics": dict(metrics or {}),
+        "created_at": datetime.now().isoformat(),
+    }
+
+def _write_metadata(filename, manifest):
+    path = metadata_path(filename)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+def read_model_metadata(filename="model.pkl"):
+    """Load a model's manifest, or None if it is missing or was written for a different model file."""
+    path = metadata_path(filename)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    if manifest.get("model_sha256") != digest.hexdigest():
+        logger.warning(f"Ignoring stale metadata {path}: it does not match {filename}")
+        return None
+    return manifest
+
+def update_model_metadata(filename, metrics=None, **fields):
+    """Merge evaluation metrics and extra top-level fields into an existing model manifest."""
+    try:
+        manifest = read_model_metadata(filename)
+        if manifest is None:
+            raise FileNotFoundError(f"No metadata for {filename}")
+        manifest["metrics"].update(metrics or {})
+        manifest.update(fields)
+        _write_metadata(filename, manifest)
+    except Exception as e:
+        logger.error(f"Error updating model metadata: {str(e)}")
+        raise
+
+def record_model_metrics(filename, metrics):
+    """Merge evaluation metrics into an existing model manifest."""
+    update_model_metadata(filename, metrics)
+
+# Read-only arrays shared with pool workers (set by the pool initializer)
+_shared_data = {}
+
+def _init_shared_worker(data_dir, columns):
+    """Memory-map every shared array once per worker process."""
+    _shared_data["columns"] = columns
+    for filename in os.listdir(data_dir):
+        name, ext = os.path.splitext(filename)
+        if ext == ".npy":
+            _shared_data[name] = np.load(os.path.join(data_dir, filename), mmap_mode="r")
+
+def _shared_pool(arrays, columns, max_workers):
+    """Context manager yielding a process pool whose workers see `arrays` read-only.
+
+    The arrays are written once as .npy files and memory-mapped by every
+    worker, so they are neither pickled per task nor copied per process.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import contextlib
+    import tempfile
+
+    @contextlib.contextmanager
+    def pool():
+        with tempfile.TemporaryDirectory() as data_dir:
+            for name, values in arrays.items():
+                np.save(os.path.join(data_dir, f"{name}.npy"), np.asarray(values))
+            with ProcessPoolExecutor(
+                max_workers=max_workers,
+                initializer=_init_shared_worker,
+                initargs=(data_dir, columns),
+            ) as executor:
+                yield executor
+
+    return pool()
+
+def _shared_frame(name, rows=None):
+    values = _shared_data[name] if rows is None else _shared_data[name][rows]
+    return pd.DataFrame(values, columns=_shared_data["columns"], copy=False)
+
+def _fit_candidate(config):
+    """Train and score one candidate configuration inside a worker process."""
+    from sklearn.metrics import accuracy_score
+    from serving import score_frame
+    with _thread_limit(config.get("n_jobs")):
+        start = time.perf_counter()
+        model = make_model(**config)
+        model.fit(_shared_frame("X_train"), _shared_data["y_train"])
+        fit_seconds = time.perf_counter() - start
+        accuracy = accuracy_score(_shared_data["y_val"], score_frame(model, _shared_frame("X_val"))[0])
+    return {"config": config, "model": model, "accuracy": float(accuracy),
+            "fit_seconds": fit_seconds}
+
+def train_candidates(X_train, y_train, X_val, y_val, configs, max_workers=None):
+    """Train several configurations in parallel and rank them by validation accuracy.
+
+    A config holds make_model arguments (model_type, n_estimators, max_depth).
+    The validation rows must come from the training data, not the test set,
+    or the winner's test accuracy is no longer a held-out estimate.
+
+    The prepared dataset is shared read-only with every worker (see
+    _shared_pool). The machine's cores are split between workers through
+    each candidate's n_jobs, which also caps the OpenMP threads of backends
+    that take no n_jobs themselves.
+    """
+    try:
+        max_workers = min(max_workers or len(configs), len(configs), os.cpu_count() or 1)
+        jobs_per_worker = max(1, (os.cpu_count() or 1) // max_workers)
+        configs = [{"n_jobs": jobs_per_worker, **config} for config in configs]
+        logger.info(f"Training {len(configs)} candidates on {max_workers} workers "
+                    f"({jobs_per_worker} cores each)...")
+
+        arrays = {"X_train": X_train, "y_train": y_train, "X_val": X_val, "y_val": y_val}
+        with _shared_pool(arrays, list(X_train.columns), max_workers) as executor:
+            results = list(executor.map(_fit_candidate, configs))
+
+        results.sort(key=lambda r: r["accuracy"], reverse=True)
+        for result in results:
+            result["model"].training_metadata_ = _training_metadata(X_train, y_train, result["fit_seconds"])
+            _ensure_feature_importances(result["model"], X_train, y_train)
+            logger.info(f"Candidate {result['config']}: accuracy {result['accuracy']:.4f}, "
+                        f"fit {result['fit_seconds']:.2f}s")
+        return results
+
+    except Exception as e:
+        logger.error(f"Error in candidate training: {str(e)}")
+        raise
+
+def make_folds(y, n_splits=5, n_repeats=1, random_state=42):
+    """Assign every row a stratified fold number for each repeat.
+
+    Returns an int8 array of shape (n_repeats, n_samples); the test rows of
+    fold k in repeat r are `fold_ids[r] == k`. Computing this once lets all
+    fold fits share the same index arrays.
+    """
+    from sklearn.model_selection import StratifiedKFold
+    y = np.asarray(y)
+    fold_ids = np.empty((n_repeats, len(y)), dtype=np.int8)
+    for repeat in range(n_repeats):
+        splitter = StratifiedKFold(n_splits=n_splits, shuffle=True,
+                                   random_state=random_state + repeat)
+        for fold, (_, test_idx) in enumerate(splitter.split(np.zeros(len(y)), y)):
+            fold_ids[repeat, test_idx] = fold
+    return fold_ids
+
+def _fit_fold(task):
+    """Fit and score one (repeat, fold) split inside a worker process."""
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+    from serving import score_frame
+    repeat, fold, params = task
+    test_mask = _shared_data["fold_ids"][repeat] == fold
+    train_rows = np.flatnonzero(~test_mask)
+    test_rows = np.flatnonzero(test_mask)
+    y = _shared_data["y"]
+
+    # Backends without n_jobs (hist_gbm) would otherwise use every core per fold
+    with _thread_limit(params.get("n_jobs")):
+        start = time.perf_counter()
+        model = make_model(**params)
+        model.fit(_shared_frame("X", train_rows), y[train_rows])
+        fit_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        y_pred, probability = score_frame(model, _shared_frame("X", test_rows))
+        predict_seconds = time.perf_counter() - start
+        native_threads = _native_threads()
+    y_true, proba = y[test_rows], probability[:, 1]
+
+    return {
+        "repeat": repeat,
+        "fold": fold,
+        "n_test": int(len(test_rows)),
+        "accuracy": float(accuracy_score(y_true, y_pred)),
+        "precision": float(precision_score(y_true, y_pred, zero_division=0)),
+        "recall": float(recall_score(y_true, y_pred, zero_division=0)),
+        "f1_score": float(f1_score(y_true, y_pred, zero_division=0)),
+        "roc_auc": float(roc_auc_score(y_true, proba)),
+        "fit_seconds": fit_seconds,
+        "predict_seconds": predict_seconds,
+        "native_threads": native_threads,
+    }
+
+def cross_validate(X, y, n_splits=5, n_repeats=1, n_estimators=100, max_depth=10,
+                   n_cores=None, fold_workers=None, random_state=42, model_type="random_forest"):
+    """(Repeated) stratified k-fold cross-validation of a model backend (Random Forest by default).
+
+    Folds are fitted in parallel worker processes that share X, y and the
+    fold assignments read-only. The core budget is respected as
+    fold_workers x n_jobs-per-fold <= n_cores (default: all cores), for
+    OpenMP-threaded backends too (see _thread_limit).
+    """
+    try:
+        n_cores = n_cores or os.cpu_count() or 1
+        n_fits = n_splits * n_repeats
+        fold_workers = max(1, min(fold_workers or n_cores, n_fits, n_cores))
+        jobs_per_fold = max(1, n_cores // fold_workers)
+        logger.info(f"Cross-validating {n_repeats}x{n_splits} folds on {fold_workers} workers "
+                    f"({jobs_per_fold} cores each)...")
+
+        start = time.perf_counter()
+        fold_ids = make_folds(y, n_splits, n_repeats, random_state)
+        params = {"model_type": model_type, "n_estimators": n_estimators, "max_depth": max_depth,
+                  "n_jobs": jobs_per_fold}
+        tasks = [(r, k, params) for r in range(n_repeats) for k in range(n_splits)]
+        arrays = {"X": X, "y": y, "fold_ids": fold_ids}
+        with _shared_pool(arrays, list(X.columns), fold_workers) as executor:
+            folds = list(executor.map(_fit_fold, tasks))
+        elapsed = time.perf_counter() - start
+
+        metric_names = ["accuracy", "precision", "recall", "f1_score", "roc_auc"]
+        summary = {
+            "n_splits": n_splits,
+            "n_repeats": n_repeats,
+            "fold_workers": fold_workers,
+            "n_jobs_per_fold": jobs_per_fold,
+            "params": {"model_type": model_type, "n_estimators": n_estimators, "max_depth": max_depth},
+            "wall_seconds": elapsed,
+            "mean": {m: float(np.mean([f[m] for f in folds])) for m in metric_names},
+            "std": {m: float(np.std([f[m] for f in folds])) for m in metric_names},
+            "folds": folds,
+        }
+        logger.info(f"CV accuracy: {summary['mean']['accuracy']:.4f} "
+                    f"± {summary['std']['accuracy']:.4f} ({elapsed:.2f}s)")
+        return summary
+
+    except Exception as e:
+        logger.error(f"Error in cross-validation: {str(e)}")
+        raise
+
+QUANT_SCALE = np.iinfo(np.uint16).max
+
+class CompactForest:
+    """Serving-only representation of a binary RandomForestClassifier.
+
+    All trees are flattened into shared node arrays with the smallest integer
+    types that fit, float32 thresholds and uint16-quantized leaf churn
+    probabilities. Leaves point to themselves with an infinite threshold, so
+    a batch is evaluated for all trees at once in `max_depth` vectorized steps.
+    """
+
+    def __init__(self, trees, classes, feature_names, feature_importances):
+        sizes = np.array([t.node_count for t in trees])
+        offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+        total = int(sizes.sum())
+        index_dtype = np.min_scalar_type(-total)
+
+        left, right, feature, threshold, value = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            nodes = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            left.append(np.where(is_leaf, nodes, tree.children_left + offset))
+            right.append(np.where(is_leaf, nodes, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            # Round thresholds *down* to float32: for float32 inputs x,
+            # x <= t  <=>  x <= float32_floor(t), so splits are unchanged
+            t32 = tree.threshold.astype(np.float32)
+            t32 = np.where(t32 > tree.threshold, np.nextafter(t32, np.float32(-np.inf)), t32)
+            threshold.append(np.where(is_leaf, np.float32(np.inf), t32))
+            counts = tree.value[:, 0, :]
+            p1 = counts[:, 1] / counts.sum(axis=1)
+            value.append(np.round(p1 * QUANT_SCALE))
+
+        self.left = np.concatenate(left).astype(index_dtype)
+        self.right = np.concatenate(right).astype(index_dtype)
+        self.feature = np.concatenate(feature).astype(np.min_scalar_type(len(feature_names)))
+        self.threshold = np.concatenate(threshold).astype(np.float32)
+        self.value = np.concatenate(value).astype(np.uint16)
+        self.roots = offsets.astype(index_dtype)
+        self.max_depth = max(t.max_depth for t in trees)
+        self.n_estimators = len(trees)
+        self.classes_ = np.asarray(classes)
+        self.feature_names_in_ = np.asarray(feature_names, dtype=object)
+        self.n_features_in_ = len(feature_names)
+        self.feature_importances_ = np.asarray(feature_importances, dtype=np.float32)
+
+    @classmethod
+    def from_forest(cls, forest):
+        """Flatten a whole trained forest (no pruning); CompactForests are returned as is."""
+        if isinstance(forest, cls):
+            return forest
+        return cls([est.tree_ for est in forest.estimators_], forest.classes_,
+                   list(forest.feature_names_in_), getattr(forest, "feature_importances_", None))
+
+    def apply(self, X):
+        """Leaf index reached in every tree, shape (n_samples, n_estimators)."""
+        X = np.asarray(X, dtype=np.float32)
+        node = np.repeat(self.roots[None, :], len(X), axis=0)
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(go_left, self.left[node], self.right[node])
+        return node
+
+    def predict_proba(self, X):
+        p1 = self.value[self.apply(X)].mean(axis=1, dtype=np.float64) / QUANT_SCALE
+        return np.column_stack([1.0 - p1, p1])
+
+    def predict(self, X):
+        return self.classes_[self.predict_proba(X).argmax(axis=1)]
+
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in
+                   ("left", "right", "feature", "threshold", "value", "roots"))
+
+def _prune_trees(tree_p1, y_val, accuracy_budget, min_trees, calibrator=None):
+    """Backward elimination of trees against a validation-set accuracy budget.
+
+    Each step drops the tree whose removal gives the lowest Brier score
+    (smoother and less prone to overfitting the validation set than raw
+    accuracy), and stops once accuracy would fall below the budget.
+    Accuracy is that of the served decision (serving.score_frame): the
+    calibrated probability >= 0.5 when there is a `calibrator`.
+    """
+    def decide(p1):
+        return p1 > 0.5 if calibrator is None else calibrator.transform(p1) >= 0.5
+
+    y_val = np.asarray(y_val)
+    keep = list(range(len(tree_p1)))
+    total = tree_p1.sum(axis=0)
+    floor = np.mean(decide(total / len(keep)) == y_val) - accuracy_budget
+    while len(keep) > min_trees:
+        remaining = (total[None, :] - tree_p1[keep]) / (len(keep) - 1)
+        best = int(np.argmin(np.mean((remaining - y_val) ** 2, axis=1)))
+        if np.mean(decide(remaining[best]) == y_val) < floor:
+            break
+        total = total - tree_p1[keep[best]]
+        del keep[best]
+    return keep
+
+def _time_predict(model, X, repeats=20):
+    model.predict_proba(X)  # warm-up
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.predict_proba(X)
+    return (time.perf_counter() - start) / repeats
+
+def compact_model(model, X_val, y_val, accuracy_budget=0.005, prune=True, min_trees=10,
+                  X_test=None, y_test=None):
+    """Build a CompactForest from a trained forest and report the trade-off.
+
+    With `prune`, trees are dropped while validation accuracy stays within
+    `accuracy_budget` of the full forest. The report is computed on
+    `X_test`/`y_test` when given, so the pruning data does not also grade
+    the result. Returns (compact_model, report).
+    """
+    from sklearn.metrics import accuracy_score
+    from serving import score_frame
+    try:
+        if not hasattr(model, "estimators_"):
+            raise ValueError(f"Only random forests can be compacted, not {type(model).__name__}")
+        estimators = model.estimators_
+        X_val32 = np.asarray(X_val, dtype=np.float32)
+        keep = list(range(len(estimators)))
+        if prune:
+            tree_p1 = np.stack([est.predict_proba(X_val32)[:, 1] for est in estimators])
+            keep = _prune_trees(tree_p1, y_val, accuracy_budget, min(min_trees, len(estimators)),
+                                getattr(model, "calibrator_", None))
+
+        kept = [estimators[i] for i in keep]
+        importances = np.mean([est.feature_importances_ for est in kept], axis=0)
+        compact = CompactForest([est.tree_ for est in kept], model.classes_,
+                                list(X_val.columns), importances / importances.sum())
+        if hasattr(model, "training_metadata_"):
+            compact.training_metadata_ = dict(model.training_metadata_)
+        if hasattr(model, "calibrator_"):
+            compact.calibrator_ = model.calibrator_
+            compact.calibration_metadata_ = dict(model.calibration_metadata_)
+
+        if X_test is None:
+            X_test, y_test = X_val, y_val
+        single = X_test.iloc[0:1]
+        report = {
+            "n_estimators": {"original": len(estimators), "compact": compact.n_estimators},
+            "size_bytes": {"original": len(pickle.dumps(model)), "compact": len(pickle.dumps(compact))},
+            "accuracy": {"original": float(accuracy_score(y_test, score_frame(model, X_test)[0])),
+                         "compact": float(accuracy_score(y_test, score_frame(compact, X_test)[0]))},
+            "single_row_ms": {"original": _time_predict(model, single) * 1000,
+                              "compact": _time_predict(compact, single) * 1000},
+            "batch_ms": {"original": _time_predict(model, X_test, 5) * 1000,
+                         "compact": _time_predict(compact, X_test, 5) * 1000},
+        }
+        logger.info(f"Compacted forest: {report['n_estimators']['original']} -> "
+                    f"{report['n_estimators']['compact']} trees, "
+                    f"{report['size_bytes']['original'] / 1024:.0f} KB -> "
+                    f"{report['size_bytes']['compact'] / 1024:.0f} KB, accuracy "
+                    f"{report['accuracy']['original']:.4f} -> {report['accuracy']['compact']:.4f}")
+        return compact, report
+
+    except Exception as e:
+        logger.error(f"Error in model compaction: {str(e)}")
+        raise
@@ -0,0 +1,265 @@
+import hashlib
+import logging
+import os
+import pickle
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LoadedModel:
+    """A model read from disk, identified by the content hash of its file."""
+
+    def __init__(self, path, model, version, mtime_ns, encoder=None):
+        self.path = path
+        self.model = model
+        self.version = version
+        self.mtime_ns = mtime_ns
+        self.encoder = encoder  # Version-specific preprocessing, when stored with the model
+
+
+class ModelRegistry:
+    """Unpickled models keyed by path, re-read only when the file changes.
+
+    A path may also be a model_store.ModelStore directory, in which case the
+    version named by its CURRENT pointer is served. Stored versions are
+    immutable, so switching (or rolling back) to a version that was loaded
+    before costs a stat of the pointer and no reads.
+    """
+
+    def __init__(self, max_cached=8):
+        self.max_cached = max_cached
+        self._models = {}
+        self._pointers = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, path):
+        """The model file served for `path`, following a model store's CURRENT pointer."""
+        if not os.path.isdir(path):
+            return path
+        from model_store import ModelStore, MODEL_FILE
+        pointer = os.path.join(path, "CURRENT")
+        stat = os.stat(pointer)
+        # The pointer is replaced, never rewritten, so a swap always changes the inode
+        key = (stat.st_ino, stat.st_mtime_ns)
+        cached = self._pointers.get(path)
+        if cached is None or cached[0] != key:
+            version = ModelStore(path, keep_last=0).current()
+            cached = (key, os.path.join(path, "versions", version, MODEL_FILE))
+            self._pointers[path] = cached
+        return cached[1]
+
+    def get(self, path):
+        path = self.resolve(path)
+        mtime_ns = os.stat(path).st_mtime_ns
+        loaded = self._models.get(path)
+        if loaded is not None and loaded.mtime_ns == mtime_ns:
+            return loaded
+        with self._lock:
+            loaded = self._models.get(path)
+            if loaded is None or loaded.mtime_ns != mtime_ns:
+                loaded = self._load(path, mtime_ns)
+                self._models.pop(path, None)
+                self._models[path] = loaded
+                while len(self._models) > self.max_cached:
+                    del self._models[next(iter(self._models))]
+        return loaded
+
+    def _load(self, path, mtime_ns):
+        from model_store import PREPROCESSING_FILE
+        with open(path, "rb") as f:
+            payload = f.read()
+        preprocessing = os.path.join(os.path.dirname(path), PREPROCESSING_FILE)
+        if os.path.basename(os.path.dirname(os.path.dirname(path))) == "versions" and os.path.exists(preprocessing):
+            # A model store version: its directory name is already the content hash
+            with open(preprocessing, "rb") as f:
+                encoder = pickle.load(f)
+            version = os.path.basename(os.path.dirname(path))
+        else:
+            encoder = None
+            version = hashlib.sha256(payload).hexdigest()[:12]
+        loaded = LoadedModel(path, pickle.loads(payload), version, mtime_ns, encoder)
+        logger.info(f"Loaded model {path} (version {loaded.version})")
+        return loaded
+
+
+def _new_stats(path, role):
+    return {"path": path, "role": role, "served": 0, "served_latency_ms": 0.0,
+            "shadowed": 0, "agreements": 0, "abs_probability_diff": 0.0,
+            "shadow_latency_ms": 0.0, "latency_delta_ms": 0.0, "errors": 0}
+
+
+class ModelFleet:
+    """Route requests between a primary model and a canary, and mirror them to shadows.
+
+    `choose` serves a request from the canary for `canary_percent` of
+    traffic (stable per routing key when one is given) and from the primary
+    otherwise. `shadow` hands the already-encoded request to a thread pool
+    where every other hosted model scores it, recording agreement with the
+    served prediction and the latency difference per model version. The
+    request never waits for shadows; when the shadow backlog exceeds
+    `max_pending` the comparison is skipped and counted as dropped. A
+    request routed to a canary that cannot be loaded (pruned from the store,
+    corrupt) is served by the primary instead and counted as a canary failure.
+    """
+
+    def __init__(self, registry, shadow_paths=(), canary_path=None, canary_percent=0.0,
+                 max_workers=2, max_pending=1000):
+        self.registry = registry
+        self.shadow_paths = list(shadow_paths)
+        self.canary_path = canary_path
+        self.canary_percent = float(canary_percent)
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="shadow")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.dropped = 0
+        self.canary_failures = 0
+
+    @classmethod
+    def from_env(cls, registry):
+        shadows = [p.strip() for p in os.environ.get("SHADOW_MODELS", "").split(",") if p.strip()]
+        return cls(registry, shadows, os.environ.get("CANARY_MODEL") or None,
+                   float(os.environ.get("CANARY_PERCENT", 0)))
+
+    def configure(self, shadow_paths=None, canary_path=None, canary_percent=None):
+        for path in list(shadow_paths or []) + ([canary_path] if canary_path else []):
+            self.registry.get(path)  # Fail fast on unreadable models
+        with self._lock:
+            if shadow_paths is not None:
+                self.shadow_paths = list(shadow_paths)
+            if canary_path is not None:
+                self.canary_path = canary_path or None
+            if canary_percent is not None:
+                self.canary_percent = float(canary_percent)
+
+    def _routes_to_canary(self, routing_key):
+        if not self.canary_path or self.canary_percent <= 0:
+            return False
+        if routing_key:
+            digest = hashlib.sha256(routing_key.encode()).digest()
+            bucket = int.from_bytes(digest[:4], "big") / 2 ** 32
+        else:
+            bucket = random.random()
+        return bucket * 100 < self.canary_percent
+
+    def choose(self, primary_path, routing_key=None):
+        """Return (served model, role, [(other model, role), ...]) for one request."""
+        hosted = [(primary_path, "primary")]
+        if self.canary_path:
+            hosted.append((self.canary_path, "canary"))
+        hosted += [(path, "shadow") for path in self.shadow_paths]
+        served_index = 1 if self._routes_to_canary(routing_key) else 0
+
+        served_path, served_role = hosted[served_index]
+        failed_index = None
+        try:
+            served = self.registry.get(served_path)
+        except Exception as e:
+            if served_role != "canary":
+                raise
+            logger.error(f"Could not load canary model {served_path}, serving the primary: {str(e)}")
+            with self._lock:
+                self.canary_failures += 1
+            failed_index, served_index, served_role = served_index, 0, "primary"
+            served = self.registry.get(primary_path)
+        others = []
+        for i, (path, role) in enumerate(hosted):
+            if i in (served_index, failed_index):
+                continue
+            try:
+                others.append((self.registry.get(path), role))
+            except Exception as e:
+                logger.error(f"Could not load {role} model {path}: {str(e)}")
+        return served, served_role, others
+
+    def _entry(self, loaded, role):
+        return self._stats.setdefault(loaded.version, _new_stats(loaded.path, role))
+
+    def record_served(self, loaded, role, latency):
+        with self._lock:
+            entry = self._entry(loaded, role)
+            entry["served"] += 1
+            entry["served_latency_ms"] += latency * 1000
+
+    def shadow(self, X, served_prediction, served_probability, served_latency, others):
+        """Score `X` with the other hosted models in the background."""
+        if not others:
+            return
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending += 1
+        self._executor.submit(self._run_shadows, X, served_prediction, served_probability,
+                              served_latency, others)
+
+    def _run_shadows(self, X, served_prediction, served_probability, served_latency, others):
+        from serving import score_frame
+        try:
+            for loaded, role in others:
+                try:
+                    start = time.perf_counter()
+                    prediction, probability = score_frame(loaded.model, X)
+                    latency = time.perf_counter() - start
+                except Exception as e:
+                    logger.error(f"Shadow model {loaded.version} failed: {str(e)}")
+                    with self._lock:
+                        self._entry(loaded, role)["errors"] += 1
+                    continue
+                with self._lock:
+                    entry = self._entry(loaded, role)
+                    entry["shadowed"] += len(prediction)
+                    entry["agreements"] += int(np.sum(prediction == served_prediction))
+                    entry["abs_probability_diff"] += float(np.sum(np.abs(probability[:, 1] - served_probability)))
+                    entry["shadow_latency_ms"] += latency * 1000
+                    entry["latency_delta_ms"] += (latency - served_latency) * 1000
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def wait_idle(self, timeout=5.0):
+        """Block until queued shadow comparisons have finished (used by tests and shutdown)."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if self._pending == 0:
+                    return True
+            time.sleep(0.01)
+        return False
+
+    def stats(self):
+        """Per model version: traffic served, and agreement / latency delta versus the served model."""
+        with self._lock:
+            versions = {}
+            for version, entry in self._stats.items():
+                shadowed, served = entry["shadowed"], entry["served"]
+                versions[version] = {
+                    "path": entry["path"],
+                    "role": entry["role"],
+                    "served": served,
+                    "mean_latency_ms": entry["served_latency_ms"] / served if served else None,
+                    "shadowed": shadowed,
+                    "agreement_rate": entry["agreements"] / shadowed if shadowed else None,
+                    "mean_abs_probability_diff": entry["abs_probability_diff"] / shadowed if shadowed else None,
+                    "mean_shadow_latency_ms": entry["shadow_latency_ms"] / shadowed if shadowed else None,
+                    "mean_latency_delta_ms": entry["latency_delta_ms"] / shadowed if shadowed else None,
+                    "errors": entry["errors"],
+                }
+            return {
+                "shadow_models": list(self.shadow_paths),
+                "canary_model": self.canary_path,
+                "canary_percent": self.canary_percent,
+                "pending_shadow_requests": self._pending,
+                "dropped_shadow_requests": self.dropped,
+                "canary_failures": self.canary_failures,
+                "versions": versions,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.pkl"
+PREPROCESSING_FILE = "preprocessing.pkl"
+METADATA_FILE = "model.meta.json"  # metadata_path(MODEL_FILE), so read_model_metadata works in place
+
+
+def _atomic_write(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ModelStore:
+    """Versioned, content-addressed model storage on local disk.
+
+    Each version is an immutable directory `versions/<id>/` holding the
+    pickled model, the fitted preprocessing (serving.FeatureEncoder) and the
+    metadata manifest, where `<id>` is a hash of the model and preprocessing
+    bytes. Versions are written to a temporary directory and renamed into
+    place, and the served version is named by the `CURRENT` file, which is
+    swapped with os.replace, so readers never see a partial version.
+    Activations are appended to `history.jsonl`, which is what rollback uses.
+    """
+
+    def __init__(self, root="model_store", keep_last=5):
+        self.root = root
+        self.versions_dir = os.path.join(root, "versions")
+        self.current_path = os.path.join(root, "CURRENT")
+        self.history_path = os.path.join(root, "history.jsonl")
+        self.keep_last = keep_last
+        self._lock = threading.Lock()
+        os.makedirs(self.versions_dir, exist_ok=True)
+
+    def version_dir(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def path(self, version, artifact=MODEL_FILE):
+        return os.path.join(self.version_dir(version), artifact)
+
+    def publish(self, model_payload, preprocessing_payload, manifest, activate=True):
+        """Store one version (a no-op if identical content exists) and optionally make it current."""
+        try:
+            digest = hashlib.sha256(model_payload)
+            digest.update(preprocessing_payload)
+            version = digest.hexdigest()[:16]
+            target = self.version_dir(version)
+            if not os.path.isdir(target):
+                manifest = {**manifest, "version": version,
+                            "model_sha256": hashlib.sha256(model_payload).hexdigest()}
+                staging = tempfile.mkdtemp(prefix=".staging-", dir=self.versions_dir)
+                with open(os.path.join(staging, MODEL_FILE), "wb") as f:
+                    f.write(model_payload)
+                with open(os.path.join(staging, PREPROCESSING_FILE), "wb") as f:
+                    f.write(preprocessing_payload)
+                with open(os.path.join(staging, METADATA_FILE), "w") as f:
+                    json.dump(manifest, f, indent=2)
+                try:
+                    os.rename(staging, target)
+                    logger.info(f"Published model version {version}")
+                except OSError:
+                    shutil.rmtree(staging, ignore_errors=True)  # Published concurrently
+            if activate:
+                self.activate(version)
+            return version
+        except Exception as e:
+            logger.error(f"Error publishing model: {str(e)}")
+            raise
+
+    def publish_model(self, model, encoder, metrics=None, activate=True):
+        """Pickle a model and its encoder and publish them with a fresh manifest."""
+        from model_pipeline import model_metadata
+        return self.publish(pickle.dumps(model), pickle.dumps(encoder),
+                            model_metadata(model, metrics), activate)
+
+    def current(self):
+        """The version being served, or None if nothing was published yet."""
+        try:
+            with open(self.current_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def activate(self, version):
+        """Atomically point CURRENT at a stored version."""
+        with self._lock:
+            version = self.resolve(version)
+            previous = self.current()
+            if version != previous:
+                _atomic_write(self.current_path, version.encode())
+                with open(self.history_path, "a") as f:
+                    f.write(json.dumps({"version": version, "previous": previous,
+                                        "activated_at": datetime.now().isoformat()}) + "\n")
+                logger.info(f"Current model version: {version} (was {previous})")
+            self._prune()
+        return version
+
+    def resolve(self, version):
+        """Expand a unique version prefix into a full version id."""
+        matches = [v for v in os.listdir(self.versions_dir)
+                   if v.startswith(version) and not v.startswith(".")]
+        if len(matches) != 1:
+            raise ValueError(f"{'Ambiguous' if matches else 'Unknown'} model version: {version}")
+        return matches[0]
+
+    def history(self):
+        if not os.path.exists(self.history_path):
+            return []
+        with open(self.history_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def rollback(self, version=None):
+        """Re-activate `version`, or by default the version that was current before this one."""
+        if version is None:
+            current = self.current()
+            for entry in reversed(self.history()):
+                if entry["version"] == current and entry["previous"] and \
+                        os.path.isdir(self.version_dir(entry["previous"])):
+                    version = entry["previous"]
+                    break
+            if version is None:
+                raise ValueError("No earlier model version to roll back to")
+        return self.activate(version)
+
+    def versions(self):
+        """Stored versions, newest first, with their manifests."""
+        versions = []
+        current = self.current()
+        for version in os.listdir(self.versions_dir):
+            if version.startswith("."):
+                continue
+            try:
+                with open(self.path(version, METADATA_FILE)) as f:
+                    manifest = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                manifest = {}
+            versions.append({"version": version, "current": version == current,
+                             "created_at": manifest.get("created_at", ""),
+                             "metrics": manifest.get("metrics", {})})
+        return sorted(versions, key=lambda v: v["created_at"], reverse=True)
+
+    def _prune(self):
+        """Retention: keep the newest `keep_last` versions plus the current and rollback target."""
+        if not self.keep_last:
+            return
+        protected = {self.current()}
+        for entry in reversed(self.history()):
+            if entry["version"] in protected:
+                protected.add(entry["previous"])
+                break
+        for entry in self.versions()[self.keep_last:]:
+            if entry["version"] not in protected:
+                shutil.rmtree(self.version_dir(entry["version"]), ignore_errors=True)
+                logger.info(f"Removed model version {entry['version']} (retention {self.keep_last})")
+
+    def export(self, version, filename):
+        """Copy a version's model and manifest to a plain model file, atomically."""
+        from model_pipeline import metadata_path
+        for artifact, target in ((MODEL_FILE, filename), (METADATA_FILE, metadata_path(filename))):
+            with open(self.path(version, artifact), "rb") as f:
+                _atomic_write(target, f.read())
+        return filename
@@ -0,0 +1,186 @@
+import hashlib
+import importlib
+import inspect
+import json
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+def file_fingerprint(path, chunk_size=1 << 20):
+    """Content hash of a file, used to key stages that read it."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _code_fingerprint(func, modules=()):
+    """Hash of a stage's code: its own source plus the modules it calls into.
+
+    A project module is keyed by the contents of its source file, so editing
+    any helper in it invalidates the stage; an installed package is keyed by
+    its version.
+    """
+    digest = hashlib.sha256()
+    try:
+        digest.update(inspect.getsource(func).encode())
+    except (OSError, TypeError):
+        digest.update(f"{func.__module__}.{getattr(func, '__qualname__', repr(func))}".encode())
+    for name in modules:
+        module = importlib.import_module(name)
+        version = getattr(module, "__version__", None)
+        if version is not None:
+            digest.update(f"{name}=={version}".encode())
+        else:
+            digest.update(file_fingerprint(inspect.getsourcefile(module)).encode())
+    return digest.hexdigest()
+
+
+class Stage:
+    """A pipeline step: `func(*dependency_outputs, **params)`.
+
+    `files` are input paths whose contents key the cache, and `modules` names
+    the modules `func` calls into (see _code_fingerprint). `outputs` are paths
+    the stage writes: a cached result is only reused while they still hold
+    what the last run left there.
+    """
+
+    def __init__(self, name, func, deps=(), params=None, files=(), outputs=(), cache=True, modules=()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.params = params or {}
+        self.files = list(files)
+        self.outputs = list(outputs)
+        self.cache = cache
+        self.modules = list(modules)
+
+
+class PipelineRunner:
+    """Run a DAG of stages, executing independent stages concurrently.
+
+    Each stage's output is cached on disk under a key derived from its code,
+    parameters, input files and the keys of its dependencies, so a stage whose
+    inputs have not changed is skipped and its previous output reused.
+    """
+
+    def __init__(self, stages, cache_dir=".pipeline_cache", max_workers=4, use_cache=True):
+        self.stages = {stage.name: stage for stage in stages}
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.use_cache = use_cache
+        os.makedirs(cache_dir, exist_ok=True)
+        for stage in stages:
+            missing = [d for d in stage.deps if d not in self.stages]
+            if missing:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages: {missing}")
+
+    def _stage_key(self, stage, keys):
+        digest = hashlib.sha256()
+        digest.update(stage.name.encode())
+        digest.update(_code_fingerprint(stage.func, stage.modules).encode())
+        digest.update(repr(sorted(stage.params.items())).encode())
+        for path in stage.files:
+            digest.update(file_fingerprint(path).encode())
+        for dep in stage.deps:
+            digest.update(keys[dep].encode())
+        return digest.hexdigest()[:16]
+
+    def _cache_path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage.name}-{key}.pkl")
+
+    def _outputs_path(self, stage, key):
+        return os.path.join(self.cache_dir, f"{stage.name}-{key}.outputs.json")
+
+    def _output_fingerprints(self, stage):
+        return {path: file_fingerprint(path) if os.path.exists(path) else None for path in stage.outputs}
+
+    def _outputs_unchanged(self, stage, key):
+        """Whether the stage's output files are exactly as the last run left them."""
+        if not stage.outputs:
+            return True
+        try:
+            with open(self._outputs_path(stage, key)) as f:
+                recorded = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return None not in recorded.values() and recorded == self._output_fingerprints(stage)
+
+    def _record_outputs(self, stage, key):
+        tmp_path = f"{self._outputs_path(stage, key)}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._output_fingerprints(stage), f)
+        os.replace(tmp_path, self._outputs_path(stage, key))
+
+    def _run_stage(self, stage, key, inputs):
+        start = time.perf_counter()
+        cache_path = self._cache_path(stage, key)
+        cacheable = self.use_cache and stage.cache
+        if cacheable and os.path.exists(cache_path) and self._outputs_unchanged(stage, key):
+            with open(cache_path, "rb") as f:
+                output = pickle.load(f)
+            return output, "cached", time.perf_counter() - start
+
+        output = stage.func(*inputs, **stage.params)
+        if cacheable:
+            tmp_path = f"{cache_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(output, f)
+            os.replace(tmp_path, cache_path)
+        return output, "ran", time.perf_counter() - start
+
+    def run(self):
+        """Execute the DAG and return (outputs by stage name, per-stage report)."""
+        outputs, keys, report = {}, {}, []
+        pending = dict(self.stages)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready = [s for s in pending.values() if all(d in outputs for d in s.deps)]
+                for stage in ready:
+                    del pending[stage.name]
+                    keys[stage.name] = self._stage_key(stage, keys)
+                    inputs = [outputs[d] for d in stage.deps]
+                    logger.info(f"🔹 Starting stage {stage.name}")
+                    future = executor.submit(self._run_stage, stage, keys[stage.name], inputs)
+                    running[future] = stage
+
+                if not running:
+                    raise ValueError(f"Dependency cycle between stages: {sorted(pending)}")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage = running.pop(future)
+                    try:
+                        output, status, elapsed = future.result()
+                    except Exception as e:
+                        logger.error(f"Stage {stage.name} failed: {str(e)}")
+                        raise
+                    outputs[stage.name] = output
+                    report.append({"stage": stage.name, "status": status,
+                                   "seconds": elapsed, "key": keys[stage.name]})
+                    logger.info(f"Stage {stage.name} {status} in {elapsed:.2f}s")
+
+        # Snapshot output files only now: later stages may legitimately rewrite
+        # them (record_metrics updates the saved manifest), and anything else
+        # touching them before the next run (e.g. a rollback) must force a re-run
+        for stage in self.stages.values():
+            if stage.outputs and stage.cache and self.use_cache:
+                self._record_outputs(stage, keys[stage.name])
+        return outputs, report
+
+
+def format_report(report):
+    """Render the per-stage wall time report as a table."""
+    lines = [f"{'stage':<20} {'status':<8} {'seconds':>8}"]
+    for row in report:
+        lines.append(f"{row['stage']:<20} {row['status']:<8} {row['seconds']:8.2f}")
+    lines.append(f"{'sum of stages':<20} {'':<8} {sum(r['seconds'] for r in report):8.2f}")
+    return "\n".join(lines)
@@ -0,0 +1,188 @@
+import cProfile
+import contextlib
+import io
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+try:
+    from pyinstrument import Profiler as _SamplingProfiler
+except ImportError:  # pyinstrument is optional; fall back to cProfile call trees
+    _SamplingProfiler = None
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileClaim:
+    """The profiling slot should_sample reserved for one run: used once or released."""
+
+    def __init__(self, profiler):
+        self._profiler = profiler
+        self._lock = threading.Lock()
+        self._taken = False
+
+    def take(self):
+        """Hand the slot to the caller; False if it was already taken or released."""
+        with self._lock:
+            taken, self._taken = self._taken, True
+        return not taken
+
+    def release(self):
+        """Give the slot back unless a profile run took it."""
+        if self.take():
+            self._profiler._release()
+
+
+class Profiler:
+    """Capture call trees and allocation snapshots for selected runs.
+
+    Profiles are written to `<log_dir>/profiles/` as one group of files per
+    run (call tree, raw cProfile stats, top allocations). Only one run is
+    profiled at a time and at most `max_per_minute` runs are sampled, so the
+    overhead stays bounded when enabled in production.
+    """
+
+    def __init__(self, log_dir="monitoring_logs", sample_rate=0.0, max_profiles=50,
+                 max_total_mb=200, max_per_minute=6, trace_frames=10, top_n=40):
+        self.profile_dir = os.path.join(log_dir, "profiles")
+        os.makedirs(self.profile_dir, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.max_profiles = max_profiles
+        self.max_total_bytes = int(max_total_mb * 1024 * 1024)
+        self.max_per_minute = max_per_minute
+        self.trace_frames = trace_frames
+        self.top_n = top_n
+        self._lock = threading.Lock()
+        self._active = False
+        self._recent = []
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        """Build a profiler configured by PROFILE_* environment variables."""
+        return cls(
+            sample_rate=float(os.environ.get("PROFILE_SAMPLE_RATE", 0.0)),
+            max_profiles=int(os.environ.get("PROFILE_MAX_FILES", 50)),
+            max_per_minute=int(os.environ.get("PROFILE_MAX_PER_MINUTE", 6)),
+            **kwargs
+        )
+
+    def should_sample(self, forced=False):
+        """Decide whether the next run is profiled (header-forced or sampled).
+
+        A sampled run reserves the profiler: the returned ProfileClaim must be
+        passed to profile() or released. Returns None when not sampled.
+        """
+        if not forced and (self.sample_rate <= 0 or random.random() >= self.sample_rate):
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._recent = [t for t in self._recent if now - t < 60]
+            if self._active or len(self._recent) >= self.max_per_minute:
+                return None
+            self._recent.append(now)
+            self._active = True
+        return ProfileClaim(self)
+
+    def _release(self):
+        with self._lock:
+            self._active = False
+
+    @contextlib.contextmanager
+    def profile(self, name, enabled=True, memory=True, claim=None):
+        """Profile the enclosed block and write the results to disk.
+
+        With a `claim` from should_sample the reserved slot is used (the
+        block runs unprofiled if the claim was already released).
+        """
+        if not enabled:
+            yield None
+            return
+        if claim is not None:
+            acquired = claim.take()
+        else:
+            with self._lock:
+                # cProfile and tracemalloc are process-wide; never nest runs
+                acquired = not self._active
+                self._active = True
+        if not acquired:
+            yield None
+            return
+
+        run_id = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{re.sub(r'[^A-Za-z0-9_-]', '_', name)}"
+        trace_memory = memory and not tracemalloc.is_tracing()
+        sampler = _SamplingProfiler() if _SamplingProfiler is not None else None
+        profiler = cProfile.Profile()
+        try:
+            if trace_memory:
+                tracemalloc.start(self.trace_frames)
+            if sampler is not None:
+                sampler.start()
+            profiler.enable()
+            started = time.perf_counter()
+            try:
+                yield run_id
+            finally:
+                elapsed = time.perf_counter() - started
+                profiler.disable()
+                if sampler is not None:
+                    sampler.stop()
+                snapshot = tracemalloc.take_snapshot() if trace_memory else None
+                if trace_memory:
+                    tracemalloc.stop()
+                self._write(run_id, elapsed, profiler, sampler, snapshot)
+        finally:
+            self._release()
+
+    def _write(self, run_id, elapsed, profiler, sampler, snapshot):
+        try:
+            base = os.path.join(self.profile_dir, run_id)
+            profiler.dump_stats(f"{base}.prof")
+
+            stream = io.StringIO()
+            stream.write(f"# {run_id} ({elapsed * 1000:.1f} ms)\n")
+            if sampler is not None:
+                stream.write(sampler.output_text(unicode=False, color=False))
+            else:
+                stats = pstats.Stats(profiler, stream=stream)
+                stats.sort_stats("cumulative").print_stats(self.top_n)
+                stats.print_callees(self.top_n)
+            with open(f"{base}.calltree.txt", "w") as f:
+                f.write(stream.getvalue())
+
+            if snapshot is not None:
+                snapshot = snapshot.filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                ])
+                with open(f"{base}.alloc.txt", "w") as f:
+                    for stat in snapshot.statistics("traceback")[:self.top_n]:
+                        f.write(f"{stat.size / 1024:.1f} KiB in {stat.count} blocks\n")
+                        for line in stat.traceback.format():
+                            f.write(f"    {line}\n")
+
+            logger.info(f"Profile written to {base}.*")
+            self._apply_retention()
+        except Exception as e:
+            logger.error(f"Failed to write profile {run_id}: {str(e)}")
+
+    def _apply_retention(self):
+        """Drop the oldest runs beyond the file-count and size limits."""
+        runs = {}
+        for entry in os.scandir(self.profile_dir):
+            if entry.is_file():
+                run_id = entry.name.split(".", 1)[0]
+                runs.setdefault(run_id, []).append(entry)
+
+        ordered = sorted(runs.items())  # run ids start with a sortable timestamp
+        total = sum(e.stat().st_size for _, entries in ordered for e in entries)
+        while ordered and (len(ordered) > self.max_profiles or total > self.max_total_bytes):
+            _, entries = ordered.pop(0)
+            for entry in entries:
+                total -= entry.stat().st_size
+                os.remove(entry.path)
@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_hash(*parts):
+    """Stable hash of JSON-able request parts; dict key order does not matter."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self):
+        self.task = None
+        self.waiting = 1
+        self.followers = 0
+        self.recorded = False
+
+
+class SingleFlight:
+    """Let concurrent identical requests share one in-flight computation.
+
+    The first caller for a key (the leader) starts `func` on the threadpool
+    in a task of its own; callers arriving with the same key while it runs
+    wait for that task instead of computing again, and get its result or its
+    exception. A caller that goes away (e.g. a client disconnect cancelling
+    the leader) does not cancel the work the others are waiting for; it is
+    only cancelled once nobody is left waiting. The key is released as soon
+    as the computation finishes, so nothing is cached beyond the flight
+    itself. Used from the event loop only.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.requests = 0
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_multiplicity = 0
+
+    async def run(self, key, func, *args, runner=None):
+        """Return (result, multiplicity); multiplicity is None for all callers but one.
+
+        The first caller to receive the result (normally the leader) gets a
+        multiplicity counting every caller that joined the flight, so one
+        result can be recorded once for all of them. `runner(func, *args)`
+        runs the computation (default: run_in_threadpool), e.g. through
+        admission control; if it raises, every caller gets the same error.
+        """
+        self.requests += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.ensure_future(self._compute(key, flight, func, args, runner))
+            self._flights[key] = flight
+            self.leaders += 1
+        else:
+            flight.waiting += 1
+            flight.followers += 1
+            self.coalesced += 1
+        try:
+            result = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            flight.waiting -= 1
+            if flight.waiting == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._release(key, flight)
+            raise
+        if flight.recorded:
+            return result, None
+        flight.recorded = True
+        multiplicity = flight.followers + 1
+        self.max_multiplicity = max(self.max_multiplicity, multiplicity)
+        return result, multiplicity
+
+    async def _compute(self, key, flight, func, args, runner):
+        try:
+            return await (runner or run_in_threadpool)(func, *args)
+        finally:
+            self._release(key, flight)
+
+    def _release(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self):
+        return {
+            "requests": self.requests,
+            "inferences": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": self.coalesced / self.requests if self.requests else 0.0,
+            "max_multiplicity": self.max_multiplicity,
+            "in_flight": len(self._flights),
+        }
+
+
+class IdempotencyConflict(Exception):
+    """An Idempotency-Key was reused with a different request payload."""
+
+
+class IdempotencyCache:
+    """Responses stored by Idempotency-Key for `ttl` seconds.
+
+    Each entry remembers the fingerprint of the request that produced it;
+    replaying the key with another payload raises IdempotencyConflict
+    rather than returning an unrelated response. Entries expire in
+    insertion order (the TTL is fixed), and at most `max_entries` are kept.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires, fingerprint, response)
+        self.hits = 0
+        self.conflicts = 0
+
+    def _expire(self, now):
+        while self._entries:
+            key, (expires, _, _) = next(iter(self._entries.items()))
+            if expires > now:
+                break
+            del self._entries[key]
+
+    def get(self, key, fingerprint):
+        self._expire(self._clock())
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] != fingerprint:
+            self.conflicts += 1
+            raise IdempotencyConflict(f"Idempotency-Key {key!r} was already used with a different request")
+        self.hits += 1
+        return entry[2]
+
+    def put(self, key, fingerprint, response):
+        now = self._clock()
+        self._expire(now)
+        self._entries.pop(key, None)
+        self._entries[key] = (now + self.ttl, fingerprint, response)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        self._expire(self._clock())
+        return {"ttl_seconds": self.ttl, "cached_keys": len(self._entries),
+                "replays": self.hits, "conflicts": self.conflicts}
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Fixed-width index entry per run: its position in runs.jsonl plus a digest of
+# the client run key (keys of any length or alphabet fit in 32 ASCII bytes)
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u4"), ("timestamp", "<f8"), ("key", "S32")])
+
+
+def key_digest(run_key):
+    return hashlib.sha256(str(run_key).encode("utf-8")).hexdigest()[:32]
+
+
+def summarize(results, timestamp=None):
+    """Totals for a list of test results, in the shape the dashboards expect."""
+    return {
+        "total": len(results),
+        "passed": sum(1 for r in results if r["status"] == "passed"),
+        "failed": sum(1 for r in results if r["status"] == "failed"),
+        "results": results,
+        "timestamp": timestamp or datetime.now().isoformat(),
+    }
+
+
+class TestRunStore:
+    """Append-only history of test runs and the merged latest-result-per-test view.
+
+    Every ingested run is appended to `runs.jsonl` and indexed in `runs.idx`,
+    so a run is fetched by number or key with a single seek. The merged view
+    (each test's most recent result) lives in memory and is also written to
+    `test_results.json`, which is what a restarted server loads.
+    """
+
+    __test__ = False  # Not a pytest test class
+
+    def __init__(self, root="test_results"):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.runs_path = os.path.join(root, "runs.jsonl")
+        self.index_path = os.path.join(root, "runs.idx")
+        self.latest_path = os.path.join(root, "test_results.json")
+        self._lock = threading.Lock()
+        self._index = None
+        self._keys = None
+        self._latest = None
+
+    def _load(self):
+        if self._index is not None:
+            return
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        size -= size % INDEX_DTYPE.itemsize
+        if size:
+            with open(self.index_path, "rb") as f:
+                self._index = np.frombuffer(f.read(size), dtype=INDEX_DTYPE).copy()
+        else:
+            self._index = np.zeros(0, dtype=INDEX_DTYPE)
+        # Indexes written before keys were digested hold the (ASCII) key itself
+        self._keys = {key.decode("utf-8", "replace"): number for number, key in enumerate(self._index["key"])}
+        self._latest = {"total": 0, "passed": 0, "failed": 0, "results": []}
+        if os.path.exists(self.latest_path):
+            try:
+                with open(self.latest_path) as f:
+                    self._latest = json.load(f)
+            except json.JSONDecodeError:
+                logger.error(f"Ignoring unreadable merged test results in {self.latest_path}")
+
+    def add_run(self, results, run_key=None, timestamp=None):
+        """Store one run; re-sending a run with the same key is a no-op. Returns the run summary."""
+        run_key = run_key or uuid.uuid4().hex
+        with self._lock:
+            self._load()
+            number = self._find(run_key)
+            if number is not None:
+                return self._summary(number)
+
+            number = len(self._index)
+            run = {"run": number, "run_key": run_key, **summarize(results, timestamp)}
+            line = (json.dumps(run) + "\n").encode()
+            with open(self.runs_path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            entry = np.array([(offset, len(line), time.time(), key_digest(run_key).encode())], dtype=INDEX_DTYPE)
+            with open(self.index_path, "ab") as f:
+                f.write(entry.tobytes())
+            self._index = np.concatenate([self._index, entry])
+            self._keys[key_digest(run_key)] = number
+
+            merged = {r["name"]: r for r in self._latest["results"]}
+            merged.update((r["name"], r) for r in results)
+            self._latest = summarize(list(merged.values()), run["timestamp"])
+            tmp_path = f"{self.latest_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._latest, f, indent=2)
+            os.replace(tmp_path, self.latest_path)
+        return {key: value for key, value in run.items() if key != "results"}
+
+    def latest(self):
+        """The merged view: the most recent result of every test seen so far."""
+        with self._lock:
+            self._load()
+            return self._latest
+
+    def _find(self, run_key):
+        number = self._keys.get(key_digest(run_key))
+        return self._keys.get(str(run_key)[:32]) if number is None else number
+
+    def _read(self, number):
+        entry = self._index[number]
+        with open(self.runs_path, "rb") as f:
+            f.seek(int(entry["offset"]))
+            return json.loads(f.read(int(entry["length"])))
+
+    def _summary(self, number):
+        run = self._read(number)
+        run.pop("results")
+        return run
+
+    def get_run(self, run):
+        """A stored run with its results, by run number or key; None if unknown."""
+        with self._lock:
+            self._load()
+            number = self._find(run)
+            if number is None and str(run).isdigit() and int(run) < len(self._index):
+                number = int(run)
+            return self._read(number) if number is not None else None
+
+    def history(self, limit=20, before=None):
+        """Summaries of the newest `limit` runs numbered below `before`, newest first."""
+        with self._lock:
+            self._load()
+            end = len(self._index) if before is None else max(0, min(before, len(self._index)))
+            return [self._summary(number) for number in range(end - 1, max(0, end - limit) - 1, -1)]
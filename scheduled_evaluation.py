@@ -1,51 +1,228 @@
+import io
+import json
+import os
 import pandas as pd
+import numpy as np
 import logging
-import time
-import schedule
-from model_pipeline import prepare_data, load_model, evaluate_model
+from datetime import datetime
+from model_pipeline import prepare_data, load_model, cross_validate, model_backend
 from model_monitoring import ModelMonitor
+from alert_config import AlertManager
+from scheduler import JobScheduler
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def evaluate_current_model():
-    """Scheduled task to evaluate model on latest data"""
+# Created on first use in the scheduler process (see alert_on_evaluation); its
+# dispatcher thread delivers notifications in the background and keeps the
+# deduplication and rate-limit state across evaluation runs
+_alert_manager = None
+
+def get_alert_manager():
+    global _alert_manager
+    if _alert_manager is None:
+        _alert_manager = AlertManager()
+    return _alert_manager
+
+# Labelled production rows (training columns plus Churn) arrive by being
+# appended to this CSV, e.g. with append_labelled_rows once outcomes are
+# known; each evaluation (and drift check) only reads the rows added since its
+# previous successful run. Point EVAL_DATA_PATH at the feed to monitor.
+EVAL_DATA_PATH = os.environ.get("EVAL_DATA_PATH", "monitoring_logs/incoming/labelled.csv")
+
+def append_labelled_rows(df, path=None):
+    """Append labelled rows to the incoming CSV, writing its header on first use."""
+    path = path or EVAL_DATA_PATH
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    # One write of whole lines, so a concurrent reader never sees half a row
+    with open(path, "a") as f:
+        f.write(df.to_csv(index=False, header=new_file))
+
+def read_new_rows(path, cursor=None):
+    """Rows appended to a CSV since `cursor`; returns (frame, new cursor).
+
+    The cursor is the byte offset just past the last complete line read, so
+    a partially written last line is left for the next run. A file that
+    shrank (replaced rather than appended to) is read again from the start,
+    and one that does not exist yet has no new rows.
+    """
+    if not os.path.exists(path):
+        logger.info(f"No incoming labelled data at {path} yet")
+        return None, cursor or {}
+    with open(path, "rb") as f:
+        header = f.readline()
+        offset = (cursor or {}).get("offset", len(header))
+        if offset < len(header) or offset > os.path.getsize(path):
+            offset = len(header)
+        f.seek(offset)
+        chunk = f.read()
+    complete = chunk[:chunk.rfind(b"\n") + 1]
+    new_cursor = {"offset": offset + len(complete)}
+    if not complete.strip():
+        return None, new_cursor
+    df = pd.read_csv(io.BytesIO(header + complete))
+    return df, new_cursor
+
+def _encode_labelled(df):
+    from serving import get_encoder, TARGET_COLUMN
+    X = get_encoder().encode_frame(df.drop(columns=[TARGET_COLUMN]))
+    return X, df[TARGET_COLUMN].astype(int)
+
+def evaluate_current_model(cursor=None):
+    """Scheduled task to evaluate the model on the labelled rows that arrived since the last run"""
     try:
         logger.info("Running scheduled model evaluation")
         
-        # Load test data
-        X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+        df, new_cursor = read_new_rows(EVAL_DATA_PATH, cursor)
+        if df is None:
+            logger.info("Scheduled evaluation skipped: no new labelled rows")
+            return {"rows": 0, "cursor": new_cursor}
+        X_new, y_new = _encode_labelled(df)
         
-        # Load current model
+        # Predict once and log metrics for monitoring (plots are their own job)
+        from serving import score_frame
         model = load_model()
+        y_pred, _ = score_frame(model, X_new)  # The decisions served, calibrated or not
+        metrics = ModelMonitor().log_batch_metrics(y_new, y_pred, X_new, visualize=False)
         
-        # Evaluate model
-        evaluate_model(model, X_test, y_test)
+        # Alerting is left to the long-lived scheduler process (alert_on_evaluation)
+        logger.info(f"Scheduled evaluation complete on {len(df)} new rows. Accuracy: {metrics['accuracy']:.4f}")
+        return {"rows": len(df), "accuracy": metrics["accuracy"], "cursor": new_cursor,
+                "alert_metrics": {key: metrics.get(key) for key in ("accuracy", "f1_score", "data_drift_score")}}
         
-        # Log metrics for monitoring
-        monitor = ModelMonitor()
-        y_pred = model.predict(X_test)
-        metrics = monitor.log_batch_metrics(y_test, y_pred, X_test)
+    except Exception as e:
+        logger.error(f"Scheduled evaluation failed: {str(e)}")
+        raise
+
+def alert_on_evaluation(result):
+    """Check an evaluation run's metrics against the alert thresholds.
+
+    Called in the scheduler process, so one dispatcher suppresses repeats
+    and rate-limits notifications across runs; it only queues them.
+    """
+    metrics = (result or {}).get("alert_metrics")
+    if metrics:
+        get_alert_manager().check_and_alert(metrics)
+
+def population_stability(expected, actual, bins=10):
+    """Population stability index of each column of `actual` against `expected` (decile bins)."""
+    psi = {}
+    for column in expected.columns:
+        edges = np.unique(np.quantile(expected[column], np.linspace(0, 1, bins + 1)[1:-1]))
+        # bincount over bin ids gives both histograms in a single pass each
+        e = np.bincount(np.searchsorted(edges, expected[column], side="right"), minlength=len(edges) + 1)
+        a = np.bincount(np.searchsorted(edges, actual[column], side="right"), minlength=len(edges) + 1)
+        e = np.clip(e / e.sum(), 1e-4, None)
+        a = np.clip(a / a.sum(), 1e-4, None)
+        psi[column] = float(np.sum((a - e) * np.log(a / e)))
+    return psi
+
+def detect_drift(cursor=None, log_dir="monitoring_logs"):
+    """Scheduled task comparing feature distributions of newly arrived rows with the training data"""
+    try:
+        from serving import TRAIN_DATA_PATH, TARGET_COLUMN, get_encoder
+        df, new_cursor = read_new_rows(EVAL_DATA_PATH, cursor)
+        if df is None:
+            return {"rows": 0, "cursor": new_cursor}
+        X_new, _ = _encode_labelled(df)
+        X_train = get_encoder().encode_frame(pd.read_csv(TRAIN_DATA_PATH).drop(columns=[TARGET_COLUMN]))
+        psi = population_stability(X_train, X_new)
+        entry = {
+            "timestamp": datetime.now().isoformat(),
+            "rows": len(df),
+            "max_psi": max(psi.values()),
+            "drifted_features": sorted(column for column, value in psi.items() if value > 0.2),
+            "psi": psi,
+        }
+        with open(os.path.join(log_dir, "drift.jsonl"), "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        logger.info(f"Drift check on {len(df)} new rows: max PSI {entry['max_psi']:.3f}")
+        return {"rows": len(df), "max_psi": entry["max_psi"], "cursor": new_cursor}
         
-        logger.info(f"Scheduled evaluation complete. Accuracy: {metrics['accuracy']:.4f}")
+    except Exception as e:
+        logger.error(f"Drift check failed: {str(e)}")
+        raise
+
+def refresh_visualizations(cursor=None):
+    """Scheduled task redrawing the metric plots when the metric history changed"""
+    monitor = ModelMonitor()
+    mtime = os.stat(monitor.metrics_file).st_mtime_ns
+    if cursor and cursor.get("metrics_mtime") == mtime:
+        return {"redrawn": False, "cursor": cursor}
+    monitor.generate_metrics_visualizations()
+    return {"redrawn": True, "cursor": {"metrics_mtime": mtime}}
+
+def compact_current_model(cursor=None, model_file="model.pkl", compact_file="model_compact.pkl"):
+    """Scheduled task re-compacting the served model for fast serving when it has changed"""
+    from pipeline_runner import file_fingerprint
+    from model_pipeline import compact_model, save_model, split_calibration_data
+    fingerprint = file_fingerprint(model_file)
+    if cursor and cursor.get("model_sha256") == fingerprint and os.path.exists(compact_file):
+        return {"compacted": False, "cursor": cursor}
+    model = load_model(model_file)
+    if not hasattr(model, "estimators_"):
+        return {"compacted": False, "reason": f"{type(model).__name__} is not a forest",
+                "cursor": {"model_sha256": fingerprint}}
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    # Prune on a split of the training data; the held-out test file only
+    # grades the result, it must not also choose the trees
+    X_fit, X_val, y_fit, y_val = split_calibration_data(X_train, y_train)
+    compact, report = compact_model(model, X_val, y_val, X_test=X_test, y_test=y_test)
+    save_model(compact, compact_file, metrics={"accuracy": report["accuracy"]["compact"]})
+    return {"compacted": True, "trees": report["n_estimators"]["compact"], "cursor": {"model_sha256": fingerprint}}
+
+def cross_validate_current_config(cursor=None, n_splits=5, n_repeats=3):
+    """Scheduled task to cross-validate the current model configuration on all labelled data"""
+    try:
+        logger.info("Running scheduled cross-validation")
+        
+        X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+        X = pd.concat([X_train, X_test], ignore_index=True)
+        y = pd.concat([y_train, y_test], ignore_index=True)
+        
+        # Re-use the backend and hyperparameters of the model currently being served
+        model_type, n_estimators, max_depth = model_backend(load_model())
+        results = cross_validate(X, y, n_splits=n_splits, n_repeats=n_repeats, model_type=model_type,
+                                 n_estimators=n_estimators, max_depth=max_depth)
+        
+        ModelMonitor().log_cross_validation(results)
+        logger.info(f"Scheduled cross-validation complete. Accuracy: "
+                    f"{results['mean']['accuracy']:.4f} ± {results['std']['accuracy']:.4f}")
+        return results
         
     except Exception as e:
-        logger.error(f"Scheduled evaluation failed: {str(e)}")
+        logger.error(f"Scheduled cross-validation failed: {str(e)}")
+        raise
+
+def build_scheduler(interval_hours=24, cv_interval_hours=168, state_path="monitoring_logs/scheduler_state.json"):
+    """The monitoring jobs; independent of each other, so they may run in parallel"""
+    scheduler = JobScheduler(state_path)
+    hour = 3600
+    scheduler.add("evaluation", evaluate_current_model, interval_hours * hour, timeout=hour, run_immediately=True,
+                  on_result=alert_on_evaluation)
+    scheduler.add("drift", detect_drift, interval_hours * hour, timeout=hour, run_immediately=True)
+    scheduler.add("visualization", refresh_visualizations, hour, timeout=10 * 60, run_immediately=True)
+    scheduler.add("compaction", compact_current_model, interval_hours * hour, timeout=2 * hour)
+    if cv_interval_hours:
+        scheduler.add("cross_validation", cross_validate_current_config, cv_interval_hours * hour, timeout=6 * hour)
+    return scheduler
 
-def start_scheduled_evaluation(interval_hours=24):
-    """Start the scheduled evaluation jobs"""
-    schedule.every(interval_hours).hours.do(evaluate_current_model)
-    
-    logger.info(f"Scheduled model evaluation every {interval_hours} hours")
-    
-    while True:
-        schedule.run_pending()
-        time.sleep(60)  # Check every minute
+def start_scheduled_evaluation(interval_hours=24, cv_interval_hours=168):
+    """Start the scheduled evaluation jobs (blocks)"""
+    scheduler = build_scheduler(interval_hours, cv_interval_hours)
+    logger.info(f"Scheduled evaluation, drift check and compaction every {interval_hours} hours")
+    if cv_interval_hours:
+        logger.info(f"Scheduled cross-validation every {cv_interval_hours} hours")
+    try:
+        scheduler.run_forever()
+    finally:
+        scheduler.stop()
+        if _alert_manager is not None:
+            _alert_manager.dispatcher.wait_idle(timeout=30)  # Deliver what is queued before exiting
 
 if __name__ == "__main__":
-    # Run immediately once
-    evaluate_current_model()
-    
-    # Then schedule recurring
+    # Evaluation, drift and plots run immediately (unless already run within
+    # their interval before a restart), then recur
     start_scheduled_evaluation()
@@ -0,0 +1,208 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def _run_job(func, cursor, conn):
+    """Child-process entry point: run one job and send back its outcome."""
+    try:
+        conn.send(("succeeded", func(cursor=cursor)))
+    except Exception as e:
+        traceback.print_exc()
+        conn.send(("failed", f"{type(e).__name__}: {str(e)}"))
+    finally:
+        conn.close()
+
+
+class ScheduledJob:
+    def __init__(self, name, func, interval, timeout=None, run_immediately=False, on_result=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.run_immediately = run_immediately
+        self.on_result = on_result
+
+
+class JobScheduler:
+    """Run periodic jobs in parallel child processes.
+
+    Each run gets its own (spawned) process, so independent jobs run in
+    parallel, a run that exceeds its timeout is terminated, and a crash
+    cannot take the scheduler down. A job is never started while its
+    previous run is still going; the skipped tick is counted instead.
+    Per-job state (last start/finish, status, error, counters) is written
+    to `state_path` after every change, so a restarted scheduler keeps the
+    original cadence instead of re-running everything.
+
+    Jobs are called as `func(cursor=...)` and may return a dict; its
+    `cursor` entry is persisted and passed to the next run, which is how
+    jobs only process what changed since they last succeeded. A job's
+    `on_result` callback is called with each successful result in the
+    scheduler's own process, for work whose state must outlive a single run
+    (such as alert deduplication and rate limits).
+    """
+
+    def __init__(self, state_path="monitoring_logs/scheduler_state.json", tick=1.0):
+        os.makedirs(os.path.dirname(state_path) or ".", exist_ok=True)
+        self.state_path = state_path
+        self.tick = tick
+        self.jobs = {}
+        self._running = {}  # name -> (process, connection, started monotonic)
+        self._context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.state = self._load_state()
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path) as f:
+                    return json.load(f)
+            except json.JSONDecodeError:
+                logger.error(f"Ignoring unreadable scheduler state {self.state_path}")
+        return {}
+
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def add(self, name, func, interval, timeout=None, run_immediately=False, on_result=None):
+        """Register `func` to run every `interval` seconds, killed after `timeout` seconds."""
+        self.jobs[name] = ScheduledJob(name, func, interval, timeout, run_immediately, on_result)
+        self.state.setdefault(name, {"runs": 0, "failures": 0, "timeouts": 0, "skipped_overlaps": 0,
+                                     "last_started": None, "last_finished": None, "last_status": None,
+                                     "last_duration": None, "last_error": None, "cursor": None,
+                                     "next_run": None})
+
+    def _due(self, job, now):
+        entry = self.state[job.name]
+        if entry["next_run"] is None:
+            entry["next_run"] = now if job.run_immediately else now + job.interval
+        return entry["next_run"] <= now
+
+    def run_pending(self, now=None):
+        """Reap finished runs, enforce timeouts and start every due job; returns the names started."""
+        now = time.time() if now is None else now
+        started = []
+        with self._lock:
+            self._reap()
+            for job in self.jobs.values():
+                if not self._due(job, now):
+                    continue
+                self.state[job.name]["next_run"] = now + job.interval
+                if job.name in self._running:
+                    self.state[job.name]["skipped_overlaps"] += 1
+                    logger.warning(f"Skipping {job.name}: previous run still in progress")
+                    continue
+                self._launch(job, now)
+                started.append(job.name)
+            self._save_state()
+        return started
+
+    def _launch(self, job, now):
+        receiver, sender = self._context.Pipe(duplex=False)
+        # Not daemonic: jobs such as cross-validation start worker pools of their own
+        process = self._context.Process(target=_run_job, name=f"job-{job.name}",
+                                        args=(job.func, self.state[job.name]["cursor"], sender))
+        process.start()
+        sender.close()
+        self._running[job.name] = (process, receiver, time.monotonic())
+        self.state[job.name]["last_started"] = datetime.fromtimestamp(now).isoformat()
+        logger.info(f"Started {job.name} (pid {process.pid})")
+
+    def _reap(self):
+        for name, (process, receiver, started) in list(self._running.items()):
+            job, entry = self.jobs[name], self.state[name]
+            duration = time.monotonic() - started
+            outcome = None
+            if receiver.poll():
+                try:
+                    outcome = receiver.recv()
+                except EOFError:
+                    outcome = ("failed", f"exited with code {process.exitcode}")
+            elif not process.is_alive():
+                outcome = ("failed", f"exited with code {process.exitcode}")
+            elif job.timeout is not None and duration > job.timeout:
+                process.terminate()
+                outcome = ("timed_out", f"killed after {job.timeout}s")
+                entry["timeouts"] += 1
+            if outcome is None:
+                continue
+
+            process.join(5)
+            receiver.close()
+            del self._running[name]
+            status, result = outcome
+            entry["runs"] += 1
+            entry["last_status"] = status
+            entry["last_finished"] = datetime.now().isoformat()
+            entry["last_duration"] = duration
+            if status == "succeeded":
+                entry["last_error"] = None
+                if isinstance(result, dict):
+                    entry["cursor"] = result.get("cursor", entry["cursor"])
+                    entry["last_result"] = {k: v for k, v in result.items() if k != "cursor"}
+                logger.info(f"{name} succeeded in {duration:.1f}s")
+                if job.on_result is not None:
+                    try:
+                        job.on_result(result)
+                    except Exception as e:
+                        logger.error(f"Handling the result of {name} failed: {str(e)}")
+            else:
+                entry["failures"] += status == "failed"
+                entry["last_error"] = result
+                logger.error(f"{name} {status.replace('_', ' ')}: {result}")
+
+    def wait(self, timeout=None):
+        """Block until no job is running (checking timeouts meanwhile)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                self._reap()
+                self._save_state()
+                if not self._running:
+                    return True
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(min(self.tick, 0.05))
+
+    def run_forever(self):
+        """Blocking scheduler loop (what `start` runs on a thread)."""
+        while not self._stop.is_set():
+            try:
+                self.run_pending()
+            except Exception as e:
+                logger.error(f"Scheduler tick failed: {str(e)}")
+            self._stop.wait(self.tick)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name="job-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """Stop scheduling and terminate runs still in progress."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        with self._lock:
+            for name, (process, receiver, started) in self._running.items():
+                process.terminate()
+                process.join(5)
+                receiver.close()
+                self.state[name]["last_status"] = "cancelled"
+            self._running.clear()
+            self._save_state()
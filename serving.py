@@ -0,0 +1,253 @@
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+TRAIN_DATA_PATH = "churn-bigml-80.csv"
+TARGET_COLUMN = "Churn"
+BOOLEAN_COLUMNS = ['International plan', 'Voice mail plan']
+
+
+class FeatureEncoder:
+    """Vectorized equivalent of the preprocessing in `model_pipeline.prepare_data`.
+
+    Everything that depends on the training data (column order, label
+    encoder classes, defaults for missing features) is computed once, so
+    encoding a batch is a handful of column operations instead of re-reading
+    the training CSV and refitting LabelEncoders per request.
+    """
+
+    def __init__(self, feature_names, categorical_classes, defaults, numeric_columns):
+        self.feature_names = list(feature_names)
+        self.categorical_classes = categorical_classes
+        self.defaults = defaults
+        self.numeric_columns = list(numeric_columns)
+
+    @classmethod
+    def from_training_data(cls, path=TRAIN_DATA_PATH, target_column=TARGET_COLUMN):
+        df_train = pd.read_csv(path)
+        features = df_train.drop(columns=[target_column])
+        object_cols = list(features.select_dtypes(include=['object']).columns)
+        categorical_classes = {
+            # LabelEncoder assigns codes in sorted order of the training values
+            col: np.sort(features[col].astype(str).unique())
+            for col in object_cols if col not in BOOLEAN_COLUMNS
+        }
+        defaults = {
+            col: (features[col].mode()[0] if col in object_cols else float(features[col].mean()))
+            for col in features.columns
+        }
+        numeric_columns = [col for col in features.columns if col not in object_cols]
+        return cls(features.columns, categorical_classes, defaults, numeric_columns)
+
+    def missing_features(self, columns):
+        present = set(columns)
+        return [feature for feature in self.feature_names if feature not in present]
+
+    def encode_frame(self, df):
+        """Encode raw feature rows into the model's numeric input frame.
+
+        Missing columns are filled with training defaults; unknown categories
+        and non-numeric values raise ValueError.
+        """
+        df = df.copy()
+        for feature in self.missing_features(df.columns):
+            df[feature] = self.defaults[feature]
+        df = df[self.feature_names]
+
+        for col in BOOLEAN_COLUMNS:
+            if col in df.columns:
+                df[col] = (df[col].astype(str).str.lower() == 'yes').astype(int)
+
+        for col, classes in self.categorical_classes.items():
+            values = df[col].astype(str)
+            codes = pd.Categorical(values, categories=classes).codes
+            if (codes < 0).any():
+                unknown = sorted(set(values[codes < 0]))
+                raise ValueError(f"y contains previously unseen labels: {unknown}")
+            df[col] = codes.astype(np.int64)
+
+        for col in self.numeric_columns:
+            df[col] = pd.to_numeric(df[col])
+
+        return df
+
+    def encode_records(self, records):
+        return self.encode_frame(pd.DataFrame.from_records(records))
+
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def get_encoder():
+    """Return the process-wide encoder, building it on first use."""
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = FeatureEncoder.from_training_data()
+    return _encoder
+
+
+def score_frame(model, X):
+    """Score an encoded batch with a single predict_proba call.
+
+    Probabilities go through the model's calibrator
+    (model_pipeline.calibrate_model) when it has one, and the prediction is
+    then taken from the calibrated churn probability (>= 0.5), so the two
+    never disagree; uncalibrated models keep their own argmax decision.
+    """
+    probability = model.predict_proba(X)
+    calibrator = getattr(model, "calibrator_", None)
+    if calibrator is None:
+        prediction = model.classes_[probability.argmax(axis=1)]
+    else:
+        probability = calibrator.calibrate_proba(probability)
+        prediction = model.classes_[(probability[:, 1] >= 0.5).astype(int)]
+    return prediction.astype(int), probability
+
+
+class EarlyExitForest:
+    """Evaluate a forest block by block and stop once the vote is decided.
+
+    After k of T trees with churn-probability sum S, the final mean lies in
+    [(S + min_rest) / T, (S + max_rest) / T], where min_rest/max_rest are the
+    sums of the smallest/largest leaf values of the remaining trees. Once that
+    interval lies entirely on one side of the threshold the remaining trees
+    cannot change the decision, so they are skipped.
+
+    The trees are those of the uint16-quantized CompactForest, so results
+    match that forest's: leaf values differ from the original model's by at
+    most 1/65535, which can flip the decision for rows that close to the
+    threshold and makes every probability reported here approximate.
+
+    For a calibrated model the threshold applies to the calibrated
+    probability, as in score_frame; the calibrator is monotone, so that is
+    a fixed threshold on the raw vote (ProbabilityCalibrator.raw_threshold).
+    """
+
+    def __init__(self, forest, block_size=16):
+        from model_pipeline import CompactForest, QUANT_SCALE
+        self.calibrator = getattr(forest, "calibrator_", None)
+        forest = CompactForest.from_forest(forest)
+        self.forest = forest
+        self.block_size = block_size
+        self.scale = QUANT_SCALE
+
+        bounds = np.append(forest.roots.astype(np.int64), len(forest.value))
+        is_leaf = forest.left == np.arange(len(forest.left))
+        leaf_min, leaf_max = [], []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            leaves = forest.value[start:end][is_leaf[start:end]].astype(np.float64)
+            leaf_min.append(leaves.min())
+            leaf_max.append(leaves.max())
+        # suffix_*[k]: bound on the contribution of trees k..T-1
+        self.suffix_min = np.append(np.cumsum(leaf_min[::-1])[::-1], 0.0)
+        self.suffix_max = np.append(np.cumsum(leaf_max[::-1])[::-1], 0.0)
+
+        self._lock = threading.Lock()
+        self.rows_scored = 0
+        self.trees_evaluated = 0
+
+    def _leaf_values(self, X, trees):
+        forest = self.forest
+        node = np.repeat(forest.roots[trees][None, :], len(X), axis=0)
+        rows = np.arange(len(X))[:, None]
+        for _ in range(forest.max_depth):
+            go_left = X[rows, forest.feature[node]] <= forest.threshold[node]
+            node = np.where(go_left, forest.left[node], forest.right[node])
+        return forest.value[node].sum(axis=1, dtype=np.float64)
+
+    def predict(self, X, threshold=0.5):
+        """Return (prediction, churn probability estimate, trees evaluated) per row.
+
+        When all trees were evaluated the probability is the quantized
+        forest's. Otherwise it is the mean of the evaluated trees, clipped to
+        the range the full mean is known to lie in, so it agrees with the
+        decision. Calibrated models report it calibrated, like score_frame.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        n_trees = self.forest.n_estimators
+        if self.calibrator is None:
+            # Same tie rule as the forest's argmax: churn only above the threshold
+            inclusive, raw_threshold = False, threshold
+        else:
+            inclusive, raw_threshold = True, self.calibrator.raw_threshold(threshold)
+        cutoff = raw_threshold * self.scale * n_trees
+        sums = np.zeros(len(X))
+        low = np.zeros(len(X))
+        high = np.zeros(len(X))
+        trees_used = np.full(len(X), n_trees)
+        churn = np.zeros(len(X), dtype=bool)
+        active = np.arange(len(X))
+
+        for start in range(0, n_trees, self.block_size):
+            stop = min(start + self.block_size, n_trees)
+            sums[active] += self._leaf_values(X[active], np.arange(start, stop))
+            lower = sums[active] + self.suffix_min[stop]
+            upper = sums[active] + self.suffix_max[stop]
+            if inclusive:
+                yes, no = lower >= cutoff, upper < cutoff
+            else:
+                yes, no = lower > cutoff, upper <= cutoff
+            finished = yes | no
+            churn[active[yes]] = True
+            trees_used[active[finished]] = stop
+            low[active[finished]] = lower[finished]
+            high[active[finished]] = upper[finished]
+            active = active[~finished]
+            if active.size == 0:
+                break
+
+        with self._lock:
+            self.rows_scored += len(X)
+            self.trees_evaluated += int(trees_used.sum())
+
+        probability = np.clip(sums / (trees_used * self.scale), low / (n_trees * self.scale),
+                              high / (n_trees * self.scale))
+        if self.calibrator is not None:
+            probability = self.calibrator.transform(probability)
+        prediction = self.forest.classes_[churn.astype(int)]
+        return prediction, probability, trees_used
+
+    def stats(self):
+        with self._lock:
+            rows, trees = self.rows_scored, self.trees_evaluated
+        return {
+            "n_estimators": self.forest.n_estimators,
+            "rows_scored": rows,
+            "avg_trees_evaluated": trees / rows if rows else None,
+        }
+
+
+def benchmark_early_exit(model, X, block_size=16):
+    """Compare per-row latency and decisions of early-exit vs full-ensemble (score_frame) inference."""
+    import time
+    early = EarlyExitForest(model, block_size=block_size)
+    X = pd.DataFrame(X)
+    full_times, early_times, trees, agree = [], [], [], 0
+    for i in range(len(X)):
+        row = X.iloc[i:i + 1]
+        start = time.perf_counter()
+        full_pred, _ = score_frame(model, row)
+        full_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        pred, _, used = early.predict(row)
+        early_times.append(time.perf_counter() - start)
+        trees.append(int(used[0]))
+        agree += int(pred[0] == full_pred[0])
+
+    return {
+        "rows": len(X),
+        "n_estimators": early.forest.n_estimators,
+        "avg_trees_evaluated": float(np.mean(trees)),
+        "decision_agreement": agree / len(X),
+        "full_p50_ms": float(np.percentile(full_times, 50) * 1000),
+        "early_exit_p50_ms": float(np.percentile(early_times, 50) * 1000),
+        "full_mean_ms": float(np.mean(full_times) * 1000),
+        "early_exit_mean_ms": float(np.mean(early_times) * 1000),
+    }
@@ -0,0 +1,111 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Modules that must stay off the serving import path (loaded lazily on demand)
+LAZY_MODULES = [
+    "matplotlib",
+    "matplotlib.pyplot",
+    "sklearn.ensemble",
+    "sklearn.metrics",
+    "sklearn.preprocessing",
+]
+
+# Cold-start budget for `import app` in a fresh interpreter
+DEFAULT_BUDGET_SECONDS = 2.0
+
+
+def parse_importtime(stderr):
+    """Parse `python -X importtime` output into (module, self_us, cumulative_us) rows."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def import_breakdown(module="app", top_n=20):
+    """Return the top-level import cost of `module` and its slowest dependencies."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    )
+    rows = parse_importtime(result.stderr)
+    total_us = next((cum for name, _, cum in rows if name.strip() == module), 0)
+    slowest = sorted(rows, key=lambda r: r[2], reverse=True)[:top_n]
+    return {
+        "module": module,
+        "total_ms": total_us / 1000,
+        "slowest": [
+            {"module": name.strip(), "depth": (len(name) - len(name.lstrip())) // 2,
+             "self_ms": self_us / 1000, "cumulative_ms": cum_us / 1000}
+            for name, self_us, cum_us in slowest
+        ],
+    }
+
+
+def measure_startup(module="app", runs=5):
+    """Time `import module` in fresh interpreters and report loaded lazy modules."""
+    probe = (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"import {module}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {LAZY_MODULES!r} if m in sys.modules]}}))\n"
+    )
+    timings = []
+    loaded = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", probe],
+                                capture_output=True, text=True, check=True)
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        timings.append(report["seconds"])
+        loaded = report["loaded"]
+    return {
+        "module": module,
+        "runs": runs,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "max_seconds": max(timings),
+        "lazy_modules_loaded": loaded,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure API process import/startup time")
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=20, help="Slowest imports to list")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS,
+                        help=f"Fail if median import time exceeds this (default: {DEFAULT_BUDGET_SECONDS}s)")
+    args = parser.parse_args(argv)
+
+    startup = measure_startup(args.module, args.runs)
+    breakdown = import_breakdown(args.module, args.top)
+
+    print(f"import {args.module}: median {startup['median_seconds'] * 1000:.1f} ms "
+          f"over {args.runs} runs (min {startup['min_seconds'] * 1000:.1f}, "
+          f"max {startup['max_seconds'] * 1000:.1f})")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for row in breakdown["slowest"]:
+        print(f"{row['cumulative_ms']:14.1f} {row['self_ms']:9.1f}  {'  ' * row['depth']}{row['module']}")
+
+    ok = True
+    if startup["lazy_modules_loaded"]:
+        print(f"Eagerly imported lazy modules: {startup['lazy_modules_loaded']}")
+        ok = False
+    if startup["median_seconds"] > args.budget:
+        print(f"Startup exceeds budget of {args.budget:.2f}s")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
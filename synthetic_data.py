@@ -0,0 +1,296 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr, ndtri
+
+logger = logging.getLogger(__name__)
+
+TRAIN_DATA_PATH = "churn-bigml-80.csv"
+TARGET_COLUMN = "Churn"
+SYNTHETIC_DIR = os.path.join("test_results", "synthetic")
+
+# Numeric columns with at most this many distinct values are sampled as
+# categories, so e.g. "Area code" never takes a value between two codes
+MAX_DISCRETE_VALUES = 20
+
+
+def _python_value(value):
+    return value.item() if isinstance(value, np.generic) else value
+
+
+class ChurnDataModel:
+    """Per-column marginals plus a Gaussian copula learned from a churn CSV.
+
+    Numeric columns keep an empirical quantile function (interpolated and
+    rounded to the precision seen in the data); categorical, boolean and
+    low-cardinality columns keep their value frequencies. Dependence between
+    features is captured by the correlation of their normal scores, so
+    sampling is: correlated normals -> uniforms -> each column's inverse CDF.
+    That keeps pairs like minutes/charge related at any scale.
+
+    Churn depends on the features in ways a copula cannot express (it jumps
+    at four service calls), so the label is drawn from the leaf churn rates
+    of a shallow decision tree fitted on the source rows instead.
+    """
+
+    def __init__(self, columns, kinds, marginals, correlation, target_column=TARGET_COLUMN,
+                 label_tree=None):
+        self.columns = list(columns)
+        self.kinds = kinds
+        self.marginals = marginals
+        self.target_column = target_column
+        self.features = [col for col in self.columns if col != target_column]
+        self.correlation = np.asarray(correlation, dtype=float)
+        self._cholesky = np.linalg.cholesky(self.correlation)
+        self.label_tree = label_tree
+
+    @classmethod
+    def fit(cls, path=TRAIN_DATA_PATH, target_column=TARGET_COLUMN, grid_size=1001, tree_depth=6):
+        from sklearn.tree import DecisionTreeClassifier
+        df = pd.read_csv(path)
+        kinds, marginals, scores = {}, {}, []
+        for col in df.columns:
+            values = df[col]
+            numeric = pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+            if numeric and values.nunique() > MAX_DISCRETE_VALUES:
+                kinds[col] = "numeric"
+                as_float = values.astype(float)
+                decimals = 0 if pd.api.types.is_integer_dtype(values) else max(
+                    len(s.partition(".")[2]) for s in values.astype(str))
+                marginals[col] = {
+                    "quantiles": np.quantile(as_float, np.linspace(0, 1, grid_size)).tolist(),
+                    "decimals": decimals,
+                    "integer": bool(pd.api.types.is_integer_dtype(values)),
+                }
+            else:
+                kinds[col] = "categorical"
+                counts = values.value_counts().sort_index()
+                marginals[col] = {
+                    "values": [_python_value(v) for v in counts.index],
+                    "cumulative": (counts.cumsum() / counts.sum()).tolist(),
+                }
+            if col != target_column:
+                # Normal scores: ties share their average rank, so categories map to bands
+                ranks = values.rank(method="average").to_numpy()
+                scores.append(ndtri(ranks / (len(values) + 1)))
+
+        correlation = cls._nearest_correlation(np.corrcoef(np.vstack(scores)))
+        model = cls(df.columns, kinds, marginals, correlation, target_column)
+        encoded = model.encode(df)
+        tree = DecisionTreeClassifier(max_depth=tree_depth, min_samples_leaf=25, random_state=0)
+        tree.fit(model._feature_matrix(encoded), encoded[target_column])
+        # Probability of each label code per node (the tree only knows the codes it saw)
+        probability = np.zeros((tree.tree_.node_count, len(marginals[target_column]["values"])))
+        counts = tree.tree_.value[:, 0, :]
+        probability[:, tree.classes_] = counts / counts.sum(axis=1, keepdims=True)
+        model.label_tree = {
+            "feature": tree.tree_.feature.tolist(),
+            "threshold": tree.tree_.threshold.tolist(),
+            "left": tree.tree_.children_left.tolist(),
+            "right": tree.tree_.children_right.tolist(),
+            "probability": probability.tolist(),
+        }
+        return model
+
+    @staticmethod
+    def _nearest_correlation(matrix, floor=1e-6):
+        """Clip eigenvalues so near-duplicate columns (minutes vs charge) still factorize."""
+        eigenvalues, eigenvectors = np.linalg.eigh(matrix)
+        fixed = eigenvectors @ np.diag(np.maximum(eigenvalues, floor)) @ eigenvectors.T
+        scale = np.sqrt(np.diag(fixed))
+        return fixed / np.outer(scale, scale)
+
+    def to_dict(self):
+        return {"columns": self.columns, "kinds": self.kinds, "marginals": self.marginals,
+                "correlation": self.correlation.tolist(), "target_column": self.target_column,
+                "label_tree": self.label_tree}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["columns"], data["kinds"], data["marginals"], data["correlation"],
+                   data["target_column"], data["label_tree"])
+
+    def encode(self, df):
+        """Map a frame's categorical columns to the model's integer codes."""
+        columns = {}
+        for col in self.columns:
+            values = df[col].to_numpy()
+            if self.kinds[col] == "categorical":
+                values = np.searchsorted(np.asarray(self.marginals[col]["values"]), values).astype(np.int16)
+            columns[col] = values
+        return columns
+
+    def _feature_matrix(self, columns):
+        return np.column_stack([np.asarray(columns[col], dtype=float) for col in self.features])
+
+    def _sample_labels(self, columns, rng):
+        tree = {key: np.asarray(value) for key, value in self.label_tree.items()}
+        X = self._feature_matrix(columns)
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.int64)
+        while True:
+            internal = tree["left"][node] >= 0
+            if not internal.any():
+                break
+            at = node[internal]
+            go_left = X[rows[internal], tree["feature"][at]] <= tree["threshold"][at]
+            node[internal] = np.where(go_left, tree["left"][at], tree["right"][at])
+        cumulative = np.cumsum(tree["probability"][node], axis=1)
+        codes = (rng.random(len(X))[:, None] >= cumulative[:, :-1]).sum(axis=1)
+        return codes.astype(np.int16)
+
+    def _uniforms(self, n_rows, rng):
+        normals = rng.standard_normal((n_rows, len(self.features)))
+        return ndtr(normals @ self._cholesky.T)
+
+    def sample_codes(self, n_rows, rng):
+        """Sample `n_rows` rows as {column: array}; categorical columns as integer codes."""
+        uniforms = self._uniforms(n_rows, rng)
+        result = {}
+        for i, col in enumerate(self.features):
+            u, marginal = uniforms[:, i], self.marginals[col]
+            if self.kinds[col] == "numeric":
+                quantiles = np.asarray(marginal["quantiles"])
+                grid = np.linspace(0, 1, len(quantiles))
+                values = np.round(np.interp(u, grid, quantiles), marginal["decimals"])
+                result[col] = values.astype(np.int64) if marginal["integer"] else values
+            else:
+                codes = np.searchsorted(marginal["cumulative"], u, side="right")
+                result[col] = np.minimum(codes, len(marginal["cumulative"]) - 1).astype(np.int16)
+        result[self.target_column] = self._sample_labels(result, rng)
+        return {col: result[col] for col in self.columns}
+
+    def decode(self, columns):
+        """Turn sampled codes back into a frame with the source CSV's values and dtypes."""
+        frame = {}
+        for col in self.columns:
+            values = columns[col]
+            if self.kinds[col] == "categorical":
+                values = np.asarray(self.marginals[col]["values"])[values]
+            frame[col] = values
+        return pd.DataFrame(frame, columns=self.columns)
+
+    def sample(self, n_rows, rng):
+        return self.decode(self.sample_codes(n_rows, rng))
+
+    def iter_chunks(self, n_rows, seed=0, chunk_rows=100000, codes=False):
+        """Yield `n_rows` synthetic rows in chunks of at most `chunk_rows`.
+
+        Chunk i draws from its own generator seeded by (seed, i), so the output
+        only depends on (seed, chunk_rows) and memory stays at one chunk.
+        """
+        for index, start in enumerate(range(0, n_rows, chunk_rows)):
+            rng = np.random.default_rng([seed, index])
+            size = min(chunk_rows, n_rows - start)
+            yield self.sample_codes(size, rng) if codes else self.sample(size, rng)
+
+
+def write_csv(path, n_rows, seed=0, chunk_rows=100000, model=None):
+    """Stream `n_rows` synthetic rows to a CSV with the training file's schema."""
+    model = model or ChurnDataModel.fit()
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", newline="") as f:
+            for i, chunk in enumerate(model.iter_chunks(n_rows, seed, chunk_rows)):
+                chunk.to_csv(f, index=False, header=i == 0)
+        os.replace(tmp_path, path)
+        return path
+    except Exception as e:
+        logger.error(f"Error writing synthetic CSV: {str(e)}")
+        raise
+
+
+def write_binary(path, n_rows, seed=0, chunk_rows=100000, model=None):
+    """Write `n_rows` synthetic rows as a directory of column .npy files.
+
+    Categorical columns are stored as int16 codes; `schema.json` keeps the
+    fitted model (and so the code -> value tables). Files are preallocated
+    with open_memmap and filled chunk by chunk, and `read_binary` maps them
+    back without loading everything. Like write_csv, everything is written
+    under a temporary name first, so an interrupted run leaves no dataset.
+    """
+    model = model or ChurnDataModel.fit()
+    try:
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        # Column dtypes from an empty sample, so n_rows=0 still writes every column
+        arrays = {
+            col: np.lib.format.open_memmap(os.path.join(tmp_path, f"{i:02d}.npy"), mode="w+",
+                                           dtype=values.dtype, shape=(n_rows,))
+            for i, (col, values) in enumerate(model.sample_codes(0, np.random.default_rng(seed)).items())
+        }
+        offset = 0
+        for chunk in model.iter_chunks(n_rows, seed, chunk_rows, codes=True):
+            for col, values in chunk.items():
+                arrays[col][offset:offset + len(values)] = values
+            offset += len(values)
+        for array in arrays.values():
+            array.flush()
+        del arrays
+        with open(os.path.join(tmp_path, "schema.json"), "w") as f:
+            json.dump({"n_rows": n_rows, "seed": seed, "chunk_rows": chunk_rows,
+                       "model": model.to_dict()}, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_path, path)
+        return path
+    except Exception as e:
+        logger.error(f"Error writing synthetic binary dataset: {str(e)}")
+        raise
+
+
+def read_binary(path, start=0, stop=None):
+    """Load rows [start, stop) of a `write_binary` dataset as a CSV-compatible frame."""
+    with open(os.path.join(path, "schema.json")) as f:
+        schema = json.load(f)
+    model = ChurnDataModel.from_dict(schema["model"])
+    columns = {
+        col: np.load(os.path.join(path, f"{i:02d}.npy"), mmap_mode="r")[start:stop]
+        for i, col in enumerate(model.columns)
+    }
+    return model.decode(columns)
+
+
+def ensure_dataset(n_rows, seed=0, fmt="csv", directory=SYNTHETIC_DIR, chunk_rows=100000):
+    """Path of a cached synthetic dataset of `n_rows` rows, generating it on first use."""
+    # The rows depend on (seed, chunk_rows), so both name the cached file
+    name = f"churn-{n_rows}-seed{seed}-chunk{chunk_rows}" + (".csv" if fmt == "csv" else "")
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        return path
+    start = time.perf_counter()
+    writer = write_csv if fmt == "csv" else write_binary
+    writer(path, n_rows, seed=seed, chunk_rows=chunk_rows)
+    logger.info(f"Generated {n_rows} synthetic rows at {path} in {time.perf_counter() - start:.1f}s")
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic churn data for scale testing")
+    parser.add_argument("output", help="Output CSV file, or directory for --format binary")
+    parser.add_argument("--rows", type=int, default=1000000, help="Number of rows (default: 1000000)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: 0)")
+    parser.add_argument("--format", choices=["csv", "binary"], default="csv", help="Output format")
+    parser.add_argument("--chunk_rows", type=int, default=100000, help="Rows generated per chunk")
+    parser.add_argument("--source", default=TRAIN_DATA_PATH, help="CSV to learn the distributions from")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    model = ChurnDataModel.fit(args.source)
+    writer = write_csv if args.format == "csv" else write_binary
+    start = time.perf_counter()
+    writer(args.output, args.rows, seed=args.seed, chunk_rows=args.chunk_rows, model=model)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Wrote {args.rows} rows to {args.output} in {elapsed:.1f}s "
+                f"({args.rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
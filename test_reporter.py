@@ -5,8 +5,21 @@ import requests
 import sys
 import time
 import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from datetime import datetime
 
+ENDPOINTS = [
+    "http://localhost:8000/api/test-results",          # Local address
+    "http://127.0.0.1:8000/api/test-results",          # Alternative local address
+    "http://ml-backend:8000/api/test-results",         # Service name in docker-compose
+    "http://host.docker.internal:8000/api/test-results" # Docker internal DNS
+]
+
+# Overall time budget for delivering results to the API (seconds)
+SEND_DEADLINE = float(os.environ.get("TEST_RESULTS_DEADLINE", 10))
+
 def parse_pytest_output(output):
     results = []
     current_test = None
@@ -75,13 +88,10 @@ def save_to_file(results, output_dir="test_results"):
         except Exception as read_error:
             print(f"Failed to read existing results: {read_error}")
         
-        # Merge results (combine existing results with new ones)
-        existing_test_names = {r["name"] for r in existing_results.get("results", [])}
-        
-        # Add new results, replacing existing ones with the same name
-        new_results = [r for r in existing_results.get("results", []) 
-                      if r["name"] not in {nr["name"] for nr in results["results"]}]
-        new_results.extend(results["results"])
+        # Merge results: new results replace existing ones with the same name
+        merged = {r["name"]: r for r in existing_results.get("results", [])}
+        merged.update((r["name"], r) for r in results["results"])
+        new_results = list(merged.values())
         
         # Update totals
         merged_results = {
@@ -117,58 +127,59 @@ def save_to_file(results, output_dir="test_results"):
         print(f"Failed to save results to file: {file_error}")
         return False
     
-def send_results(results):
+def _post_until(endpoint, results, deadline, done):
+    """Post to one endpoint, retrying with backoff until it succeeds, another endpoint did, or time runs out."""
+    attempt = 0
+    while not done.is_set():
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False
+        try:
+            response = requests.post(endpoint, json=results, timeout=min(remaining, 5))
+            if response.status_code == 200:
+                return True
+            print(f"API at {endpoint} returned status code {response.status_code}: {response.text}")
+        except requests.exceptions.RequestException as e:
+            print(f"Could not reach {endpoint}: {e.__class__.__name__}")
+        wait_time = min(0.5 * 2 ** attempt, deadline - time.monotonic())
+        attempt += 1
+        if wait_time > 0:
+            done.wait(wait_time)
+    return False
+
+def send_results(results, endpoints=ENDPOINTS, deadline=SEND_DEADLINE):
+    """Save results locally, then post them to every candidate endpoint in parallel.
+    
+    The first endpoint to accept the run wins; the others stop retrying. The
+    run carries a run_key, so the server stores it once even if several
+    endpoints reach the same API.
+    """
     try:
         # Always save to file first as backup
         save_to_file(results)
         
-        # Try multiple times with a backoff strategy
-        max_attempts = 3
-        endpoints = [
-            "http://localhost:8000/api/test-results",          # Local address
-            "http://127.0.0.1:8000/api/test-results",          # Alternative local address
-            "http://ml-backend:8000/api/test-results",         # Service name in docker-compose
-            "http://host.docker.internal:8000/api/test-results" # Docker internal DNS
-        ]
-        
-        # Try endpoints with retries
-        for endpoint in endpoints:
-            for attempt in range(max_attempts):
-                try:
-                    print(f"Trying endpoint {endpoint}, attempt {attempt+1}...")
-                    response = requests.post(
-                        endpoint,
-                        json=results,
-                        headers={"Content-Type": "application/json"},
-                        timeout=10
-                    )
-                    
-                    # Check if we got a successful response
-                    if response.status_code == 200:
-                        print(f"Successfully sent test results to {endpoint}")
+        results = {**results, "run_key": results.get("run_key") or uuid.uuid4().hex}
+        done = threading.Event()
+        end = time.monotonic() + deadline
+        executor = ThreadPoolExecutor(max_workers=len(endpoints))
+        futures = {executor.submit(_post_until, endpoint, results, end, done): endpoint
+                   for endpoint in endpoints}
+        pending = set(futures)
+        try:
+            while pending:
+                finished, pending = wait(pending, timeout=max(0, end - time.monotonic()),
+                                         return_when=FIRST_COMPLETED)
+                if not finished:
+                    break
+                for future in finished:
+                    if future.result():
+                        print(f"Successfully sent test results to {futures[future]}")
                         return True
-                    else:
-                        print(f"API returned status code {response.status_code}: {response.text}")
-                        if attempt < max_attempts - 1:
-                            wait_time = 2 ** attempt  # Exponential backoff
-                            print(f"Retrying in {wait_time} seconds...")
-                            time.sleep(wait_time)
-                        else:
-                            print(f"Failed to send results to {endpoint} after {max_attempts} attempts.")
-                            
-                except requests.exceptions.ConnectionError:
-                    if attempt < max_attempts - 1:
-                        # Wait and retry
-                        wait_time = 2 ** attempt  # Exponential backoff
-                        print(f"Connection error. Retrying in {wait_time} seconds...")
-                        time.sleep(wait_time)
-                    else:
-                        print(f"Failed to connect to {endpoint} after {max_attempts} attempts.")
-                except Exception as e:
-                    print(f"Error sending results to {endpoint}: {e}")
-                    break  # Try next endpoint
+        finally:
+            done.set()
+            executor.shutdown(wait=False, cancel_futures=True)
         
-        print("All endpoints failed. Results are saved to file.")        
+        print(f"No endpoint accepted the results within {deadline:.0f}s. Results are saved to file.")
         return True  # Return success since we already saved to file
         
     except Exception as e:
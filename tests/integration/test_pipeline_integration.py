@@ -1,8 +1,11 @@
 import pytest
-import requests
 import pandas as pd
+from fastapi.testclient import TestClient
+from app import app
 from model_pipeline import prepare_data, train_model
 
+client = TestClient(app)
+
 def test_full_pipeline_integration():
     """Test the entire pipeline from data preparation to API prediction"""
     # 1. Prepare data and train model
@@ -34,7 +37,7 @@ def test_full_pipeline_integration():
         }
     }
     
-    response = requests.post("http://localhost:8000/api/predict", json=test_data)
+    response = client.post("/api/predict", json=test_data)
     assert response.status_code == 200
     
     prediction_data = response.json()
@@ -64,7 +67,7 @@ def test_model_api_consistency():
     }
     
     # Get prediction from API
-    response = requests.post("http://localhost:8000/api/predict", json=api_data)
+    response = client.post("/api/predict", json=api_data)
     assert response.status_code == 200, f"API request failed: {response.text}"
     api_prediction = response.json()["prediction"]
     
@@ -1,12 +1,16 @@
 import pytest
 import time
-import requests
 import pandas as pd
 import numpy as np
+from fastapi.testclient import TestClient
+from app import app
+from load_generator import run_load_test, correct_coordinated_omission
 from model_pipeline import prepare_data, train_model
+from serving import benchmark_early_exit
 import psutil
 import os
-import concurrent.futures
+
+client = TestClient(app)
 
 def test_model_prediction_latency():
     """Test model prediction latency"""
@@ -42,61 +46,169 @@ def test_model_prediction_latency():
     assert p95_time < 0.2  # 95% of predictions should be under 200ms
     assert p99_time < 0.3  # 99% of predictions should be under 300ms
 
-def test_api_throughput():
-    """Test API throughput under load"""
-    test_data = {
-        "features": {
-            "State": "NY",
-            "Account length": 100,
-            "Area code": 408,
-            "International plan": "no",
-            "Voice mail plan": "no",
-            "Number vmail messages": 0,
-            "Total day minutes": 200,
-            "Total day calls": 100,
-            "Total day charge": 34,
-            "Total eve minutes": 200,
-            "Total eve calls": 100,
-            "Total eve charge": 17,
-            "Total night minutes": 200,
-            "Total night calls": 100,
-            "Total night charge": 9,
-            "Total intl minutes": 10,
-            "Total intl calls": 4,
-            "Total intl charge": 2.7,
-            "Customer service calls": 1
-        }
-    }
+def test_early_exit_inference():
+    """Test early-exit inference evaluates fewer trees and keeps the full-ensemble decision"""
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    model = train_model(X_train, y_train)
+    report = benchmark_early_exit(model, X_test.iloc[:200])
     
-    def make_request():
-        return requests.post("http://localhost:8000/api/predict", json=test_data)
+    print(f"\nEarly-exit Statistics:")
+    print(f"Average trees evaluated: {report['avg_trees_evaluated']:.1f} of {report['n_estimators']}")
+    print(f"Full ensemble p50: {report['full_p50_ms']:.2f}ms")
+    print(f"Early exit p50: {report['early_exit_p50_ms']:.2f}ms")
     
-    # Test concurrent requests
-    n_requests = 50
-    start_time = time.time()
+    assert report["avg_trees_evaluated"] < report["n_estimators"]
+    assert report["decision_agreement"] >= 0.99
+    assert report["early_exit_p50_ms"] < report["full_p50_ms"]
+
+def test_calibration_overhead():
+    """Test that calibrated probabilities add negligible per-request latency"""
+    from model_pipeline import split_calibration_data, calibrate_model
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    X_fit, X_cal, y_fit, y_cal = split_calibration_data(X_train, y_train)
+    model = train_model(X_fit, y_fit)
+    single_sample = X_test.iloc[0:1]
+    
+    report = {}
+    for method in ("isotonic", "platt"):
+        calibrator = calibrate_model(model, X_cal, y_cal, method).calibrator_
+        probability = model.predict_proba(single_sample)
+        predict_times, calibrate_times = [], []
+        for _ in range(200):
+            start = time.perf_counter()
+            probability = model.predict_proba(single_sample)
+            predict_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            calibrator.calibrate_proba(probability)
+            calibrate_times.append(time.perf_counter() - start)
+        report[method] = (np.median(predict_times) * 1000, np.median(calibrate_times) * 1000)
     
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(make_request) for _ in range(n_requests)]
-        responses = [f.result() for f in concurrent.futures.as_completed(futures)]
+    print(f"\nCalibration Overhead (single row, p50):")
+    for method, (predict_ms, calibrate_ms) in report.items():
+        print(f"{method:>9}: predict_proba {predict_ms:.3f}ms, calibration {calibrate_ms * 1000:.1f}us "
+              f"({calibrate_ms / predict_ms:.2%})")
+        assert calibrate_ms < 0.5
+        assert calibrate_ms < 0.02 * predict_ms
+
+def test_backend_benchmark():
+    """Compare model backends on fit time, per-row latency, size and accuracy"""
+    from model_pipeline import benchmark_backends, format_backend_table
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    rows = benchmark_backends(X_train, y_train, X_test, y_test, repeats=50)
+    
+    print(f"\nModel Backends:\n{format_backend_table(rows)}")
+    assert [row["model"] for row in rows] == ["random_forest", "hist_gbm"]
+    for row in rows:
+        assert row["accuracy"] > 0.85
+        assert row["single_row_ms"] < 100
+
+def test_wire_format_costs():
+    """Compare bytes and CPU per row of the batch wire formats against per-record JSON"""
+    import json
+    import wire_formats
+    from app import FeatureInput
+    from model_pipeline import load_model
+    from serving import get_encoder
+    frame = pd.read_csv("churn-bigml-20.csv").drop(columns=["Churn"])
+    rows = wire_formats.benchmark_formats(frame, load_model(), get_encoder())
+    
+    # Baseline: what /api/predict pays per record before scoring
+    bodies = [json.dumps({"features": record}) for record in frame.to_dict("records")]
+    start = time.perf_counter()
+    for body in bodies:
+        get_encoder().encode_records([FeatureInput.parse_raw(body).features])
+    per_record_us = (time.perf_counter() - start) / len(bodies) * 1e6
     
-    end_time = time.time()
+    print(f"\nWire Formats ({len(frame)} rows per batch):\n{wire_formats.format_benchmark_table(rows)}")
+    print(f"Per-record /api/predict JSON: {sum(map(len, bodies)) / len(bodies):.1f} B/row, "
+          f"{per_record_us:.1f}us/row to validate and encode")
+    by_name = {(row["format"], row["encoding"]): row for row in rows}
+    json_row = by_name[("json", "identity")]
+    assert json_row["decode_us_per_row"] < per_record_us
+    for name in ("msgpack", "arrow"):
+        if (name, "identity") in by_name:
+            assert by_name[(name, "identity")]["request_bytes_per_row"] < json_row["request_bytes_per_row"] / 3
+            assert by_name[(name, "identity")]["decode_us_per_row"] < json_row["decode_us_per_row"]
+
+def test_api_throughput():
+    """Test API throughput under load"""
+    # Closed loop: each client sends its next request as soon as the last returns
+    n_requests = 200
+    report = run_load_test(target="inprocess", mode="closed", concurrency=50, n_requests=n_requests)
     
-    # Calculate statistics
-    successful_requests = sum(1 for r in responses if r.status_code == 200)
-    total_time = end_time - start_time
-    requests_per_second = n_requests / total_time
+    total_time = report["elapsed_seconds"]
+    requests_per_second = report["requests_per_second"]
+    latency = report["corrected_latency"]
     
     print(f"\nThroughput Statistics:")
-    print(f"Total requests: {n_requests}")
-    print(f"Successful requests: {successful_requests}")
+    print(f"Total requests: {report['total_requests']}")
+    print(f"Successful requests: {report['successful_requests']}")
     print(f"Total time: {total_time:.2f} seconds")
     print(f"Requests per second: {requests_per_second:.2f}")
+    print(f"p50/p99 latency (CO-corrected): {latency['p50_ms']:.2f}ms / {latency['p99_ms']:.2f}ms")
     
     # Assertions
-    assert successful_requests == n_requests  # All requests should succeed
+    assert report["successful_requests"] == n_requests  # All requests should succeed
+    assert not report["errors"]
     assert total_time < 30  # Should complete within 30 seconds
     assert requests_per_second > 1  # Should handle at least 1 request per second
 
+def test_api_open_loop_latency():
+    """Test API latency at a fixed arrival rate"""
+    report = run_load_test(target="inprocess", mode="open", rate=20, duration=2)
+    
+    latency = report["corrected_latency"]
+    print(f"\nOpen-loop Statistics (offered {report['offered_rate']} req/s):")
+    print(f"Achieved: {report['requests_per_second']:.2f} req/s")
+    print(f"p50/p99 latency (from intended start): {latency['p50_ms']:.2f}ms / {latency['p99_ms']:.2f}ms")
+    
+    assert report["total_requests"] == 40
+    assert report["failed_requests"] == 0
+    # Latency measured from the schedule can never be shorter than service time
+    assert latency["p50_ms"] >= report["service_latency"]["p50_ms"] - 1e-6
+
+def test_admission_control_at_twice_capacity(monkeypatch):
+    """Test that shedding keeps admitted latency bounded when offered twice the capacity"""
+    import app as app_module
+    from admission import AdmissionController
+    frame = pd.read_csv("churn-bigml-20.csv").drop(columns=["Churn"])
+    # Distinct customers, so coalescing does not hide the load
+    payloads = [{"features": record} for record in frame.to_dict("records")]
+    
+    monkeypatch.setattr(app_module, "admission", AdmissionController(max_concurrency=2))
+    capacity = run_load_test(target="inprocess", mode="closed", concurrency=4, n_requests=200,
+                             payloads=payloads)["requests_per_second"]
+    
+    reports = {}
+    for slo_ms in (None, 100):
+        monkeypatch.setattr(app_module, "admission", AdmissionController(max_concurrency=2, slo_ms=slo_ms))
+        reports[slo_ms] = run_load_test(target="inprocess", mode="open", rate=2 * capacity, duration=3,
+                                        payloads=payloads, max_in_flight=10000)
+    
+    print(f"\nAdmission Control (capacity {capacity:.1f} req/s, offered {2 * capacity:.1f} req/s):")
+    for slo_ms, report in reports.items():
+        admitted = report["admitted_latency"]
+        print(f"SLO {f'{slo_ms}ms' if slo_ms else 'off'}: status {report['status_codes']}, "
+              f"admitted p50/p99 {admitted['p50_ms']:.1f}ms / {admitted['p99_ms']:.1f}ms")
+    
+    shed, unbounded = reports[100], reports[None]
+    assert not shed["errors"] and set(shed["status_codes"]) <= {200, 429, 503}
+    assert shed["status_codes"].get(503, 0) + shed["status_codes"].get(429, 0) > 0
+    # Admitted requests stay near the SLO instead of queueing without bound
+    assert shed["admitted_latency"]["p99_ms"] < 3 * 100
+    assert shed["admitted_latency"]["p99_ms"] < unbounded["admitted_latency"]["p99_ms"] / 2
+
+def test_coordinated_omission_correction():
+    """Test that stalled responses are back-filled with the requests they hid"""
+    latencies = [0.01, 0.01, 0.05]
+    corrected = correct_coordinated_omission(latencies, expected_interval=0.01)
+    
+    # The 50ms stall hid four requests that would have waited 40, 30, 20 and 10ms
+    assert len(corrected) == 7
+    assert np.allclose(sorted(corrected), [0.01, 0.01, 0.01, 0.02, 0.03, 0.04, 0.05])
+    # Nothing shorter than the interval is back-filled
+    assert np.allclose(sorted(correct_coordinated_omission([0.025], expected_interval=0.01)), [0.015, 0.025])
+
 def test_model_memory_usage():
     """Test model memory usage"""
     process = psutil.Process(os.getpid())
@@ -158,7 +270,8 @@ def test_api_response_size():
         }
     }
     
-    response = requests.post("http://localhost:8000/api/predict", json=test_data)
+    response = client.post("/api/predict", json=test_data)
+    assert response.status_code == 200
     response_size = len(response.content)
     
     print(f"\nAPI Response Size: {response_size/1024:.2f}KB")
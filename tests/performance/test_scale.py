@@ -0,0 +1,59 @@
+import os
+import time
+import tracemalloc
+import pandas as pd
+import pytest
+from model_monitoring import ModelMonitor
+from model_pipeline import prepare_data, train_model
+from serving import FeatureEncoder, score_frame
+from synthetic_data import ChurnDataModel, ensure_dataset, write_csv
+
+# Row counts to benchmark at, e.g. SCALE_ROWS=100000,1000000,10000000
+SCALES = [int(n) for n in os.environ.get("SCALE_ROWS", "10000,100000").split(",")]
+
+@pytest.mark.parametrize("n_rows", SCALES)
+def test_pipeline_at_scale(tmp_path, n_rows):
+    """Time data preparation, training, batch scoring and monitoring on synthetic data"""
+    path = ensure_dataset(n_rows, seed=0)
+    timings = {}
+    
+    start = time.perf_counter()
+    X_train, X_test, y_train, y_test = prepare_data(path, "churn-bigml-20.csv")
+    timings["prepare_data"] = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    model = train_model(X_train, y_train, n_estimators=20, max_depth=10)
+    timings["train_model"] = time.perf_counter() - start
+    
+    encoder = FeatureEncoder.from_training_data()
+    start = time.perf_counter()
+    scored = 0
+    for chunk in pd.read_csv(path, chunksize=100000):
+        predictions, churn_prob = score_frame(model, encoder.encode_frame(chunk.drop(columns=["Churn"])))
+        scored += len(predictions)
+    timings["batch_scoring"] = time.perf_counter() - start
+    assert scored == n_rows
+    
+    monitor = ModelMonitor(str(tmp_path))
+    start = time.perf_counter()
+    monitor.log_batch_metrics(y_train.to_numpy(), model.predict(X_train), X_train, visualize=False)
+    timings["monitoring"] = time.perf_counter() - start
+    
+    print(f"\nPipeline at {n_rows:,} rows:")
+    for stage, seconds in timings.items():
+        print(f"{stage:>14}: {seconds:8.2f}s ({n_rows / seconds:12,.0f} rows/s)")
+
+def test_generator_memory_is_bounded(tmp_path):
+    """Test that generating many rows only holds one chunk in memory"""
+    model = ChurnDataModel.fit()
+    peaks = {}
+    for n_rows in (20000, 80000):
+        tracemalloc.start()
+        start = time.perf_counter()
+        write_csv(str(tmp_path / f"{n_rows}.csv"), n_rows, chunk_rows=10000, model=model)
+        elapsed = time.perf_counter() - start
+        peaks[n_rows] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+        print(f"\nGenerated {n_rows:,} rows in {elapsed:.2f}s, peak {peaks[n_rows]:.1f}MB")
+    
+    assert peaks[80000] < 1.5 * peaks[20000]
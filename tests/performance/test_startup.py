@@ -0,0 +1,33 @@
+import pytest
+from startup_benchmark import (
+    measure_startup, import_breakdown, parse_importtime, DEFAULT_BUDGET_SECONDS
+)
+
+def test_api_import_is_lazy():
+    """Test that importing the API does not load training/plotting modules"""
+    report = measure_startup("app", runs=1)
+    assert report["lazy_modules_loaded"] == []
+
+def test_api_startup_time():
+    """Test that API cold start stays within its budget"""
+    report = measure_startup("app", runs=3)
+    
+    print(f"\nStartup Statistics:")
+    print(f"Median import time: {report['median_seconds']*1000:.2f}ms")
+    
+    assert report["median_seconds"] < DEFAULT_BUDGET_SECONDS
+
+def test_import_breakdown():
+    """Test the -X importtime breakdown"""
+    breakdown = import_breakdown("app", top_n=5)
+    assert breakdown["total_ms"] > 0
+    assert len(breakdown["slowest"]) == 5
+    assert breakdown["slowest"][0]["module"] == "app"
+
+def test_parse_importtime():
+    stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       120 |        120 |   json.decoder\n"
+        "import time:       300 |        420 | json\n"
+    )
+    assert parse_importtime(stderr) == [("   json.decoder", 120, 120), (" json", 300, 420)]
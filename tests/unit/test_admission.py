@@ -0,0 +1,122 @@
+import asyncio
+import time
+import pytest
+from admission import AdmissionController, Rejected, parse_deadline, INTERACTIVE, BATCH
+
+async def _hold(controller, lane, order, name, seconds=0.05, deadline=None):
+    async with controller.admit(lane, deadline):
+        order.append(name)
+        await asyncio.sleep(seconds)
+
+def test_concurrency_is_bounded_and_interactive_goes_first():
+    controller = AdmissionController(max_concurrency=1)
+    order = []
+
+    async def scenario():
+        first = asyncio.ensure_future(_hold(controller, BATCH, order, "batch-1"))
+        await asyncio.sleep(0.01)
+        waiting = [asyncio.ensure_future(_hold(controller, BATCH, order, "batch-2")),
+                   asyncio.ensure_future(_hold(controller, INTERACTIVE, order, "interactive"))]
+        await asyncio.sleep(0.01)
+        assert controller.stats()["lanes"][BATCH]["queued"] == 1
+        await asyncio.gather(first, *waiting)
+
+    asyncio.run(scenario())
+    # The interactive request arrived later but jumps the queued batch call
+    assert order == ["batch-1", "interactive", "batch-2"]
+    assert controller.stats()["lanes"][INTERACTIVE]["in_flight"] == 0
+
+def test_unshed_requests_only_wait():
+    controller = AdmissionController(max_concurrency=1, slo_ms=1, max_queue=0)
+    order = []
+
+    async def scenario():
+        running = asyncio.ensure_future(_hold(controller, BATCH, order, "a"))
+        await asyncio.sleep(0.01)
+        # Past its deadline, over the SLO and the queue bound: still served, in turn
+        async with controller.admit(BATCH, deadline=time.time() - 1, shed=False):
+            order.append("b")
+        await running
+
+    asyncio.run(scenario())
+    assert order == ["a", "b"]
+
+def test_full_queue_and_missed_slo_are_rejected():
+    controller = AdmissionController(max_concurrency=1, slo_ms=120, max_queue=1)
+    order = []
+
+    async def scenario():
+        running = asyncio.ensure_future(_hold(controller, INTERACTIVE, order, "a", seconds=0.1))
+        await asyncio.sleep(0.01)
+        queued = asyncio.ensure_future(_hold(controller, INTERACTIVE, order, "b", seconds=0.1))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Rejected) as full:
+            await _hold(controller, INTERACTIVE, order, "c")
+        await asyncio.gather(running, queued)
+
+        # Service time is now known (~100ms): two requests ahead cannot finish in 120ms
+        running = [asyncio.ensure_future(_hold(controller, INTERACTIVE, order, n, seconds=0.1)) for n in "de"]
+        await asyncio.sleep(0.01)
+        with pytest.raises(Rejected) as late:
+            await _hold(controller, INTERACTIVE, order, "f")
+        await asyncio.gather(*running, return_exceptions=True)
+        return full.value, late.value
+
+    full, late = asyncio.run(scenario())
+    assert full.status_code == 429 and "Retry-After" in full.headers()
+    assert late.status_code == 503
+    counters = controller.stats()["lanes"][INTERACTIVE]
+    assert counters["rejected_queue_full"] == 1 and counters["rejected_slo"] >= 1
+
+def test_client_deadline_drops_queued_request():
+    controller = AdmissionController(max_concurrency=1)
+    order = []
+
+    async def scenario():
+        running = asyncio.ensure_future(_hold(controller, INTERACTIVE, order, "slow", seconds=0.2))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Rejected) as expired:
+            await _hold(controller, INTERACTIVE, order, "hurried", deadline=time.time() + 0.05)
+        with pytest.raises(Rejected) as passed:
+            await _hold(controller, INTERACTIVE, order, "late", deadline=time.time() - 1)
+        await running
+        # The abandoned slot was not leaked
+        await _hold(controller, INTERACTIVE, order, "next", seconds=0)
+        return expired.value, passed.value
+
+    expired, passed = asyncio.run(scenario())
+    assert expired.status_code == passed.status_code == 503
+    assert order == ["slow", "next"]
+    assert controller.stats()["lanes"][INTERACTIVE]["expired_in_queue"] == 1
+
+def test_slot_is_held_until_cancelled_work_finishes():
+    import threading
+    controller = AdmissionController(max_concurrency=1)
+    release = threading.Event()
+
+    async def scenario():
+        caller = asyncio.ensure_future(controller.run(INTERACTIVE, None, release.wait, 5))
+        await asyncio.sleep(0.05)
+        caller.cancel()  # e.g. the client disconnected
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        # The thread is still running, so it still counts against the limit
+        assert controller.stats()["lanes"][INTERACTIVE]["in_flight"] == 1
+        waiting = asyncio.ensure_future(controller.run(INTERACTIVE, None, lambda: "next"))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        release.set()
+        assert await waiting == "next"
+        assert controller.stats()["lanes"][INTERACTIVE]["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+def test_parse_deadline():
+    assert parse_deadline({}, now=100.0) is None
+    assert parse_deadline({"X-Request-Timeout": "250"}, now=100.0) == 100.25
+    assert parse_deadline({"X-Request-Deadline": "123.5"}, now=100.0) == 123.5
+    with pytest.raises(ValueError):
+        parse_deadline({"X-Request-Timeout": "soon"})
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,55 @@
+import os
+import pytest
+from fastapi.testclient import TestClient
+import app as app_module
+from alert_store import AlertStore
+
+client = TestClient(app_module.app)
+
+def _fill(store, n, start=1000.0):
+    for i in range(n):
+        severity = "critical" if i % 5 == 0 else "warning"
+        store.append(severity, "accuracy", 0.8 - i / 1000, 0.85, f"alert {i}", timestamp=start + i)
+
+def test_query_filters_by_since_limit_and_severity(tmp_path):
+    store = AlertStore(str(tmp_path))
+    _fill(store, 50)
+    
+    latest = store.query(limit=3)
+    assert [a["message"] for a in latest] == ["alert 47", "alert 48", "alert 49"]
+    assert [a["message"] for a in store.query(since=1045.0)] == [f"alert {i}" for i in range(46, 50)]
+    critical = store.query(severity="critical", limit=100)
+    assert [a["message"] for a in critical] == [f"alert {i}" for i in range(0, 50, 5)]
+    assert set(latest[0]) == {"timestamp", "severity", "metric", "value", "threshold", "message"}
+
+def test_segments_rotate_and_are_retained(tmp_path):
+    store = AlertStore(str(tmp_path), max_segment_bytes=2000, max_segments=3)
+    _fill(store, 200)
+    
+    segments = sorted(f for f in os.listdir(store.alert_dir) if f.endswith(".jsonl"))
+    assert len(segments) == 3
+    assert len(segments) == len([f for f in os.listdir(store.alert_dir) if f.endswith(".idx")])
+    # Queries span segment boundaries; only the retained history is returned
+    alerts = store.query(limit=1000)
+    assert alerts[-1]["message"] == "alert 199"
+    assert 0 < len(alerts) < 200
+    assert [a["message"] for a in store.query(since=1190.0, limit=1000)] == [f"alert {i}" for i in range(191, 200)]
+
+def test_alerts_endpoint(tmp_path, monkeypatch):
+    store = AlertStore(str(tmp_path))
+    _fill(store, 20)
+    monkeypatch.setattr(app_module, "alert_store", store)
+    
+    response = client.get("/api/monitoring/alerts", params={"limit": 5, "severity": "critical"})
+    assert response.status_code == 200
+    assert [a["message"] for a in response.json()["alerts"]] == [f"alert {i}" for i in (0, 5, 10, 15)]
+    assert not response.json()["truncated"]
+    
+    since = store.query(limit=1)[0]["timestamp"]
+    assert client.get("/api/monitoring/alerts", params={"since": since}).json()["alerts"] == []
+    assert client.get("/api/monitoring/alerts", params={"limit": 2}).json()["truncated"]
+    assert client.get("/api/monitoring/alerts", params={"severity": "loud"}).status_code == 400
+    assert client.get("/api/monitoring/alerts", params={"since": "yesterday"}).status_code == 400
+
+if __name__ == "__main__":
+    pytest.main([__file__])
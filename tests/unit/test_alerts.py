@@ -0,0 +1,118 @@
+import json
+import threading
+import time
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from alert_config import AlertDispatcher, AlertManager, WebhookSender
+
+class StubWebhook:
+    """Local HTTP server recording webhook posts; can fail or stall on demand."""
+
+    def __init__(self, fail_first=0, delay=0.0):
+        self.posts = []
+        self.fail_first = fail_first
+        self.delay = delay
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                time.sleep(stub.delay)
+                status = 500 if stub.fail_first > 0 else 200
+                stub.fail_first -= 1
+                if status == 200:
+                    stub.posts.append(body["text"])
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def stub():
+    server = StubWebhook()
+    yield server
+    server.close()
+
+def test_submit_does_not_wait_for_slow_webhook(stub):
+    stub.delay = 1.0
+    dispatcher = AlertDispatcher({"slack": WebhookSender(stub.url, timeout=5)})
+    start = time.perf_counter()
+    assert dispatcher.submit("slack", "accuracy", "accuracy low")
+    assert time.perf_counter() - start < 0.1
+
+    assert dispatcher.wait_idle(timeout=5)
+    assert stub.posts == ["accuracy low"]
+    dispatcher.stop()
+
+def test_retries_with_backoff(stub):
+    stub.fail_first = 2
+    dispatcher = AlertDispatcher({"slack": WebhookSender(stub.url)}, backoff=0.05)
+    dispatcher.submit("slack", "accuracy", "accuracy low")
+
+    assert dispatcher.wait_idle(timeout=5)
+    assert stub.posts == ["accuracy low"]
+    assert dispatcher.stats()["retried"] == 2
+    assert dispatcher.stats()["sent"] == 1
+    dispatcher.stop()
+
+def test_repeated_alerts_are_coalesced(stub):
+    dispatcher = AlertDispatcher({"slack": WebhookSender(stub.url)}, dedup_window=0.3)
+    for i in range(5):
+        dispatcher.submit("slack", "accuracy", f"accuracy low #{i}")
+    dispatcher.submit("slack", "data_drift", "drift high")
+
+    assert dispatcher.wait_idle(timeout=5)
+    assert stub.posts[:2] == ["accuracy low #0", "drift high"]
+    assert len(stub.posts) == 3
+    assert stub.posts[2].startswith("accuracy low #4")
+    assert "repeated 4 times" in stub.posts[2]
+    dispatcher.stop()
+
+def test_rate_limit_and_bounded_queue():
+    sent = []
+    dispatcher = AlertDispatcher({"email": sent.append}, queue_size=3,
+                                 rate_limit_per_minute={"email": 60}, burst=1, autostart=False)
+    assert all(dispatcher.submit("email", f"key{i}", f"alert {i}") for i in range(3))
+    assert not dispatcher.submit("email", "key3", "alert 3")
+    assert dispatcher.stats()["dropped"] == 1
+
+    dispatcher.start()
+    time.sleep(0.3)
+    # One token up front, then one per second
+    assert sent == ["alert 0"]
+    assert dispatcher.wait_idle(timeout=5)
+    assert sent == ["alert 0", "alert 1", "alert 2"]
+    dispatcher.stop()
+
+def test_alert_manager_dispatches_to_webhook(stub, tmp_path):
+    config_file = tmp_path / "alert_config.json"
+    AlertManager(str(config_file), log_dir=str(tmp_path)).dispatcher.stop()
+    config = json.loads(config_file.read_text())
+    config["notifications"]["slack"] = {"enabled": True, "webhook_url": stub.url}
+    config_file.write_text(json.dumps(config))
+
+    manager = AlertManager(str(config_file), log_dir=str(tmp_path))
+    assert manager.check_and_alert({"accuracy": 0.5, "f1_score": 0.9})
+    assert not manager.check_and_alert({"accuracy": 0.95, "f1_score": 0.9})
+
+    assert manager.dispatcher.wait_idle(timeout=5)
+    assert len(stub.posts) == 1
+    assert "accuracy" in stub.posts[0]
+    assert [a["metric"] for a in manager.store.query()] == ["accuracy"]
+    assert manager.store.query()[0]["severity"] == "critical"
+    manager.dispatcher.stop()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
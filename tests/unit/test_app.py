@@ -1,6 +1,8 @@
 import pytest
 from fastapi.testclient import TestClient
+import os
 from app import app
+from profiling import Profiler
 
 client = TestClient(app)
 
@@ -21,6 +23,21 @@ def test_features_endpoint():
         assert "importance" in feature
         assert isinstance(feature["importance"], float)
 
+def test_features_endpoint_etag():
+    """Test that repeat feature requests are answered from the cached manifest"""
+    first = client.get("/api/features")
+    assert first.status_code == 200
+    assert "max-age" in first.headers["cache-control"]
+    etag = first.headers["etag"]
+    
+    second = client.get("/api/features", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    
+    metadata = client.get("/api/model/metadata").json()
+    assert metadata["features"] == first.json()
+    assert "params" in metadata and "metrics" in metadata
+
 def test_predict_endpoint_valid_input():
     """Test prediction endpoint with valid input"""
     test_data = {
@@ -134,5 +151,360 @@ def test_probability_sum():
     data = response.json()
     assert abs(data["churn_probability"] + data["retention_probability"] - 1.0) < 1e-6
 
+def test_predict_endpoint_profile_header(tmp_path, monkeypatch):
+    """Test that the X-Profile header captures a profile of the request"""
+    import app as app_module
+    profiler = Profiler(log_dir=str(tmp_path))
+    monkeypatch.setattr(app_module, "profiler", profiler)
+    test_data = {
+        "features": {
+            "State": "NY",
+            "Account length": 100,
+            "Area code": 408,
+            "International plan": "no",
+            "Voice mail plan": "no",
+            "Number vmail messages": 0,
+            "Total day minutes": 200,
+            "Total day calls": 100,
+            "Total day charge": 34,
+            "Total eve minutes": 200,
+            "Total eve calls": 100,
+            "Total eve charge": 17,
+            "Total night minutes": 200,
+            "Total night calls": 100,
+            "Total night charge": 9,
+            "Total intl minutes": 10,
+            "Total intl calls": 4,
+            "Total intl charge": 2.7,
+            "Customer service calls": 1
+        }
+    }
+    before = set(os.listdir(profiler.profile_dir))
+    response = client.post("/api/predict", json=test_data, headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    new_files = set(os.listdir(profiler.profile_dir)) - before
+    assert any(name.endswith(".calltree.txt") for name in new_files)
+    # The inference itself is profiled, on the worker thread that runs it
+    import pstats
+    prof = [name for name in new_files if name.endswith(".prof")]
+    stats = pstats.Stats(os.path.join(profiler.profile_dir, prof[0]))
+    assert any(function == "predict_proba" for _, _, function in stats.stats)
+
+def test_predict_endpoint_serves_compact_model(tmp_path, monkeypatch):
+    """Test that the API can serve the compacted forest directly"""
+    import app as app_module
+    from model_pipeline import prepare_data, load_model, compact_model, save_model
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    compact, _ = compact_model(load_model(), X_test, y_test, prune=False)
+    compact_path = str(tmp_path / "model_compact.pkl")
+    save_model(compact, compact_path)
+    monkeypatch.setattr(app_module, "MODEL_PATH", compact_path)
+    
+    response = client.post("/api/predict", json={"features": {
+        "State": "NY", "Account length": 100, "Area code": 408, "International plan": "no",
+        "Voice mail plan": "no", "Number vmail messages": 0, "Total day minutes": 200,
+        "Total day calls": 100, "Total day charge": 34, "Total eve minutes": 200,
+        "Total eve calls": 100, "Total eve charge": 17, "Total night minutes": 200,
+        "Total night calls": 100, "Total night charge": 9, "Total intl minutes": 10,
+        "Total intl calls": 4, "Total intl charge": 2.7, "Customer service calls": 1
+    }})
+    assert response.status_code == 200
+    assert abs(response.json()["churn_probability"] + response.json()["retention_probability"] - 1.0) < 1e-6
+    assert client.get("/api/features").status_code == 200
+
+def test_predict_endpoint_early_exit():
+    """Test early-exit inference against the full ensemble"""
+    test_data = {"features": {
+        "State": "NY", "Account length": 100, "Area code": 408, "International plan": "no",
+        "Voice mail plan": "no", "Number vmail messages": 0, "Total day minutes": 200,
+        "Total day calls": 100, "Total day charge": 34, "Total eve minutes": 200,
+        "Total eve calls": 100, "Total eve charge": 17, "Total night minutes": 200,
+        "Total night calls": 100, "Total night charge": 9, "Total intl minutes": 10,
+        "Total intl calls": 4, "Total intl charge": 2.7, "Customer service calls": 1
+    }}
+    full = client.post("/api/predict", json=test_data).json()
+    early = client.post("/api/predict?early_exit=true", json=test_data).json()
+    exact = client.post("/api/predict?early_exit=true&exact=true", json=test_data).json()
+    
+    assert early["prediction"] == full["prediction"]
+    assert 0 < early["trees_evaluated"] <= 100
+    assert early["probability_is_approximate"]
+    assert not exact["probability_is_approximate"]
+    assert exact["churn_probability"] == full["churn_probability"]
+    
+    stats = client.get("/api/predict/early-exit").json()
+    assert stats["rows_scored"] >= 1
+    assert stats["avg_trees_evaluated"] <= stats["n_estimators"]
+
+def test_explain_endpoint_batch():
+    """Test per-prediction explanations for a batch of records"""
+    record = {
+        "State": "NY", "Account length": 100, "Area code": 408, "International plan": "no",
+        "Voice mail plan": "no", "Number vmail messages": 0, "Total day minutes": 200,
+        "Total day calls": 100, "Total day charge": 34, "Total eve minutes": 200,
+        "Total eve calls": 100, "Total eve charge": 17, "Total night minutes": 200,
+        "Total night calls": 100, "Total night charge": 9, "Total intl minutes": 10,
+        "Total intl calls": 4, "Total intl charge": 2.7, "Customer service calls": 5
+    }
+    response = client.post("/api/explain", json={"records": [record, {**record, "Customer service calls": 0}],
+                                                  "top_k": 5})
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body["explanations"]) == 2
+    assert body["background"]["rows"] > 0
+    
+    predicted = client.post("/api/predict", json={"features": record}).json()
+    first = body["explanations"][0]
+    assert abs(first["churn_probability"] - predicted["churn_probability"]) < 1e-4
+    assert len(first["contributions"]) == 5
+    assert all(c["background_mean"] is not None for c in first["contributions"])
+    
+    assert client.post("/api/explain", json={"records": []}).status_code == 400
+    assert client.post("/api/explain", json={"records": [{"State": "NY"}]}).status_code == 400
+
+def test_explain_is_admitted_as_batch_work(monkeypatch):
+    """Test that explanations go through the batch lane and are cached per served model version"""
+    import time
+    import threading
+    import app as app_module
+    import explanations
+    record = {"State": "NY", "Account length": 100, "Area code": 408, "International plan": "no",
+              "Voice mail plan": "no", "Total day minutes": 200, "Total day calls": 100,
+              "Total day charge": 34, "Total eve minutes": 200, "Total eve charge": 17,
+              "Customer service calls": 1}
+    threads = []
+    explain = explanations.TreeExplainer.explain
+    def recording_explain(self, *args, **kwargs):
+        threads.append(threading.current_thread())
+        return explain(self, *args, **kwargs)
+    monkeypatch.setattr(explanations.TreeExplainer, "explain", recording_explain)
+
+    before = client.get("/api/predict/admission").json()["lanes"]["batch"]["admitted"]
+    assert client.post("/api/explain", json={"records": [record]}).status_code == 200
+    assert client.get("/api/predict/admission").json()["lanes"]["batch"]["admitted"] == before + 1
+    assert threads[0].name.startswith("AnyIO worker")  # Not the event loop thread
+    loaded = app_module.model_registry.get(app_module.MODEL_PATH)
+    assert list(app_module._explainers) == [(loaded.path, loaded.version)]
+
+    response = client.post("/api/explain", json={"records": [record]},
+                           headers={"X-Request-Deadline": str(time.time() - 1)})
+    assert response.status_code == 503
+
+def test_predict_with_shadow_and_canary(tmp_path, monkeypatch):
+    """Test that shadow models are compared off the request path and canaries serve traffic"""
+    import shutil
+    import app as app_module
+    from model_registry import ModelFleet
+    fleet = ModelFleet(app_module.model_registry)
+    monkeypatch.setattr(app_module, "model_fleet", fleet)
+    monkeypatch.setattr(app_module, "ROUTABLE_MODELS", [str(tmp_path / "shadow.pkl")])
+    monkeypatch.setattr(app_module, "MODEL_STORE_DIR", str(tmp_path / "store"))
+    shutil.copy("model.pkl", tmp_path / "shadow.pkl")
+    record = {"features": {
+        "State": "NY", "Account length": 100, "Area code": 408, "International plan": "no",
+        "Voice mail plan": "no", "Number vmail messages": 0, "Total day minutes": 200,
+        "Total day calls": 100, "Total day charge": 34, "Total eve minutes": 200,
+        "Total eve calls": 100, "Total eve charge": 17, "Total night minutes": 200,
+        "Total night calls": 100, "Total night charge": 9, "Total intl minutes": 10,
+        "Total intl calls": 4, "Total intl charge": 2.7, "Customer service calls": 1
+    }}
+
+    assert client.put("/api/models/routing", json={"shadow_models": ["model.pkl"]}).status_code == 400
+    response = client.put("/api/models/routing", json={"shadow_models": [str(tmp_path / "shadow.pkl")]})
+    assert response.status_code == 200
+    version = client.post("/api/predict", json=record).json()["model_version"]
+    assert fleet.wait_idle(timeout=10)
+    stats = client.get("/api/models").json()
+    assert stats["versions"][version]["served"] == 1
+    assert stats["versions"][version]["agreement_rate"] == 1.0
+
+    client.put("/api/models/routing", json={"canary_model": str(tmp_path / "shadow.pkl"), "canary_percent": 100})
+    client.post("/api/predict", json=record)
+    assert fleet.wait_idle(timeout=10)
+    assert client.get("/api/models").json()["versions"][version]["served"] == 2
+    assert client.put("/api/models/routing", json={"canary_percent": 150}).status_code == 400
+    fleet.shutdown()
+
+def test_routing_only_hosts_store_versions_and_allow_listed_models(tmp_path, monkeypatch):
+    """Test that the routing API refuses arbitrary paths and can require an admin token"""
+    import pickle
+    import app as app_module
+    from model_registry import ModelFleet
+    from model_store import ModelStore
+    from serving import get_encoder
+    fleet = ModelFleet(app_module.model_registry)
+    monkeypatch.setattr(app_module, "model_fleet", fleet)
+    monkeypatch.setattr(app_module, "ROUTABLE_MODELS", [])
+    monkeypatch.setattr(app_module, "MODEL_STORE_DIR", str(tmp_path / "store"))
+    with open("model.pkl", "rb") as f:
+        version = ModelStore(str(tmp_path / "store")).publish(f.read(), pickle.dumps(get_encoder()), {})
+
+    for name in ["model.pkl", str(tmp_path / "store" / "versions" / version / "model.pkl"), "../" + version, "ffff"]:
+        assert client.put("/api/models/routing", json={"shadow_models": [name]}).status_code == 400
+    assert client.put("/api/models/routing", json={"canary_model": version[:8]}).status_code == 200
+    assert fleet.canary_path == os.path.join(str(tmp_path / "store"), "versions", version, "model.pkl")
+
+    monkeypatch.setattr(app_module, "ROUTING_TOKEN", "secret")
+    assert client.put("/api/models/routing", json={"canary_percent": 10}).status_code == 401
+    assert client.put("/api/models/routing", json={"canary_percent": 10},
+                      headers={"X-Admin-Token": "secret"}).status_code == 200
+    fleet.shutdown()
+
+def test_slice_metrics_endpoint(tmp_path, monkeypatch):
+    """Test that per-slice evaluation metrics are served from the monitoring history"""
+    import app as app_module
+    from model_monitoring import ModelMonitor
+    from model_pipeline import prepare_data, load_model
+    monitor = ModelMonitor(str(tmp_path))
+    monkeypatch.setattr(app_module, "monitor", monitor)
+    assert client.get("/api/monitoring/slices").json() == {"evaluations": []}
+
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    monitor.log_batch_metrics(y_test, load_model().predict(X_test), X_test, visualize=False)
+    response = client.get("/api/monitoring/slices?column=International plan")
+    assert response.status_code == 200
+    slices = response.json()["evaluations"][0]["slices"]
+    assert {s["value"] for s in slices} == {"no", "yes"}
+    assert sum(s["support"] for s in slices) == len(X_test)
+    # States have too few rows in the test set to reach the stored minimum support
+    assert client.get("/api/monitoring/slices?column=State").json()["evaluations"][0]["slices"] == []
+
+def test_concurrent_identical_predictions_are_coalesced(tmp_path, monkeypatch):
+    """Test that concurrent identical requests share one inference and one log line"""
+    import asyncio
+    import json
+    import time
+    import httpx
+    import app as app_module
+    from model_monitoring import ModelMonitor
+    from request_coalescing import SingleFlight, IdempotencyCache
+    monitor = ModelMonitor(str(tmp_path))
+    monkeypatch.setattr(app_module, "monitor", monitor)
+    monkeypatch.setattr(app_module, "prediction_flights", SingleFlight())
+    monkeypatch.setattr(app_module, "idempotency_cache", IdempotencyCache(ttl=60))
+    score_frame = app_module.score_frame
+    def slow_score_frame(model, X):
+        time.sleep(0.3)  # Keep the first inference in flight while the others arrive
+        return score_frame(model, X)
+    monkeypatch.setattr(app_module, "score_frame", slow_score_frame)
+    record = {"features": {
+        "State": "NY", "Account length": 100, "Area code": 408, "International plan": "no",
+        "Voice mail plan": "no", "Number vmail messages": 0, "Total day minutes": 200,
+        "Total day calls": 100, "Total day charge": 34, "Total eve minutes": 200,
+        "Total eve calls": 100, "Total eve charge": 17, "Total night minutes": 200,
+        "Total night calls": 100, "Total night charge": 9, "Total intl minutes": 10,
+        "Total intl calls": 4, "Total intl charge": 2.7, "Customer service calls": 1
+    }}
+
+    async def burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as async_client:
+            return await asyncio.gather(*[async_client.post("/api/predict", json=record) for _ in range(8)])
+
+    responses = asyncio.run(burst())
+    assert all(r.status_code == 200 for r in responses)
+    assert len({json.dumps(r.json(), sort_keys=True) for r in responses}) == 1
+    assert sum(r.headers.get("X-Coalesced") == "true" for r in responses) == 7
+    stats = client.get("/api/predict/coalescing").json()["single_flight"]
+    assert stats["inferences"] == 1 and stats["coalesced"] == 7 and stats["in_flight"] == 0
+    with open(tmp_path / "predictions.jsonl") as f:
+        logged = [json.loads(line) for line in f]
+    assert len(logged) == 1 and logged[0]["count"] == 8
+
+def test_idempotency_key_replays_response(tmp_path, monkeypatch):
+    """Test that a retried Idempotency-Key gets the stored response without rescoring"""
+    import app as app_module
+    from model_monitoring import ModelMonitor
+    from request_coalescing import IdempotencyCache
+    monkeypatch.setattr(app_module, "monitor", ModelMonitor(str(tmp_path)))
+    monkeypatch.setattr(app_module, "idempotency_cache", IdempotencyCache(ttl=60))
+    record = {"features": {
+        "State": "NY", "Account length": 100, "Area code": 408, "International plan": "no",
+        "Voice mail plan": "no", "Number vmail messages": 0, "Total day minutes": 200,
+        "Total day calls": 100, "Total day charge": 34, "Total eve minutes": 200,
+        "Total eve calls": 100, "Total eve charge": 17, "Total night minutes": 200,
+        "Total night calls": 100, "Total night charge": 9, "Total intl minutes": 10,
+        "Total intl calls": 4, "Total intl charge": 2.7, "Customer service calls": 1
+    }}
+    headers = {"Idempotency-Key": "retry-1"}
+
+    first = client.post("/api/predict", json=record, headers=headers)
+    retry = client.post("/api/predict", json=record, headers=headers)
+    assert retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    with open(tmp_path / "predictions.jsonl") as f:
+        assert len(f.readlines()) == 1
+
+    other = {"features": dict(record["features"], **{"Customer service calls": 5})}
+    assert client.post("/api/predict", json=other, headers=headers).status_code == 422
+    stats = client.get("/api/predict/coalescing").json()["idempotency"]
+    assert stats["replays"] == 1 and stats["conflicts"] == 1
+
+def test_batch_predictions_negotiate_wire_format():
+    """Test columnar batch scoring in JSON, MessagePack and Arrow with compression"""
+    import pandas as pd
+    import numpy as np
+    import wire_formats
+    from model_pipeline import load_model
+    from serving import get_encoder, score_frame
+    frame = pd.read_csv("churn-bigml-20.csv").drop(columns=["Churn"]).head(200)
+    expected, probability = score_frame(load_model(), get_encoder().encode_frame(frame))
+
+    response = client.post("/api/predict/batch", content=wire_formats.dump_features(frame, "application/json"),
+                           headers={"Content-Type": "application/json"})
+    assert response.status_code == 200
+    assert response.json()["prediction"] == expected.tolist()
+    assert np.allclose(response.json()["churn_probability"], probability[:, 1])
+
+    pytest.importorskip("msgpack")
+    pytest.importorskip("pyarrow")
+    body = wire_formats.compress(wire_formats.dump_features(frame, wire_formats.MSGPACK), "gzip")
+    response = client.post("/api/predict/batch", content=body, headers={
+        "Content-Type": wire_formats.MSGPACK, "Content-Encoding": "gzip",
+        "Accept": wire_formats.ARROW, "Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == wire_formats.ARROW
+    # The test client already undid the gzip Content-Encoding
+    results = wire_formats.load_results(response.content, wire_formats.ARROW)
+    assert results["prediction"].tolist() == expected.tolist()
+
+    assert client.post("/api/predict/batch", content=b"a,b", headers={"Content-Type": "text/csv"}).status_code == 415
+    assert client.post("/api/predict/batch", content=b"{}", headers={"Accept": "text/html"}).status_code == 406
+    assert client.post("/api/predict/batch", content=b'{"records": []}').status_code == 400
+
+def test_predict_batch_rejects_oversized_bodies(monkeypatch):
+    """Test that batch bodies over MAX_BATCH_BYTES get 413, with or without a Content-Length"""
+    import app as app_module
+    monkeypatch.setattr(app_module, "MAX_BATCH_BYTES", 100)
+    body = b'{"records": [' + b"{}, " * 100 + b"{}]}"
+    response = client.post("/api/predict/batch", content=body, headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+
+    def chunks():
+        for start in range(0, len(body), 32):
+            yield body[start:start + 32]
+    response = client.post("/api/predict/batch", content=chunks(), headers={"Content-Type": "application/json"})
+    assert response.status_code == 413
+    assert client.post("/api/predict/batch", content=b'{"records": []}').status_code == 400
+
+def test_predict_honours_client_deadline():
+    """Test that expired client deadlines are shed before inference"""
+    import time
+    record = {"features": {"State": "NY", "Account length": 100, "Area code": 408,
+                           "International plan": "no", "Voice mail plan": "no",
+                           "Total day minutes": 200, "Total day calls": 100, "Total day charge": 34,
+                           "Total eve minutes": 200, "Total eve charge": 17, "Customer service calls": 1}}
+    before = client.get("/api/predict/admission").json()["lanes"]["interactive"]
+    response = client.post("/api/predict", json=record, headers={"X-Request-Deadline": str(time.time() - 1)})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert client.post("/api/predict", json=record, headers={"X-Request-Timeout": "soon"}).status_code == 400
+    assert client.post("/api/predict", json=record, headers={"X-Request-Timeout": "5000"}).status_code == 200
+    after = client.get("/api/predict/admission").json()["lanes"]["interactive"]
+    assert after["rejected_slo"] == before["rejected_slo"] + 1
+    assert after["admitted"] == before["admitted"] + 1
+
 if __name__ == "__main__":
     pytest.main([__file__])
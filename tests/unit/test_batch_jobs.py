@@ -0,0 +1,117 @@
+import os
+import time
+import pytest
+import pandas as pd
+from fastapi.testclient import TestClient
+from app import app
+from batch_jobs import BatchJobQueue, plan_partitions, COMPLETED, CANCELLED, QUEUED
+
+client = TestClient(app)
+
+@pytest.fixture
+def input_csv(tmp_path):
+    raw = pd.read_csv("churn-bigml-20.csv").drop(columns=["Churn"])
+    path = tmp_path / "input.csv"
+    pd.concat([raw] * 3, ignore_index=True).to_csv(path, index=False)
+    return str(path)
+
+def _queue(tmp_path, **kwargs):
+    return BatchJobQueue(db_path=str(tmp_path / "jobs.db"), output_root=str(tmp_path / "out"),
+                         input_root=str(tmp_path), partition_bytes=50_000, max_workers=2,
+                         poll_interval=0.1, **kwargs)
+
+def _wait(queue, job_id, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.status(job_id)
+        if job["state"] not in ("queued", "running"):
+            return job
+        time.sleep(0.2)
+    raise TimeoutError(job_id)
+
+def test_plan_partitions_cover_file_on_line_boundaries(input_csv):
+    with open(input_csv, "rb") as f:
+        content = f.read()
+    header_len = content.index(b"\n") + 1
+    partitions = plan_partitions(input_csv, "csv", 50_000)
+    
+    assert len(partitions) > 1
+    assert partitions[0][0] == header_len
+    assert partitions[-1][1] == len(content)
+    for (_, end), (start, _) in zip(partitions[:-1], partitions[1:]):
+        assert end == start
+        assert content[end - 1:end] == b"\n"
+
+def test_job_scores_all_rows_into_shards(tmp_path, input_csv):
+    queue = _queue(tmp_path)
+    job_id = queue.submit(input_csv)
+    job = _wait(queue, job_id)
+    queue.stop()
+    
+    assert job["state"] == COMPLETED
+    assert job["progress"] == 1.0
+    results = pd.concat([pd.read_csv(shard) for shard in job["shards"]], ignore_index=True)
+    assert len(results) == len(pd.read_csv(input_csv)) == job["rows_done"]
+    assert results["prediction"].isin([0, 1]).all()
+    # Row numbers continue across shards
+    assert list(results["row"]) == list(range(len(results)))
+
+def test_submit_pins_current_store_version(tmp_path, input_csv):
+    import pickle
+    from model_store import ModelStore
+    from serving import get_encoder
+    with open("model.pkl", "rb") as f:
+        payload = f.read()
+    store_dir = str(tmp_path / "store")
+    version = ModelStore(store_dir).publish(payload, pickle.dumps(get_encoder()), {})
+    
+    queue = _queue(tmp_path, autostart=False)
+    job_id = queue.submit(input_csv, model_path=store_dir)
+    assert queue.status(job_id)["model_path"] == os.path.realpath(
+        os.path.join(store_dir, "versions", version, "model.pkl"))
+
+def test_unfinished_job_resumes_after_restart(tmp_path, input_csv):
+    first = _queue(tmp_path, autostart=False)
+    job_id = first.submit(input_csv)
+    assert first.status(job_id)["state"] == QUEUED
+    
+    # Simulate a crash after partition 0 was written by a previous process
+    shard0 = os.path.join(first.status(job_id)["output_dir"], "part-00000.csv")
+    with open(shard0, "w") as f:
+        f.write("already scored\n")
+    with first._connect() as conn:
+        conn.execute("UPDATE partitions SET state = ?, rows = 1, seconds = 0.1 "
+                     "WHERE job_id = ? AND idx = 0", (COMPLETED, job_id))
+        conn.execute("UPDATE jobs SET state = 'running', partitions_done = 1, rows_done = 1 "
+                     "WHERE job_id = ?", (job_id,))
+    
+    restarted = _queue(tmp_path)
+    restarted.start()
+    job = _wait(restarted, job_id)
+    restarted.stop()
+    
+    assert job["state"] == COMPLETED
+    assert job["partitions_done"] == job["total_partitions"]
+    with open(shard0) as f:
+        assert f.read() == "already scored\n"  # Completed partitions are not redone
+
+def test_cancel_queued_job(tmp_path, input_csv):
+    queue = _queue(tmp_path, autostart=False)
+    job_id = queue.submit(input_csv)
+    assert queue.cancel(job_id)
+    assert queue.status(job_id)["state"] == CANCELLED
+    assert not queue.cancel(job_id)
+    with pytest.raises(KeyError):
+        queue.cancel("missing")
+
+def test_submit_rejects_paths_outside_input_root(tmp_path):
+    queue = _queue(tmp_path, autostart=False)
+    with pytest.raises(ValueError):
+        queue.submit("/etc/passwd")
+
+def test_jobs_endpoints():
+    response = client.post("/api/jobs", json={"input_path": "/etc/passwd"})
+    assert response.status_code == 400
+    assert client.get("/api/jobs/doesnotexist").status_code == 404
+    assert client.post("/api/jobs/doesnotexist/cancel").status_code == 404
+    assert isinstance(client.get("/api/jobs").json()["jobs"], list)
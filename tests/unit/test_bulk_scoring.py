@@ -0,0 +1,149 @@
+import io
+import json
+import pytest
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+import app as app_module
+from app import app
+from model_pipeline import prepare_data
+from serving import FeatureEncoder
+import bulk_scoring
+
+client = TestClient(app)
+
+@pytest.fixture(autouse=True)
+def bulk_jobs(tmp_path, monkeypatch):
+    """Keep job checkpoints out of monitoring_logs/"""
+    store = bulk_scoring.BulkJobStore(log_dir=str(tmp_path))
+    monkeypatch.setattr(app_module, "bulk_jobs", store)
+    return store
+
+@pytest.fixture(scope="module")
+def raw_test_rows():
+    return pd.read_csv("churn-bigml-20.csv").drop(columns=["Churn"])
+
+def test_encoder_matches_prepare_data(raw_test_rows):
+    """The serving encoder must produce exactly the training preprocessing"""
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    encoded = FeatureEncoder.from_training_data().encode_frame(raw_test_rows)
+    assert list(encoded.columns) == list(X_test.columns)
+    assert np.array_equal(encoded.to_numpy(float), X_test.to_numpy(float))
+
+def test_encoder_rejects_unknown_category(raw_test_rows):
+    rows = raw_test_rows.head(2).copy()
+    rows["State"] = "XX"
+    with pytest.raises(ValueError):
+        FeatureEncoder.from_training_data().encode_frame(rows)
+
+def test_iter_chunks_bounded_size(raw_test_rows):
+    data = io.StringIO(raw_test_rows.to_csv(index=False))
+    sizes = [len(chunk) for chunk in bulk_scoring.iter_chunks(data, bulk_scoring.CSV, chunk_rows=200)]
+    assert sizes == [200, 200, 200, 67]
+
+def test_iter_chunks_skips_rows_for_resume(raw_test_rows):
+    data = io.StringIO(raw_test_rows.to_json(orient="records", lines=True))
+    chunks = list(bulk_scoring.iter_chunks(data, bulk_scoring.NDJSON, chunk_rows=200, skip_rows=250))
+    assert sum(len(c) for c in chunks) == len(raw_test_rows) - 250
+    assert chunks[0].iloc[0]["Account length"] == raw_test_rows.iloc[250]["Account length"]
+
+def test_bulk_csv_stream(raw_test_rows):
+    response = client.post("/api/predict/bulk?chunk_size=100",
+                           content=raw_test_rows.to_csv(index=False),
+                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    results = pd.read_csv(io.StringIO(response.text))
+    assert len(results) == len(raw_test_rows)
+    assert list(results["row"]) == list(range(len(raw_test_rows)))
+    assert np.allclose(results["churn_probability"] + results["retention_probability"], 1.0)
+    
+    job = client.get(f"/api/predict/bulk/{response.headers['X-Job-Id']}").json()
+    assert job["state"] == "completed"
+    assert job["rows_done"] == len(raw_test_rows)
+    assert job["rows_per_second"] > 0
+
+def test_bulk_multipart_ndjson_matches_single_predictions(raw_test_rows):
+    rows = raw_test_rows.head(5)
+    response = client.post("/api/predict/bulk",
+                           files={"file": ("rows.ndjson", rows.to_json(orient="records", lines=True))})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[-1]["summary"]["rows_done"] == 5
+    
+    for (_, row), scored in zip(rows.iterrows(), lines[:-1]):
+        single = client.post("/api/predict", json={"features": row.to_dict()}).json()
+        assert scored["prediction"] == single["prediction"]
+        assert abs(scored["churn_probability"] - single["churn_probability"]) < 1e-9
+
+def test_bulk_resume_continues_from_checkpoint(raw_test_rows, bulk_jobs):
+    job = bulk_jobs.start()
+    job.update(state="interrupted", rows_done=600)
+    bulk_jobs.save(job)
+    
+    response = client.post(f"/api/predict/bulk?job_id={job['job_id']}",
+                           content=raw_test_rows.to_csv(index=False),
+                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    results = pd.read_csv(io.StringIO(response.text))
+    assert list(results["row"]) == list(range(600, len(raw_test_rows)))
+    
+    # A completed job cannot be replayed
+    response = client.post(f"/api/predict/bulk?job_id={job['job_id']}",
+                           content=raw_test_rows.to_csv(index=False),
+                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 409
+
+def test_bulk_csv_failure_ends_with_error_line(raw_test_rows):
+    rows = raw_test_rows.copy()
+    rows.loc[450, "State"] = "XX"  # Unknown category in the third chunk
+    response = client.post("/api/predict/bulk?chunk_size=200", content=rows.to_csv(index=False),
+                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    last = response.text.splitlines()[-1]
+    assert last.startswith("# error:") and "failed at row 400" in last
+    assert len(pd.read_csv(io.StringIO(response.text), comment="#")) == 400
+
+def test_running_job_cannot_be_resumed_concurrently(raw_test_rows, bulk_jobs):
+    job = bulk_jobs.start()  # Checkpointed just now: another request is streaming it
+    response = client.post(f"/api/predict/bulk?job_id={job['job_id']}",
+                           content=raw_test_rows.to_csv(index=False),
+                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 409
+
+def test_job_store_retention(tmp_path):
+    import os, time
+    store = bulk_scoring.BulkJobStore(log_dir=str(tmp_path), retention_days=1, max_jobs=3)
+    old = store.start()
+    past = time.time() - 2 * 86400
+    os.utime(store._path(old["job_id"]), (past, past))
+    jobs = [store.start() for _ in range(4)]
+    assert store.get(old["job_id"]) is None  # Expired
+    remaining = sorted(name[:-5] for name in os.listdir(store.job_dir))
+    assert len(remaining) == 3 and jobs[-1]["job_id"] in remaining
+
+def test_bulk_chunks_go_through_batch_admission(raw_test_rows):
+    import time
+    before = client.get("/api/predict/admission").json()["lanes"]["batch"]
+    response = client.post("/api/predict/bulk?chunk_size=200", content=raw_test_rows.to_csv(index=False),
+                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 200
+    after = client.get("/api/predict/admission").json()["lanes"]["batch"]
+    # Four chunks plus the end of the stream, each in a batch-lane slot
+    assert after["admitted"] == before["admitted"] + 5
+    
+    # An upload that cannot meet its deadline is shed before streaming starts
+    expired = {"Content-Type": "text/csv", "X-Request-Deadline": str(time.time() - 1)}
+    response = client.post("/api/predict/bulk", content=raw_test_rows.to_csv(index=False), headers=expired)
+    assert response.status_code == 503
+    assert "Retry-After" in response.headers
+    response = client.post("/api/jobs", json={"input_path": "churn-bigml-20.csv"},
+                           headers={"X-Request-Deadline": str(time.time() - 1)})
+    assert response.status_code == 503
+
+def test_bulk_missing_features_rejected():
+    response = client.post("/api/predict/bulk", content="Account length\n100\n",
+                           headers={"Content-Type": "text/csv"})
+    assert response.status_code == 400
+
+def test_bulk_unknown_job():
+    assert client.get("/api/predict/bulk/doesnotexist").status_code == 404
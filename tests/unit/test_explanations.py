@@ -0,0 +1,64 @@
+import pytest
+import numpy as np
+from model_pipeline import prepare_data, train_model, compact_model
+from explanations import TreeExplainer, permutation_importance
+
+@pytest.fixture(scope="module")
+def data():
+    return prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+
+@pytest.fixture(scope="module")
+def model(data):
+    X_train, X_test, y_train, y_test = data
+    return train_model(X_train, y_train, n_estimators=20, max_depth=6)
+
+def test_contributions_add_up_to_prediction(data, model):
+    X_train, X_test, y_train, y_test = data
+    explainer = TreeExplainer(model, X_train)
+    contributions = explainer.contributions(X_test)
+    
+    assert contributions.shape == X_test.shape
+    # Only quantization of the leaf values separates the sum from predict_proba
+    total = explainer.expected_value + contributions.sum(axis=1)
+    assert np.allclose(total, model.predict_proba(X_test)[:, 1], atol=1e-4)
+    assert explainer.background["rows"] == len(X_train)
+
+def test_explain_top_k(data, model):
+    X_train, X_test, y_train, y_test = data
+    explanations = TreeExplainer(compact_model(model, X_test, y_test, prune=False)[0]).explain(X_test.iloc[:3], top_k=4)
+    
+    assert len(explanations) == 3
+    for explanation in explanations:
+        magnitudes = [abs(c["contribution"]) for c in explanation["contributions"]]
+        assert len(magnitudes) == 4
+        assert magnitudes == sorted(magnitudes, reverse=True)
+        assert explanation["contributions"][0]["background_mean"] is None
+
+def test_explanations_of_calibrated_model(data, model):
+    import copy
+    from model_pipeline import calibrate_model
+    from serving import score_frame
+    X_train, X_test, y_train, y_test = data
+    calibrated = calibrate_model(copy.deepcopy(model), X_train, y_train)
+    explanations = TreeExplainer(calibrated).explain(X_test.iloc[:20])
+    
+    prediction, probability = score_frame(calibrated, X_test.iloc[:20])
+    for explanation, p in zip(explanations, probability[:, 1]):
+        # Reported like /api/predict; the contributions still add up to the raw vote
+        assert abs(explanation["churn_probability"] - p) < 1e-3
+        total = sum(c["contribution"] for c in explanation["contributions"])
+        assert abs(explanation["raw_churn_probability"] - TreeExplainer(model).expected_value - total) < 1e-9
+
+def test_permutation_importance_parallel_matches_serial(data, model):
+    X_train, X_test, y_train, y_test = data
+    parallel = permutation_importance(model, X_test, y_test, n_repeats=3, max_workers=4)
+    serial = permutation_importance(model, X_test, y_test, n_repeats=3, max_workers=1)
+    
+    assert parallel == serial
+    assert len(parallel["features"]) == X_test.shape[1]
+    means = [f["importance_mean"] for f in parallel["features"]]
+    assert means == sorted(means, reverse=True)
+    assert means[0] > 0
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+import pytest
+from alert_store import AlertStore
+from live_updates import LiveFeed, FeedWatcher
+from model_monitoring import ModelMonitor
+
+def _parse(frame):
+    fields = dict(line.split(": ", 1) for line in frame.strip().splitlines())
+    return fields["event"], json.loads(fields["data"])
+
+def test_subscribers_get_snapshot_then_deltas():
+    feed = LiveFeed()
+    feed.publish("alerts", [{"timestamp": "2024-01-01T00:00:00", "message": "old"}])
+
+    async def consume():
+        events = feed.events(heartbeat=5)
+        first = _parse(await events.__anext__())
+        # Publish from another thread, as the watcher does
+        threading.Thread(target=feed.publish, args=("metrics", [{"timestamp": "t1", "accuracy": 0.9}])).start()
+        second = _parse(await events.__anext__())
+        await events.aclose()
+        return first, second
+
+    (kind, snapshot), (delta_kind, delta) = asyncio.run(consume())
+    assert kind == "snapshot"
+    assert snapshot["alerts"][0]["message"] == "old"
+    assert delta_kind == "metrics"
+    assert delta == [{"timestamp": "t1", "accuracy": 0.9}]
+    assert feed.current("metrics")["accuracy"] == [0.9]
+    assert feed.subscriber_count == 0
+
+def test_slow_subscriber_is_resynced_with_snapshot():
+    feed = LiveFeed(max_queue=2)
+
+    async def consume():
+        subscription, _ = feed.subscribe()
+        for i in range(5):
+            feed.publish("metrics", [{"timestamp": f"t{i}"}])
+        await asyncio.sleep(0)
+        events = [subscription[1].get_nowait() for _ in range(subscription[1].qsize())]
+        feed.unsubscribe(subscription)
+        return events
+
+    events = asyncio.run(consume())
+    assert events[0]["type"] == "snapshot"
+    assert len(events[0]["data"]["metrics"]["timestamps"]) >= 3
+
+def test_metrics_history_is_capped():
+    feed = LiveFeed(max_points=3)
+    feed.publish("metrics", [{"timestamp": f"t{i}", "accuracy": i} for i in range(5)])
+    feed.publish("metrics", [{"timestamp": "t5", "accuracy": 5}])
+    metrics = feed.current("metrics")
+    assert metrics["timestamps"] == ["t3", "t4", "t5"]
+    assert metrics["accuracy"] == [3, 4, 5]
+
+def test_watcher_publishes_only_new_data(tmp_path):
+    monitor = ModelMonitor(str(tmp_path))
+    monitor.generate_metrics_visualizations = lambda: None
+    monitor.log_batch_metrics([0, 1, 1], [0, 1, 0])
+    store = AlertStore(str(tmp_path))
+    store.append("warning", "accuracy", 0.8, 0.85, "first")
+    results_path = tmp_path / "test_results.json"
+
+    feed = LiveFeed()
+    watcher = FeedWatcher(feed, store, log_dir=str(tmp_path))
+    watcher.load()
+    assert len(feed.current("metrics")["timestamps"]) == 1
+    assert [a["message"] for a in feed.current("alerts")] == ["first"]
+
+    published = []
+    original = feed.publish
+    feed.publish = lambda kind, data: published.append((kind, data)) or original(kind, data)
+    watcher.poll()
+    assert published == []
+
+    monitor.log_batch_metrics([0, 1, 1], [0, 1, 1])
+    store.append("critical", "f1_score", 0.5, 0.8, "second")
+    results_path.write_text(json.dumps({"total": 1, "passed": 1, "failed": 0,
+                                        "results": [{"name": "test_a", "status": "passed", "duration": 0.1}]}))
+    watcher.poll()
+    watcher.poll()
+
+    # Test results reach the feed on ingestion only, so rewriting the file publishes nothing
+    kinds = [kind for kind, _ in published]
+    assert kinds == ["metrics", "alerts"]
+    assert published[0][1][0]["accuracy"] == 1.0
+    assert [a["message"] for a in published[1][1]] == ["second"]
+    assert feed.current("test_results")["results"] == []
+    assert len(feed.current("metrics")["timestamps"]) == 2
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+from model_monitoring import ModelMonitor, slice_metrics
+from model_pipeline import prepare_data
+
+@pytest.fixture(scope="module")
+def data():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    rng = np.random.default_rng(0)
+    y_pred = np.where(rng.random(len(y_test)) < 0.1, 1 - y_test, y_test)
+    return X_test, y_test.to_numpy(), y_pred
+
+def test_slices_match_groupby(data):
+    X, y_true, y_pred = data
+    slices = slice_metrics(X, y_true, y_pred, ["State", "International plan"], min_support=0)
+
+    frame = pd.DataFrame({"value": X["State"], "correct": y_true == y_pred,
+                          "tp": (y_true == 1) & (y_pred == 1)})
+    expected = frame.groupby("value").agg(support=("correct", "size"), accuracy=("correct", "mean"),
+                                          tp=("tp", "sum"))
+    states = {s["value"]: s for s in slices if s["column"] == "State"}
+    assert len(states) == len(expected)
+    for value, row in expected.iterrows():
+        assert states[value]["support"] == row["support"]
+        assert states[value]["tp"] == row["tp"]
+        assert abs(states[value]["accuracy"] - row["accuracy"]) < 1e-12
+    plan = [s for s in slices if s["column"] == "International plan"]
+    assert sum(s["support"] for s in plan) == len(X)
+    assert [s["accuracy"] for s in plan] == sorted(s["accuracy"] for s in plan)
+
+def test_min_support_and_labels(data):
+    X, y_true, y_pred = data
+    slices = slice_metrics(X, y_true, y_pred, ["State", "Voice mail plan"], min_support=20,
+                           labels={"Voice mail plan": ["no", "yes"]})
+    assert all(s["support"] >= 20 for s in slices)
+    assert len([s for s in slices if s["column"] == "State"]) < X["State"].nunique()
+    assert {s["value"] for s in slices if s["column"] == "Voice mail plan"} == {"no", "yes"}
+
+def test_log_batch_metrics_stores_slices(tmp_path, data):
+    X, y_true, y_pred = data
+    monitor = ModelMonitor(str(tmp_path))
+    monitor.log_batch_metrics(y_true, y_pred, X, visualize=False)
+    monitor.log_batch_metrics(y_true, y_true, X, visualize=False)
+
+    latest, previous = monitor.slice_history(limit=5)
+    assert all(s["accuracy"] == 1.0 for s in latest["slices"])
+    assert {s["value"] for s in previous["slices"] if s["column"] == "International plan"} == {"no", "yes"}
+    assert all(s["support"] >= previous["min_support"] for s in previous["slices"])
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -1,7 +1,12 @@
 import pytest
 import pandas as pd
 import numpy as np
-from model_pipeline import prepare_data, train_model, evaluate_model, save_model, load_model
+from model_pipeline import (
+    prepare_data, train_model, train_candidates, evaluate_model, save_model, load_model,
+    make_folds, cross_validate, compact_model, metadata_path, read_model_metadata,
+    record_model_metrics, split_calibration_data, calibrate_model, reliability_metrics,
+    ProbabilityCalibrator, make_model, model_backend
+)
 
 def test_prepare_data():
     X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
@@ -25,18 +30,214 @@ def test_evaluate_model():
     assert isinstance(accuracy, float)
     assert 0 <= accuracy <= 1
 
-def test_model_save_load():
+def test_model_save_load(tmp_path):
     X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
     model = train_model(X_train, y_train)
     
     # Test save
-    save_model(model, "test_model.pkl")
+    save_model(model, str(tmp_path / "test_model.pkl"))
     
     # Test load
-    loaded_model = load_model("test_model.pkl")
+    loaded_model = load_model(str(tmp_path / "test_model.pkl"))
     assert hasattr(loaded_model, 'predict')
     
     # Compare predictions
     original_pred = model.predict(X_test)
     loaded_pred = loaded_model.predict(X_test)
     assert np.array_equal(original_pred, loaded_pred)
+
+def test_save_model_writes_metadata(tmp_path):
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    model = train_model(X_train, y_train, n_estimators=10, max_depth=4)
+    model_file = str(tmp_path / "model.pkl")
+    save_model(model, model_file)
+    record_model_metrics(model_file, {"accuracy": evaluate_model(model, X_test, y_test)})
+    
+    manifest = read_model_metadata(model_file)
+    assert metadata_path(model_file) == str(tmp_path / "model.meta.json")
+    assert manifest["feature_names"] == list(X_train.columns)
+    importances = [f["importance"] for f in manifest["features"]]
+    assert importances == sorted(importances, reverse=True)
+    assert manifest["params"]["n_estimators"] == 10
+    assert manifest["training"]["n_samples"] == len(X_train)
+    assert 0 <= manifest["metrics"]["accuracy"] <= 1
+    
+    # Same data, same fingerprint; a manifest for another model file is ignored
+    retrained = train_model(X_train, y_train, n_estimators=20, max_depth=4)
+    assert retrained.training_metadata_["dataset_fingerprint"] == manifest["training"]["dataset_fingerprint"]
+    with open(model_file, "wb") as f:
+        f.write(b"not the same model")
+    assert read_model_metadata(model_file) is None
+
+def test_reliability_metrics():
+    y = np.array([0, 0, 1, 1])
+    assert reliability_metrics(y, np.array([0.0, 0.0, 1.0, 1.0])) == {"ece": 0.0, "brier": 0.0}
+    # Everything in the 0.5 bin: predicted 2 churners, observed 2
+    assert reliability_metrics(y, np.full(4, 0.5))["ece"] == 0.0
+    assert reliability_metrics(y, np.full(4, 0.5))["brier"] == 0.25
+    assert abs(reliability_metrics(y, np.full(4, 0.9))["ece"] - 0.4) < 1e-12
+
+def test_calibrator_lookup_matches_sklearn():
+    from sklearn.isotonic import IsotonicRegression
+    rng = np.random.default_rng(0)
+    p = rng.random(500)
+    y = (rng.random(500) < p ** 2).astype(int)
+    calibrator = ProbabilityCalibrator.fit(p, y, "isotonic")
+    iso = IsotonicRegression(y_min=0, y_max=1, out_of_bounds="clip").fit(p, y)
+    grid = np.linspace(0, 1, 101)
+    assert np.allclose(calibrator.transform(grid), iso.predict(grid))
+
+    platt = ProbabilityCalibrator.fit(p, y, "platt")
+    assert np.all(np.diff(platt.transform(grid)) >= 0)
+    with pytest.raises(ValueError):
+        ProbabilityCalibrator.fit(p, y, "beta")
+
+def test_calibrate_model(tmp_path):
+    from serving import score_frame
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    X_fit, X_cal, y_fit, y_cal = split_calibration_data(X_train, y_train)
+    model = calibrate_model(train_model(X_fit, y_fit, n_estimators=20, max_depth=6), X_cal, y_cal)
+    held_out = model.calibration_metadata_
+    assert held_out["held_out_after"]["ece"] <= held_out["held_out_before"]["ece"]
+
+    model_file = str(tmp_path / "model.pkl")
+    save_model(model, model_file)
+    loaded = load_model(model_file)
+    prediction, probability = score_frame(loaded, X_test)
+    assert np.allclose(probability[:, 1], model.calibrator_.transform(model.predict_proba(X_test)[:, 1]))
+    # Decisions follow the calibrated probability that is reported with them
+    assert np.array_equal(prediction, (probability[:, 1] >= 0.5).astype(int))
+    raw = model.predict_proba(X_test)[:, 1]
+    cut = model.calibrator_.raw_threshold(0.5)
+    assert np.array_equal(raw >= cut, model.calibrator_.transform(raw) >= 0.5)
+    assert np.allclose(probability.sum(axis=1), 1.0)
+    assert read_model_metadata(model_file)["calibration"]["method"] == "isotonic"
+
+    metrics = evaluate_model(loaded, X_test, y_test, return_metrics=True)
+    assert set(metrics) == {"accuracy", "ece", "brier"}
+    compact = compact_model(loaded, X_test, y_test, prune=False)[0]
+    assert compact.calibrator_ is loaded.calibrator_
+    
+    # Early exit decides on the calibrated probability too, and stays consistent with it
+    from serving import EarlyExitForest
+    early_prediction, early_probability, _ = EarlyExitForest(loaded).predict(X_test)
+    assert np.array_equal(early_prediction, score_frame(compact, X_test)[0])
+    assert np.array_equal(early_prediction, (early_probability >= 0.5).astype(int))
+
+def _shifted_calibration(model):
+    """Calibrate with a map that calls churn from a raw vote of 0.2, unlike predict()."""
+    model.calibrator_ = ProbabilityCalibrator("isotonic", [0.0, 0.2, 1.0], [0.0, 0.5, 1.0])
+    model.calibration_metadata_ = {"method": "isotonic"}
+    return model
+
+def test_compaction_grades_calibrated_decisions():
+    from serving import score_frame
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    X_fit, X_val, y_fit, y_val = split_calibration_data(X_train, y_train)
+    model = _shifted_calibration(train_model(X_fit, y_fit, n_estimators=30, max_depth=6))
+    served = score_frame(model, X_test)[0]
+    assert not np.array_equal(served, model.predict(X_test))
+
+    compact, report = compact_model(model, X_val, y_val, accuracy_budget=0.01, min_trees=5,
+                                    X_test=X_test, y_test=y_test)
+    assert report["accuracy"]["original"] == (served == y_test).mean()
+    assert report["accuracy"]["compact"] == (score_frame(compact, X_test)[0] == y_test).mean()
+    # The pruning budget holds for the calibrated decision
+    assert (score_frame(compact, X_val)[0] == y_val).mean() >= \
+        (score_frame(model, X_val)[0] == y_val).mean() - 0.01 - 1e-9
+
+def test_hist_gbm_backend(tmp_path):
+    from serving import FeatureEncoder, score_frame
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    model = train_model(X_train, y_train, n_estimators=50, max_depth=4, model_type="hist_gbm")
+    
+    assert model_backend(model) == ("hist_gbm", 50, 4)
+    assert evaluate_model(model, X_test, y_test) > 0.85
+    assert abs(model.feature_importances_.sum() - 1) < 1e-6
+    # Same encoder and scoring contract as the forest
+    raw = pd.read_csv("churn-bigml-20.csv").drop(columns=["Churn"]).head(20)
+    encoded = FeatureEncoder.from_training_data().encode_frame(raw)
+    predictions, churn_prob = score_frame(model, encoded)
+    assert np.array_equal(predictions, model.predict(X_test.head(20)))
+    
+    path = str(tmp_path / "gbm.pkl")
+    save_model(model, path)
+    assert read_model_metadata(path)["model_type"] == "HistGradientBoostingClassifier"
+    assert np.array_equal(load_model(path).predict(X_test), model.predict(X_test))
+    with pytest.raises(ValueError):
+        compact_model(model, X_test, y_test)
+    with pytest.raises(ValueError):
+        make_model("svm", 10, 3)
+
+def test_train_candidates():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    X_fit, X_val, y_fit, y_val = split_calibration_data(X_train, y_train)
+    configs = [{"n_estimators": 10, "max_depth": 4}, {"n_estimators": 20, "max_depth": 8}]
+    results = train_candidates(X_fit, y_fit, X_val, y_val, configs, max_workers=2)
+    
+    assert len(results) == 2
+    assert results[0]["accuracy"] >= results[1]["accuracy"]
+    for result in results:
+        assert 0 <= result["accuracy"] <= 1
+        assert result["fit_seconds"] > 0
+        # Models trained on the shared arrays behave like ones trained on the DataFrame
+        assert list(result["model"].feature_names_in_) == list(X_train.columns)
+
+def test_make_folds_stratified():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    fold_ids = make_folds(y_train, n_splits=5, n_repeats=2)
+    assert fold_ids.shape == (2, len(y_train))
+    for repeat in fold_ids:
+        assert set(np.unique(repeat)) == set(range(5))
+        # Every fold keeps roughly the overall churn rate
+        rates = [y_train[repeat == k].mean() for k in range(5)]
+        assert max(rates) - min(rates) < 0.02
+    # Repeats reshuffle the assignment
+    assert not np.array_equal(fold_ids[0], fold_ids[1])
+
+def test_cross_validate():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    results = cross_validate(X_train, y_train, n_splits=3, n_repeats=2,
+                             n_estimators=10, max_depth=5, n_cores=2)
+    
+    assert len(results["folds"]) == 6
+    assert results["fold_workers"] * results["n_jobs_per_fold"] <= 2
+    assert sum(f["n_test"] for f in results["folds"]) == 2 * len(y_train)
+    for fold in results["folds"]:
+        assert 0 <= fold["accuracy"] <= 1
+        assert fold["fit_seconds"] > 0
+    assert 0 <= results["mean"]["accuracy"] <= 1
+
+def test_hist_gbm_cross_validation_respects_core_budget():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    results = cross_validate(X_train, y_train, n_splits=2, n_repeats=1, n_estimators=10,
+                             max_depth=3, n_cores=2, fold_workers=2, model_type="hist_gbm")
+    assert results["n_jobs_per_fold"] == 1
+    # OpenMP (which hist_gbm uses instead of n_jobs) was held to the fold's share
+    assert all(fold["native_threads"] == 1 for fold in results["folds"])
+
+def test_compact_model_matches_forest():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    model = train_model(X_train, y_train, n_estimators=20)
+    compact, report = compact_model(model, X_test, y_test, prune=False)
+    
+    assert compact.n_estimators == 20
+    assert compact.threshold.dtype == np.float32
+    assert compact.value.dtype == np.uint16
+    # Only leaf-probability quantization differs from the original forest
+    assert np.abs(compact.predict_proba(X_test) - model.predict_proba(X_test)).max() < 1e-4
+    assert np.array_equal(compact.predict(X_test), model.predict(X_test))
+    assert report["size_bytes"]["compact"] < report["size_bytes"]["original"]
+
+def test_compact_model_pruning_respects_budget():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    X_fit, X_val, y_fit, y_val = split_calibration_data(X_train, y_train)
+    model = train_model(X_fit, y_fit, n_estimators=30)
+    compact, report = compact_model(model, X_val, y_val, accuracy_budget=0.01, min_trees=5,
+                                    X_test=X_test, y_test=y_test)
+    
+    assert 5 <= compact.n_estimators <= 30
+    # The budget holds on the pruning data; the report grades the held-out test set
+    assert (compact.predict(X_val) == y_val).mean() >= (model.predict(X_val) == y_val).mean() - 0.01 - 1e-9
+    assert report["accuracy"]["compact"] == (compact.predict(X_test) == y_test).mean()
+    assert abs(compact.feature_importances_.sum() - 1) < 1e-5
@@ -0,0 +1,90 @@
+import os
+import time
+import pytest
+from model_pipeline import prepare_data, train_model, save_model
+from model_registry import ModelRegistry, ModelFleet
+from serving import score_frame
+
+@pytest.fixture(scope="module")
+def data():
+    return prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+
+@pytest.fixture(scope="module")
+def model_files(data, tmp_path_factory):
+    X_train, X_test, y_train, y_test = data
+    root = tmp_path_factory.mktemp("models")
+    paths = {}
+    for name, depth in (("primary", 8), ("retrained", 3)):
+        paths[name] = str(root / f"{name}.pkl")
+        save_model(train_model(X_train, y_train, n_estimators=10, max_depth=depth), paths[name])
+    return paths
+
+def test_registry_reloads_only_changed_files(model_files, tmp_path):
+    registry = ModelRegistry()
+    first = registry.get(model_files["primary"])
+    assert registry.get(model_files["primary"]) is first
+
+    path = str(tmp_path / "model.pkl")
+    with open(model_files["primary"], "rb") as src, open(path, "wb") as dst:
+        dst.write(src.read())
+    copy = registry.get(path)
+    assert copy.version == first.version  # Same bytes, same version
+    with open(model_files["retrained"], "rb") as src, open(path, "wb") as dst:
+        dst.write(src.read())
+    os.utime(path, ns=(time.time_ns(), copy.mtime_ns + 1))
+    assert registry.get(path).version != first.version
+
+def test_canary_routing_percentage(model_files):
+    fleet = ModelFleet(ModelRegistry(), canary_path=model_files["retrained"], canary_percent=25)
+    roles = [fleet.choose(model_files["primary"])[1] for _ in range(2000)]
+    assert 0.2 < roles.count("canary") / len(roles) < 0.3
+
+    # A routing key always lands on the same side
+    assert len({fleet.choose(model_files["primary"], "customer-42")[1] for _ in range(20)}) == 1
+    fleet.configure(canary_percent=0)
+    assert {fleet.choose(model_files["primary"])[1] for _ in range(100)} == {"primary"}
+    fleet.shutdown()
+
+def test_unloadable_canary_falls_back_to_primary(model_files, tmp_path):
+    canary = str(tmp_path / "canary.pkl")
+    with open(model_files["retrained"], "rb") as src, open(canary, "wb") as dst:
+        dst.write(src.read())
+    fleet = ModelFleet(ModelRegistry(), canary_path=canary, canary_percent=100)
+    assert fleet.choose(model_files["primary"])[1] == "canary"
+
+    with open(canary, "wb") as f:
+        f.write(b"not a pickle")
+    served, role, others = fleet.choose(model_files["primary"])
+    assert role == "primary"
+    assert served.path == model_files["primary"]
+    assert others == []
+    os.remove(canary)  # e.g. pruned from the model store
+    assert fleet.choose(model_files["primary"])[1] == "primary"
+    assert fleet.stats()["canary_failures"] == 2
+    fleet.shutdown()
+
+def test_shadows_record_agreement_and_latency(data, model_files):
+    X_train, X_test, y_train, y_test = data
+    fleet = ModelFleet(ModelRegistry(), shadow_paths=[model_files["primary"], model_files["retrained"]])
+    served, role, others = fleet.choose(model_files["primary"])
+    assert role == "primary" and len(others) == 2
+
+    prediction, probability = score_frame(served.model, X_test)
+    fleet.record_served(served, role, 0.001)
+    fleet.shadow(X_test, prediction, probability[:, 1], 0.001, others)
+    assert fleet.wait_idle(timeout=10)
+
+    versions = fleet.stats()["versions"]
+    assert versions[served.version]["served"] == 1
+    # The primary file is also hosted as a shadow: identical answers
+    assert versions[served.version]["agreement_rate"] == 1.0
+    assert versions[served.version]["mean_abs_probability_diff"] == 0.0
+    retrained = versions[others[1][0].version]
+    assert retrained["role"] == "shadow"
+    assert retrained["shadowed"] == len(X_test)
+    assert 0.5 < retrained["agreement_rate"] < 1.0
+    assert retrained["mean_latency_delta_ms"] is not None
+    fleet.shutdown()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,66 @@
+import os
+import pickle
+import pytest
+from model_pipeline import prepare_data, train_model, read_model_metadata
+from model_store import ModelStore
+from model_registry import ModelRegistry
+from serving import FeatureEncoder
+
+@pytest.fixture(scope="module")
+def models():
+    X_train, X_test, y_train, y_test = prepare_data("churn-bigml-80.csv", "churn-bigml-20.csv")
+    return [train_model(X_train, y_train, n_estimators=5, max_depth=depth) for depth in (2, 3, 4)]
+
+@pytest.fixture(scope="module")
+def encoder():
+    return FeatureEncoder.from_training_data()
+
+def test_publish_is_content_addressed(tmp_path, models, encoder):
+    store = ModelStore(str(tmp_path / "store"))
+    first = store.publish_model(models[0], encoder, metrics={"accuracy": 0.9})
+    assert store.publish_model(models[0], encoder) == first
+    assert len(store.versions()) == 1
+    assert store.current() == first
+    assert read_model_metadata(store.path(first))["metrics"] == {"accuracy": 0.9}
+
+    second = store.publish_model(models[1], encoder, activate=False)
+    assert second != first and store.current() == first
+    assert sorted(os.listdir(store.version_dir(second))) == ["model.meta.json", "model.pkl", "preprocessing.pkl"]
+
+def test_rollback_and_export(tmp_path, models, encoder):
+    store = ModelStore(str(tmp_path / "store"))
+    first = store.publish_model(models[0], encoder)
+    second = store.publish_model(models[1], encoder)
+    assert store.rollback() == first
+    assert store.rollback() == second  # Rolling back again undoes the rollback
+    assert store.rollback(first[:6]) == first
+
+    exported = store.export(first, str(tmp_path / "model.pkl"))
+    assert read_model_metadata(exported)["version"] == first
+    with pytest.raises(ValueError):
+        store.rollback("nope")
+
+def test_retention_keeps_current_and_rollback_target(tmp_path, models, encoder):
+    store = ModelStore(str(tmp_path / "store"), keep_last=1)
+    versions = [store.publish_model(model, encoder) for model in models]
+    kept = {entry["version"] for entry in store.versions()}
+    assert kept == set(versions[1:])
+    assert store.rollback() == versions[1]
+
+def test_registry_follows_current_pointer(tmp_path, models, encoder):
+    root = str(tmp_path / "store")
+    store = ModelStore(root)
+    first = store.publish_model(models[0], encoder)
+    registry = ModelRegistry()
+    loaded = registry.get(root)
+    assert loaded.version == first
+    assert loaded.encoder.feature_names == encoder.feature_names
+
+    second = store.publish_model(models[1], encoder)
+    assert registry.get(root).version == second
+    store.rollback()
+    # Already loaded versions are switched back to without re-reading them
+    assert registry.get(root) is loaded
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,125 @@
+import threading
+import pytest
+from pipeline_runner import PipelineRunner, Stage
+
+calls = []
+
+def load(path):
+    calls.append("load")
+    with open(path) as f:
+        return f.read()
+
+def double(text, factor=2):
+    calls.append("double")
+    return text * factor
+
+def length(text):
+    calls.append("length")
+    return len(text)
+
+def combine(doubled, size):
+    calls.append("combine")
+    return f"{doubled}:{size}"
+
+def _stages(path, factor=2):
+    return [
+        Stage("load", load, params={"path": path}, files=[path]),
+        Stage("double", double, deps=["load"], params={"factor": factor}),
+        Stage("length", length, deps=["load"]),
+        Stage("combine", combine, deps=["double", "length"]),
+    ]
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("ab")
+    calls.clear()
+    return str(path)
+
+def test_runs_stages_in_dependency_order(tmp_path, data_file):
+    outputs, report = PipelineRunner(_stages(data_file), cache_dir=str(tmp_path / "cache")).run()
+    assert outputs["combine"] == "abab:2"
+    order = [row["stage"] for row in report]
+    assert order[0] == "load" and order[-1] == "combine"
+    assert all(row["status"] == "ran" for row in report)
+
+def test_unchanged_stages_are_skipped(tmp_path, data_file):
+    cache_dir = str(tmp_path / "cache")
+    PipelineRunner(_stages(data_file), cache_dir=cache_dir).run()
+    calls.clear()
+    
+    outputs, report = PipelineRunner(_stages(data_file), cache_dir=cache_dir).run()
+    assert outputs["combine"] == "abab:2"
+    assert calls == []
+    assert all(row["status"] == "cached" for row in report)
+
+def test_changed_inputs_invalidate_downstream(tmp_path, data_file):
+    cache_dir = str(tmp_path / "cache")
+    PipelineRunner(_stages(data_file), cache_dir=cache_dir).run()
+    calls.clear()
+    
+    # A parameter change re-runs that stage and everything after it only
+    outputs, report = PipelineRunner(_stages(data_file, factor=3), cache_dir=cache_dir).run()
+    assert outputs["combine"] == "ababab:2"
+    assert sorted(calls) == ["combine", "double"]
+    
+    # A changed input file re-runs the whole graph
+    with open(data_file, "w") as f:
+        f.write("xyz")
+    calls.clear()
+    outputs, _ = PipelineRunner(_stages(data_file, factor=3), cache_dir=cache_dir).run()
+    assert outputs["combine"] == "xyzxyzxyz:3"
+    assert len(calls) == 4
+
+def test_independent_stages_run_concurrently(tmp_path):
+    barrier = threading.Barrier(2, timeout=5)
+    
+    def wait_for_peer():
+        barrier.wait()  # Deadlocks (and times out) unless both run at once
+        return True
+    
+    stages = [Stage("a", wait_for_peer, cache=False), Stage("b", wait_for_peer, cache=False)]
+    outputs, _ = PipelineRunner(stages, cache_dir=str(tmp_path), max_workers=2).run()
+    assert outputs == {"a": True, "b": True}
+
+def test_unknown_dependency_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        PipelineRunner([Stage("a", length, deps=["missing"])], cache_dir=str(tmp_path))
+
+def write(text, path):
+    calls.append("write")
+    with open(path, "w") as f:
+        f.write(text)
+    return path
+
+def test_outputs_changed_since_last_run_rerun_the_stage(tmp_path, data_file):
+    cache_dir = str(tmp_path / "cache")
+    out = str(tmp_path / "out.txt")
+    stages = lambda: _stages(data_file) + [Stage("write", write, deps=["double"], params={"path": out},
+                                                 outputs=[out])]
+    PipelineRunner(stages(), cache_dir=cache_dir).run()
+    calls.clear()
+    PipelineRunner(stages(), cache_dir=cache_dir).run()
+    assert calls == []
+
+    # Something else (e.g. a rollback) replaced the file: it must be rewritten
+    with open(out, "w") as f:
+        f.write("stale")
+    PipelineRunner(stages(), cache_dir=cache_dir).run()
+    assert calls == ["write"]
+    assert open(out).read() == "abab"
+
+def test_called_modules_key_the_cache(tmp_path, data_file, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    module = tmp_path / "helper_module.py"
+    module.write_text("VALUE = 1\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    stages = lambda: [Stage("load", load, params={"path": data_file}, modules=["helper_module"])]
+    PipelineRunner(stages(), cache_dir=cache_dir).run()
+    calls.clear()
+    PipelineRunner(stages(), cache_dir=cache_dir).run()
+    assert calls == []
+
+    module.write_text("VALUE = 2\n")
+    PipelineRunner(stages(), cache_dir=cache_dir).run()
+    assert calls == ["load"]
@@ -0,0 +1,74 @@
+import os
+import pytest
+from profiling import Profiler
+
+def _busy_work():
+    return sum(i * i for i in range(10000))
+
+def test_profile_writes_call_tree_and_allocations(tmp_path):
+    profiler = Profiler(log_dir=str(tmp_path))
+    with profiler.profile("unit run") as run_id:
+        _busy_work()
+    
+    files = sorted(os.listdir(profiler.profile_dir))
+    assert run_id is not None
+    assert f"{run_id}.prof" in files
+    assert f"{run_id}.calltree.txt" in files
+    assert f"{run_id}.alloc.txt" in files
+
+def test_profile_disabled_writes_nothing(tmp_path):
+    profiler = Profiler(log_dir=str(tmp_path))
+    with profiler.profile("skipped", enabled=False) as run_id:
+        _busy_work()
+    assert run_id is None
+    assert os.listdir(profiler.profile_dir) == []
+
+def test_sampling_is_rate_limited(tmp_path):
+    profiler = Profiler(log_dir=str(tmp_path), sample_rate=1.0, max_per_minute=2)
+    decisions = []
+    for _ in range(5):
+        claim = profiler.should_sample()
+        decisions.append(claim is not None)
+        if claim is not None:
+            claim.release()
+    assert decisions == [True, True, False, False, False]
+    # Header-forced runs are still subject to the same budget
+    assert not profiler.should_sample(forced=True)
+
+def test_sampling_off_by_default(tmp_path):
+    profiler = Profiler(log_dir=str(tmp_path))
+    assert not profiler.should_sample()
+    assert profiler.should_sample(forced=True) is not None
+
+def test_retention_keeps_newest_runs(tmp_path):
+    profiler = Profiler(log_dir=str(tmp_path), max_profiles=2)
+    run_ids = []
+    for i in range(4):
+        with profiler.profile(f"run{i}", memory=False) as run_id:
+            _busy_work()
+        run_ids.append(run_id)
+    
+    remaining = {name.split(".", 1)[0] for name in os.listdir(profiler.profile_dir)}
+    assert remaining == set(run_ids[-2:])
+
+def test_sampled_run_reserves_the_profiler(tmp_path):
+    profiler = Profiler(log_dir=str(tmp_path), sample_rate=1.0)
+    claim = profiler.should_sample()
+    # The slot is taken from the sampling decision on, so nothing else samples
+    assert profiler.should_sample(forced=True) is None
+    with profiler.profile("other") as run_id:
+        assert run_id is None
+    with profiler.profile("claimed", memory=False, claim=claim) as run_id:
+        assert run_id is not None
+        assert not profiler._lock.locked()
+        # Nested runs are skipped without holding the lock (or deadlocking)
+        with profiler.profile("nested") as nested:
+            assert nested is None
+            assert not profiler._lock.locked()
+    # A claim is used once; releasing it afterwards is a no-op
+    claim.release()
+    unused = profiler.should_sample(forced=True)
+    unused.release()
+    with profiler.profile("after", memory=False, claim=unused) as run_id:
+        assert run_id is None
+    assert profiler.should_sample(forced=True) is not None
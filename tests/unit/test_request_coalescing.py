@@ -0,0 +1,85 @@
+import asyncio
+import time
+import pytest
+from request_coalescing import SingleFlight, IdempotencyCache, IdempotencyConflict, canonical_hash
+
+def test_canonical_hash_ignores_key_order():
+    assert canonical_hash({"a": 1.0, "b": "x"}) == canonical_hash({"b": "x", "a": 1.0})
+    assert canonical_hash({"a": 1.0}) != canonical_hash({"a": 2.0})
+    assert canonical_hash({"a": 1.0}, True) != canonical_hash({"a": 1.0}, False)
+
+def test_single_flight_shares_result_and_errors():
+    flights = SingleFlight()
+    calls = []
+
+    def work(value):
+        calls.append(value)
+        time.sleep(0.2)
+        if value == "bad":
+            raise ValueError("bad input")
+        return value * 2
+
+    async def scenario():
+        results = await asyncio.gather(*[flights.run("k", work, 21) for _ in range(5)],
+                                       flights.run("other", work, 1))
+        errors = await asyncio.gather(*[flights.run("e", work, "bad") for _ in range(3)],
+                                      return_exceptions=True)
+        return results, errors
+
+    results, errors = asyncio.run(scenario())
+    assert [r[0] for r in results] == [42] * 5 + [2]
+    assert sorted(r[1] for r in results[:5] if r[1] is not None) == [5]
+    assert all(isinstance(e, ValueError) for e in errors)
+    assert sorted(map(str, calls)) == ["1", "21", "bad"]
+    stats = flights.stats()
+    assert stats["inferences"] == 3 and stats["coalesced"] == 6
+    assert stats["max_multiplicity"] == 5 and stats["in_flight"] == 0
+
+def test_single_flight_survives_leader_cancellation():
+    flights = SingleFlight()
+    calls = []
+
+    def work(value):
+        calls.append(value)
+        time.sleep(0.2)
+        return value * 2
+
+    async def scenario():
+        leader = asyncio.ensure_future(flights.run("k", work, 21))
+        await asyncio.sleep(0.05)
+        follower = asyncio.ensure_future(flights.run("k", work, 21))
+        await asyncio.sleep(0.05)
+        leader.cancel()  # e.g. the leader's client disconnected
+        result = await follower
+        # Once nobody is waiting the work itself is cancelled
+        alone = asyncio.ensure_future(flights.run("solo", work, 1))
+        await asyncio.sleep(0.05)
+        alone.cancel()
+        await asyncio.gather(alone, return_exceptions=True)
+        return leader.cancelled(), result
+
+    leader_cancelled, result = asyncio.run(scenario())
+    assert leader_cancelled
+    # The follower got the one computation's result and records it for both
+    assert result == (42, 2)
+    assert calls == [21, 1]
+    assert flights.stats()["in_flight"] == 0
+
+def test_idempotency_cache_ttl_conflicts_and_bound():
+    now = [0.0]
+    cache = IdempotencyCache(ttl=10, max_entries=2, clock=lambda: now[0])
+    cache.put("a", "f1", {"prediction": 1})
+    assert cache.get("a", "f1") == {"prediction": 1}
+    with pytest.raises(IdempotencyConflict):
+        cache.get("a", "f2")
+
+    now[0] = 5.0
+    cache.put("b", "f1", {"prediction": 0})
+    cache.put("c", "f1", {"prediction": 0})
+    assert cache.get("a", "f1") is None  # Evicted by the size bound
+    now[0] = 16.0
+    assert cache.get("b", "f1") is None  # Expired
+    assert cache.stats() == {"ttl_seconds": 10, "cached_keys": 0, "replays": 1, "conflicts": 1}
+
+if __name__ == "__main__":
+    pytest.main([__file__])
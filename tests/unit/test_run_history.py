@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from fastapi.testclient import TestClient
+import app as app_module
+import test_reporter
+from live_updates import LiveFeed
+from run_history import TestRunStore
+
+client = TestClient(app_module.app)
+
+def _results(*pairs):
+    return [{"name": name, "status": status, "duration": 0.1, "error_message": None} for name, status in pairs]
+
+def test_store_merges_latest_and_indexes_runs(tmp_path):
+    store = TestRunStore(str(tmp_path))
+    first = store.add_run(_results(("test_a", "passed"), ("test_b", "failed")), run_key="k1")
+    store.add_run(_results(("test_b", "passed")), run_key="k2")
+    assert store.add_run(_results(("test_b", "failed")), run_key="k2")["run"] == 1  # Re-sent run is ignored
+    
+    latest = store.latest()
+    assert (latest["total"], latest["passed"], latest["failed"]) == (2, 2, 0)
+    assert [r["run"] for r in store.history()] == [1, 0]
+    assert [r["run"] for r in store.history(limit=1, before=1)] == [0]
+    assert store.get_run("k1")["results"][1]["status"] == "failed"
+    assert store.get_run(first["run"])["run_key"] == "k1"
+    assert store.get_run("missing") is None
+    
+    # A restarted server gets the same view and index from disk
+    reopened = TestRunStore(str(tmp_path))
+    assert reopened.latest() == latest
+    assert reopened.get_run(1)["results"] == _results(("test_b", "passed"))
+
+def test_long_non_ascii_run_keys_survive_a_restart(tmp_path):
+    key = "a" + "é" * 40
+    store = TestRunStore(str(tmp_path))
+    store.add_run(_results(("test_a", "passed")), run_key=key)
+    assert store.add_run(_results(("test_a", "failed")), run_key=key)["run"] == 0
+    assert store.add_run(_results(("test_a", "failed")), run_key=key[:-1])["run"] == 1
+
+    reopened = TestRunStore(str(tmp_path))
+    assert reopened.latest()["failed"] == 1
+    assert reopened.get_run(key)["run_key"] == key
+    assert reopened.add_run(_results(("test_a", "passed")), run_key=key)["run"] == 0
+
+def test_test_results_endpoints(tmp_path, monkeypatch):
+    monkeypatch.setattr(app_module, "test_runs", TestRunStore(str(tmp_path)))
+    run = {"total": 1, "passed": 0, "failed": 1, "run_key": "abc",
+           "results": _results(("test_x", "failed"))}
+    
+    response = client.post("/api/test-results", json=run)
+    assert response.status_code == 200
+    assert response.json()["run"] == 0
+    assert client.post("/api/test-results", json=run).json()["run"] == 0
+    
+    latest = client.get("/api/test-results").json()
+    assert latest["failed"] == 1 and latest["results"][0]["name"] == "test_x"
+    assert app_module.live_feed.current("test_results")["results"][-1]["name"] == "test_x"
+    assert [r["run_key"] for r in client.get("/api/test-results/history").json()["runs"]] == ["abc"]
+    assert client.get("/api/test-results/runs/abc").json()["results"][0]["status"] == "failed"
+    assert client.get("/api/test-results/runs/7").status_code == 404
+
+def test_startup_seeds_the_live_feed_from_stored_runs(tmp_path, monkeypatch):
+    store = TestRunStore(str(tmp_path))
+    store.add_run(_results(("test_a", "passed"), ("test_b", "failed")), run_key="k1")
+    monkeypatch.setattr(app_module, "test_runs", TestRunStore(str(tmp_path)))
+    monkeypatch.setattr(app_module, "live_feed", LiveFeed())
+    monkeypatch.setattr(app_module.feed_watcher, "start", lambda: None)
+
+    asyncio.run(app_module.start_live_feed())
+    current = app_module.live_feed.current("test_results")
+    assert (current["total"], current["failed"]) == (2, 1)
+    assert [r["name"] for r in current["results"]] == ["test_a", "test_b"]
+
+def test_save_to_file_replaces_by_name(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    test_reporter.save_to_file({"results": _results(("a", "passed"), ("b", "failed"))})
+    test_reporter.save_to_file({"results": _results(("b", "passed"), ("c", "passed"))})
+    
+    with open(tmp_path / "test_results" / "test_results.json") as f:
+        merged = json.load(f)
+    assert [r["name"] for r in merged["results"]] == ["a", "b", "c"]
+    assert (merged["passed"], merged["failed"]) == (3, 0)
+
+def test_send_results_posts_in_parallel_within_deadline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    received = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            received.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    good = f"http://127.0.0.1:{server.server_address[1]}/api/test-results"
+    # 10.255.255.1 is unroutable, so connecting to it hangs until the timeout
+    slow = "http://10.255.255.1:8000/api/test-results"
+    results = {"results": _results(("a", "passed")), "total": 1, "passed": 1, "failed": 0}
+    try:
+        start = time.perf_counter()
+        assert test_reporter.send_results(results, endpoints=[slow, good], deadline=5)
+        assert time.perf_counter() - start < 2
+        assert len(received) == 1 and received[0]["run_key"]
+        
+        start = time.perf_counter()
+        assert test_reporter.send_results(results, endpoints=[slow], deadline=1)
+        assert time.perf_counter() - start < 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,149 @@
+import time
+import pytest
+from scheduler import JobScheduler
+
+# Jobs run in spawned processes, so they must be importable module-level functions
+def _sleep_job(cursor=None, seconds=1.0):
+    time.sleep(seconds)
+    return {"slept": seconds}
+
+def _hang_job(cursor=None):
+    time.sleep(60)
+
+def _count_job(cursor=None):
+    return {"cursor": {"runs": (cursor or {}).get("runs", 0) + 1}}
+
+def _failing_job(cursor=None):
+    raise RuntimeError("boom")
+
+def _alert_job(cursor=None):
+    return {"alert_metrics": {"accuracy": 0.5, "f1_score": 0.5}}
+
+def test_alerts_are_deduplicated_across_job_runs(tmp_path, monkeypatch):
+    import scheduled_evaluation
+    from alert_config import AlertManager, AlertDispatcher
+    sent = []
+    manager = AlertManager(config_file=str(tmp_path / "alerts.json"), log_dir=str(tmp_path),
+                           dispatcher=AlertDispatcher({"slack": sent.append}, dedup_window=300))
+    monkeypatch.setattr(scheduled_evaluation, "_alert_manager", manager)
+
+    # Each run is a fresh process, but alerts are handled by the scheduler's manager
+    scheduler = JobScheduler(str(tmp_path / "state.json"))
+    scheduler.add("evaluation", _alert_job, interval=60, run_immediately=True,
+                  on_result=scheduled_evaluation.alert_on_evaluation)
+    now = time.time()
+    for run in range(3):
+        scheduler.run_pending(now + 61 * run)
+        assert scheduler.wait(timeout=30)
+    time.sleep(0.2)
+    assert len(sent) == 1
+    assert manager.dispatcher.stats()["coalesced"] == 2
+    manager.dispatcher.stop(timeout=5)
+
+def test_independent_jobs_run_in_parallel(tmp_path):
+    scheduler = JobScheduler(str(tmp_path / "state.json"))
+    scheduler.add("a", _sleep_job, interval=3600, run_immediately=True)
+    scheduler.add("b", _sleep_job, interval=3600, run_immediately=True)
+    start = time.perf_counter()
+    assert scheduler.run_pending() == ["a", "b"]
+    assert scheduler.wait(timeout=10)
+    assert time.perf_counter() - start < 1.9
+    assert scheduler.state["a"]["last_status"] == scheduler.state["b"]["last_status"] == "succeeded"
+    assert scheduler.state["a"]["last_result"] == {"slept": 1.0}
+
+def test_overlap_is_skipped_and_timeout_kills(tmp_path):
+    scheduler = JobScheduler(str(tmp_path / "state.json"))
+    scheduler.add("hang", _hang_job, interval=0.1, timeout=1.0, run_immediately=True)
+    now = time.time()
+    assert scheduler.run_pending(now) == ["hang"]
+    assert scheduler.run_pending(now + 0.5) == []
+    assert scheduler.wait(timeout=10)
+
+    state = scheduler.state["hang"]
+    assert state["skipped_overlaps"] == 1
+    assert state["last_status"] == "timed_out"
+    assert state["timeouts"] == 1
+
+def test_state_and_cursor_survive_restart(tmp_path):
+    path = str(tmp_path / "state.json")
+    scheduler = JobScheduler(path)
+    scheduler.add("count", _count_job, interval=60, run_immediately=True)
+    scheduler.add("fail", _failing_job, interval=60, run_immediately=True)
+    now = time.time()
+    scheduler.run_pending(now)
+    scheduler.wait(timeout=10)
+    scheduler.run_pending(now + 61)
+    scheduler.wait(timeout=10)
+    assert scheduler.state["fail"]["failures"] == 2
+    assert "boom" in scheduler.state["fail"]["last_error"]
+
+    restarted = JobScheduler(path)
+    restarted.add("count", _count_job, interval=60, run_immediately=True)
+    assert restarted.state["count"]["cursor"] == {"runs": 2}
+    # Already ran within its interval before the restart: not due yet
+    assert restarted.run_pending(now + 100) == []
+    assert restarted.run_pending(now + 122) == ["count"]
+    restarted.wait(timeout=10)
+    assert restarted.state["count"]["cursor"] == {"runs": 3}
+
+def test_read_new_rows_is_incremental(tmp_path):
+    from scheduled_evaluation import read_new_rows
+    path = tmp_path / "labelled.csv"
+    path.write_text("a,b\n1,2\n3,4\n")
+    df, cursor = read_new_rows(str(path))
+    assert len(df) == 2
+
+    with open(path, "a") as f:
+        f.write("5,6\n7,")  # Last line still being written
+    df, cursor = read_new_rows(str(path), cursor)
+    assert df.to_dict("records") == [{"a": 5, "b": 6}]
+    assert read_new_rows(str(path), cursor)[0] is None
+
+    with open(path, "a") as f:
+        f.write("8\n")
+    df, cursor = read_new_rows(str(path), cursor)
+    assert df.to_dict("records") == [{"a": 7, "b": 8}]
+
+def test_incoming_rows_feed_the_evaluation(tmp_path):
+    import pandas as pd  # Not at module level: spawned job processes import this file
+    from scheduled_evaluation import read_new_rows, append_labelled_rows
+    path = str(tmp_path / "incoming" / "labelled.csv")
+    assert read_new_rows(path) == (None, {})  # Nothing has arrived yet
+
+    rows = pd.read_csv("churn-bigml-20.csv").head(5)
+    append_labelled_rows(rows.head(3), path)
+    df, cursor = read_new_rows(path)
+    append_labelled_rows(rows.tail(2), path)
+    more, cursor = read_new_rows(path, cursor)
+    assert list(df.columns) == list(rows.columns)
+    assert len(df) == 3 and len(more) == 2
+
+def test_evaluation_grades_calibrated_decisions(tmp_path, monkeypatch):
+    import numpy as np
+    import pandas as pd
+    import scheduled_evaluation
+    from model_pipeline import load_model, ProbabilityCalibrator
+    from serving import score_frame
+    model = load_model()
+    model.calibrator_ = ProbabilityCalibrator("isotonic", [0.0, 0.2, 1.0], [0.0, 0.5, 1.0])
+    rows = pd.read_csv("churn-bigml-20.csv")
+    path = str(tmp_path / "labelled.csv")
+    scheduled_evaluation.append_labelled_rows(rows, path)
+
+    logged = {}
+    class Monitor:
+        def log_batch_metrics(self, y_true, y_pred, X, visualize=True):
+            logged["y_pred"] = np.asarray(y_pred)
+            return {"accuracy": float(np.mean(np.asarray(y_true) == y_pred))}
+    monkeypatch.setattr(scheduled_evaluation, "EVAL_DATA_PATH", path)
+    monkeypatch.setattr(scheduled_evaluation, "load_model", lambda: model)
+    monkeypatch.setattr(scheduled_evaluation, "ModelMonitor", Monitor)
+
+    result = scheduled_evaluation.evaluate_current_model()
+    assert set(result["alert_metrics"]) == {"accuracy", "f1_score", "data_drift_score"}
+    X, _ = scheduled_evaluation._encode_labelled(rows)
+    assert np.array_equal(logged["y_pred"], score_frame(model, X)[0])
+    assert not np.array_equal(logged["y_pred"], model.predict(X))
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import pytest
+from model_pipeline import prepare_data
+from synthetic_data import ChurnDataModel, write_csv, write_binary, read_binary, ensure_dataset
+
+@pytest.fixture(scope="module")
+def model():
+    return ChurnDataModel.fit("churn-bigml-80.csv")
+
+@pytest.fixture(scope="module")
+def real():
+    return pd.read_csv("churn-bigml-80.csv")
+
+def test_sample_matches_schema_and_marginals(model, real):
+    synthetic = model.sample(50000, np.random.default_rng(0))
+    assert list(synthetic.columns) == list(real.columns)
+    assert list(synthetic.dtypes) == list(real.dtypes)
+    assert set(synthetic["State"]) <= set(real["State"])
+    assert set(synthetic["Area code"]) == set(real["Area code"])
+    
+    numeric = real.select_dtypes("number").columns
+    relative = (synthetic[numeric].mean() - real[numeric].mean()).abs() / real[numeric].std()
+    assert relative.max() < 0.05
+    assert abs(synthetic["Churn"].mean() - real["Churn"].mean()) < 0.02
+    # Dependence survives: charge follows minutes, churn jumps at 4+ service calls
+    assert np.corrcoef(synthetic["Total day minutes"], synthetic["Total day charge"])[0, 1] > 0.999
+    calls = synthetic["Customer service calls"] >= 4
+    assert synthetic.loc[calls, "Churn"].mean() > 2 * synthetic.loc[~calls, "Churn"].mean()
+
+def test_chunks_are_deterministic_by_seed(model):
+    first = pd.concat(model.iter_chunks(2500, seed=7, chunk_rows=1000))
+    second = pd.concat(model.iter_chunks(2500, seed=7, chunk_rows=1000))
+    other = pd.concat(model.iter_chunks(2500, seed=8, chunk_rows=1000))
+    assert len(first) == 2500
+    assert first.equals(second)
+    assert not first.equals(other)
+
+def test_csv_and_binary_outputs_agree(tmp_path, model):
+    csv_path = write_csv(str(tmp_path / "synthetic.csv"), 3000, seed=1, chunk_rows=1000, model=model)
+    binary_path = write_binary(str(tmp_path / "synthetic"), 3000, seed=1, chunk_rows=1000, model=model)
+    from_csv = pd.read_csv(csv_path)
+    assert from_csv.equals(read_binary(binary_path))
+    assert from_csv.iloc[1000:1500].reset_index(drop=True).equals(read_binary(binary_path, 1000, 1500))
+    
+    X_train, X_test, y_train, y_test = prepare_data(csv_path, "churn-bigml-20.csv")
+    assert X_train.shape == (3000, 19)
+
+def test_binary_writes_are_atomic_and_allow_empty_datasets(tmp_path, model, monkeypatch):
+    path = str(tmp_path / "synthetic")
+    def interrupted(*args, **kwargs):
+        yield from []
+        raise KeyboardInterrupt
+    with monkeypatch.context() as patch:
+        patch.setattr(model, "iter_chunks", interrupted)
+        with pytest.raises(KeyboardInterrupt):
+            write_binary(path, 100, model=model)
+    assert not (tmp_path / "synthetic").exists()
+
+    empty = read_binary(write_binary(path, 0, model=model))
+    assert len(empty) == 0
+    assert list(empty.columns) == model.columns
+
+def test_cached_dataset_name_includes_chunking(tmp_path, model, monkeypatch):
+    import synthetic_data
+    monkeypatch.setattr(synthetic_data.ChurnDataModel, "fit", classmethod(lambda cls, *args: model))
+    first = ensure_dataset(300, seed=2, directory=str(tmp_path), chunk_rows=100)
+    second = ensure_dataset(300, seed=2, directory=str(tmp_path), chunk_rows=200)
+    assert first != second
+    assert ensure_dataset(300, seed=2, directory=str(tmp_path), chunk_rows=100) == first
+
+def test_model_round_trips_through_dict(model):
+    restored = ChurnDataModel.from_dict(model.to_dict())
+    assert restored.sample(100, np.random.default_rng(3)).equals(model.sample(100, np.random.default_rng(3)))
+
+if __name__ == "__main__":
+    pytest.main([__file__])
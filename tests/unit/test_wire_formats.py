@@ -0,0 +1,58 @@
+import gzip
+import numpy as np
+import pandas as pd
+import pytest
+import wire_formats
+from wire_formats import JSON, MSGPACK, ARROW
+
+@pytest.fixture(scope="module")
+def frame():
+    return pd.read_csv("churn-bigml-20.csv").drop(columns=["Churn"]).head(50)
+
+def test_negotiation():
+    assert wire_formats.negotiate(None) == JSON
+    assert wire_formats.negotiate("*/*") == JSON
+    assert wire_formats.parse_media_type("application/json; charset=utf-8") == JSON
+    with pytest.raises(wire_formats.UnsupportedMediaType):
+        wire_formats.parse_media_type("text/csv")
+    with pytest.raises(wire_formats.NotAcceptable):
+        wire_formats.negotiate("text/html")
+    assert wire_formats.negotiate_encoding("gzip;q=0.5, br") == "gzip"
+    assert wire_formats.negotiate_encoding("identity") is None
+    assert wire_formats.negotiate_encoding("gzip;q=0") is None
+
+@pytest.mark.parametrize("fmt,module", [(JSON, "json"), (MSGPACK, "msgpack"), (ARROW, "pyarrow")])
+def test_features_and_results_round_trip(frame, fmt, module):
+    pytest.importorskip(module)
+    assert wire_formats.negotiate(f"text/html, {fmt};q=0.9") == fmt
+    decoded = wire_formats.load_features(wire_formats.dump_features(frame, fmt), fmt)
+    assert list(decoded.columns) == list(frame.columns)
+    assert (decoded["State"].astype(str) == frame["State"]).all()
+    # Numeric columns travel as float32 outside JSON
+    assert np.allclose(decoded["Total day charge"], frame["Total day charge"], rtol=1e-6)
+
+    prediction = np.array([0, 1, 1])
+    probability = np.array([[0.9, 0.1], [0.3, 0.7], [0.45, 0.55]])
+    results = wire_formats.load_results(wire_formats.dump_results(prediction, probability, fmt, "abc"), fmt)
+    assert results["model_version"] == "abc"
+    assert results["prediction"].tolist() == [0, 1, 1]
+    assert np.allclose(results["churn_probability"], probability[:, 1], rtol=1e-6)
+
+def test_decompress_limits_and_errors():
+    body = b"x" * 5000
+    assert wire_formats.decompress(gzip.compress(body), "gzip", 5000) == body
+    with pytest.raises(ValueError):
+        wire_formats.decompress(gzip.compress(body), "gzip", 4999)
+    with pytest.raises(ValueError):
+        wire_formats.decompress(b"not gzip", "gzip", 5000)
+    with pytest.raises(wire_formats.UnsupportedMediaType):
+        wire_formats.decompress(body, "br", 5000)
+    if "zstd" in wire_formats.available_encodings():
+        assert wire_formats.decompress(wire_formats.compress(body, "zstd"), "zstd", 5000) == body
+
+def test_columns_must_have_equal_lengths():
+    with pytest.raises(ValueError):
+        wire_formats.load_features(b'{"columns": {"a": [1, 2], "b": [1]}}', JSON)
+
+if __name__ == "__main__":
+    pytest.main([__file__])
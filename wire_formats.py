@@ -0,0 +1,300 @@
+import functools
+import gzip
+import importlib
+import importlib.util
+import io
+import json
+import logging
+import time
+import zlib
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+ARROW = "application/vnd.apache.arrow.stream"
+
+FORMAT_NAMES = {JSON: "json", MSGPACK: "msgpack", ARROW: "arrow"}
+
+MEDIA_TYPES = {
+    JSON: JSON,
+    MSGPACK: MSGPACK,
+    "application/x-msgpack": MSGPACK,
+    ARROW: ARROW,
+}
+
+# Batch responses smaller than this are not worth compressing
+COMPRESS_MIN_BYTES = 1024
+
+
+# Codecs are optional and imported on first use so the API's cold start does
+# not pay for them; one that is not installed is simply not offered
+@functools.lru_cache(maxsize=None)
+def _installed(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def _codec(name):
+    return importlib.import_module(name)
+
+
+class UnsupportedMediaType(ValueError):
+    """The request body's Content-Type or Content-Encoding cannot be read."""
+
+
+class NotAcceptable(ValueError):
+    """None of the formats the client accepts can be produced."""
+
+
+def available_formats():
+    return [JSON] + [fmt for fmt, name in ((MSGPACK, "msgpack"), (ARROW, "pyarrow")) if _installed(name)]
+
+
+def available_encodings():
+    return (["zstd"] if _installed("zstandard") else []) + ["gzip"]
+
+
+def _parse_header(value):
+    """Split an Accept-style header into (value, q) pairs, highest preference first."""
+    items = []
+    for position, part in enumerate((value or "").split(",")):
+        name, *params = [p.strip() for p in part.split(";")]
+        if not name:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, number = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        items.append((name.lower(), q, position))
+    return [(name, q) for name, q, _ in sorted(items, key=lambda item: (-item[1], item[2]))]
+
+
+def parse_media_type(content_type):
+    """Format of a request body from its Content-Type (JSON when absent)."""
+    media_type = (content_type or JSON).split(";")[0].strip().lower()
+    fmt = MEDIA_TYPES.get(media_type)
+    if fmt is None or fmt not in available_formats():
+        raise UnsupportedMediaType(f"Unsupported Content-Type: {media_type} "
+                                   f"(supported: {', '.join(available_formats())})")
+    return fmt
+
+
+def negotiate(accept):
+    """Response format for an Accept header; JSON unless the client prefers another."""
+    if not accept:
+        return JSON
+    available = available_formats()
+    for media_type, q in _parse_header(accept):
+        if q <= 0:
+            continue
+        if media_type in ("*/*", "application/*"):
+            return JSON
+        fmt = MEDIA_TYPES.get(media_type)
+        if fmt in available:
+            return fmt
+    raise NotAcceptable(f"Cannot produce any of: {accept} (available: {', '.join(available)})")
+
+
+def negotiate_encoding(accept_encoding):
+    """Best compression the client accepts, or None; zstd wins ties (faster at a similar ratio)."""
+    preferences = dict(_parse_header(accept_encoding))
+    best, best_q = None, 0.0
+    for encoding in available_encodings():
+        q = preferences.get(encoding, preferences.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(body, encoding):
+    if encoding == "zstd":
+        return _codec("zstandard").ZstdCompressor(level=3).compress(body)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    return body
+
+
+def decompress(body, encoding, max_bytes):
+    """Undo a Content-Encoding, refusing to inflate beyond `max_bytes`."""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        stream = io.BytesIO(body)
+    elif encoding == "gzip":
+        stream = gzip.GzipFile(fileobj=io.BytesIO(body))
+    elif encoding == "zstd" and _installed("zstandard"):
+        stream = _codec("zstandard").ZstdDecompressor().stream_reader(io.BytesIO(body))
+    else:
+        raise UnsupportedMediaType(f"Unsupported Content-Encoding: {encoding}")
+    errors = (OSError, EOFError, zlib.error)
+    if encoding == "zstd":
+        errors += (_codec("zstandard").ZstdError,)
+    try:
+        data = stream.read(max_bytes + 1)
+    except errors as e:
+        raise ValueError(f"Invalid {encoding} body: {str(e)}")
+    if len(data) > max_bytes:
+        raise ValueError(f"Request body exceeds {max_bytes} bytes")
+    return data
+
+
+def _arrow():
+    _codec("pyarrow.ipc")
+    return _codec("pyarrow")
+
+
+def _column(values):
+    """A decoded column: raw little-endian float32 bytes, or a list of numbers/strings."""
+    if isinstance(values, (bytes, bytearray)):
+        return np.frombuffer(values, dtype="<f4")
+    return values
+
+
+def load_features(body, fmt):
+    """Decode a batch request body into a raw feature frame (one row per record).
+
+    JSON bodies hold {"records": [...]} or {"columns": {name: [...]}}.
+    MessagePack bodies hold {"columns": {name: values}}, numeric columns
+    preferably as little-endian float32 bytes. Arrow bodies are an IPC
+    stream of record batches.
+    """
+    if fmt == ARROW:
+        return _arrow().ipc.open_stream(body).read_all().to_pandas()
+    payload = json.loads(body) if fmt == JSON else _codec("msgpack").unpackb(body, raw=False)
+    if not isinstance(payload, dict):
+        raise ValueError("Batch body must be an object with 'records' or 'columns'")
+    if "records" in payload:
+        return pd.DataFrame.from_records(payload["records"])
+    columns = {name: _column(values) for name, values in payload.get("columns", {}).items()}
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ValueError(f"Columns have different lengths: {sorted(lengths)}")
+    return pd.DataFrame(columns)
+
+
+def dump_features(df, fmt):
+    """Client-side counterpart of load_features: numeric columns as float32."""
+    if fmt == JSON:
+        return json.dumps({"records": df.to_dict("records")}).encode()
+    if fmt == MSGPACK:
+        columns = {}
+        for name in df.columns:
+            if pd.api.types.is_numeric_dtype(df[name]):
+                columns[name] = df[name].to_numpy(dtype="<f4").tobytes()
+            else:
+                columns[name] = df[name].astype(str).tolist()
+        return _codec("msgpack").packb({"columns": columns}, use_bin_type=True)
+    pa = _arrow()
+    table = pa.Table.from_pandas(df.astype({name: np.float32 for name in df.columns
+                                            if pd.api.types.is_numeric_dtype(df[name])}),
+                                 preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def dump_results(prediction, probability, fmt, model_version=None):
+    """Encode batch scores: predictions as int8, probabilities as float32."""
+    prediction = np.asarray(prediction, dtype=np.int8)
+    churn = np.asarray(probability[:, 1], dtype=np.float32)
+    retention = np.asarray(probability[:, 0], dtype=np.float32)
+    if fmt == JSON:
+        # JSON numbers are text anyway: keep full precision there
+        return json.dumps({"model_version": model_version, "prediction": prediction.tolist(),
+                           "churn_probability": probability[:, 1].tolist(),
+                           "retention_probability": probability[:, 0].tolist()}).encode()
+    if fmt == MSGPACK:
+        return _codec("msgpack").packb({"model_version": model_version, "rows": len(prediction),
+                              "prediction": prediction.tobytes(),
+                              "churn_probability": churn.astype("<f4").tobytes(),
+                              "retention_probability": retention.astype("<f4").tobytes()},
+                             use_bin_type=True)
+    pa = _arrow()
+    table = pa.table({"prediction": prediction, "churn_probability": churn,
+                      "retention_probability": retention},
+                     metadata={"model_version": model_version or ""})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def load_results(body, fmt):
+    """Decode a batch response into {column: array} plus model_version."""
+    if fmt == ARROW:
+        table = _arrow().ipc.open_stream(body).read_all()
+        result = {name: table.column(name).to_numpy() for name in table.column_names}
+        result["model_version"] = (table.schema.metadata or {}).get(b"model_version", b"").decode() or None
+        return result
+    if fmt == JSON:
+        payload = json.loads(body)
+        return {key: value if key == "model_version" else np.asarray(value) for key, value in payload.items()}
+    payload = _codec("msgpack").unpackb(body, raw=False)
+    return {
+        "model_version": payload["model_version"],
+        "prediction": np.frombuffer(payload["prediction"], dtype=np.int8),
+        "churn_probability": np.frombuffer(payload["churn_probability"], dtype="<f4"),
+        "retention_probability": np.frombuffer(payload["retention_probability"], dtype="<f4"),
+    }
+
+
+def benchmark_formats(df, model, encoder, formats=None, encodings=(None, "gzip", "zstd"), repeats=5):
+    """Bytes and CPU per row of each request/response format and compression.
+
+    Times the full server-side path for one batch: decompress, decode,
+    encode features, score, encode results and compress, plus the client
+    cost of building the request. Returns one row per (format, encoding).
+    """
+    from serving import score_frame
+    formats = formats or available_formats()
+    n = len(df)
+    prediction, probability = score_frame(model, encoder.encode_frame(df))
+    score_seconds = min(_timed(lambda: score_frame(model, encoder.encode_frame(df)))
+                        for _ in range(repeats))
+    rows = []
+    for fmt in formats:
+        for encoding in encodings:
+            if encoding is not None and encoding not in available_encodings():
+                continue
+            request = compress(dump_features(df, fmt), encoding)
+            response = compress(dump_results(prediction, probability, fmt), encoding)
+            client = min(_timed(lambda: compress(dump_features(df, fmt), encoding)) for _ in range(repeats))
+            decode = min(_timed(lambda: load_features(decompress(request, encoding, 1 << 30), fmt))
+                         for _ in range(repeats))
+            respond = min(_timed(lambda: compress(dump_results(prediction, probability, fmt), encoding))
+                          for _ in range(repeats))
+            rows.append({
+                "format": FORMAT_NAMES[fmt],
+                "encoding": encoding or "identity",
+                "request_bytes_per_row": len(request) / n,
+                "response_bytes_per_row": len(response) / n,
+                "client_us_per_row": client / n * 1e6,
+                "decode_us_per_row": decode / n * 1e6,
+                "respond_us_per_row": respond / n * 1e6,
+                "score_us_per_row": score_seconds / n * 1e6,
+            })
+    return rows
+
+
+def _timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def format_benchmark_table(rows):
+    header = (f"{'format':<9}{'encoding':<10}{'req B/row':>10}{'resp B/row':>11}"
+              f"{'client us':>11}{'decode us':>11}{'respond us':>11}{'score us':>10}")
+    lines = [header, "-" * len(header)]
+    for row in rows:
+        lines.append(f"{row['format']:<9}{row['encoding']:<10}{row['request_bytes_per_row']:>10.1f}"
+                     f"{row['response_bytes_per_row']:>11.1f}{row['client_us_per_row']:>11.2f}"
+                     f"{row['decode_us_per_row']:>11.2f}{row['respond_us_per_row']:>11.2f}"
+                     f"{row['score_us_per_row']:>10.2f}")
+    return "\n".join(lines)